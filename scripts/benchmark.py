@@ -0,0 +1,905 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import argparse
+import datetime
+import threading
+from pathlib import Path
+
+# Добавляем директорию модулей агента в путь для импорта
+script_path = Path(__file__).resolve()
+project_root = script_path.parent.parent
+sys.path.append(str(project_root / 'src' / 'agent'))
+
+from event_monitor import EventMonitor, SYSMON_CHANNEL
+from event_sources import EventSource, EventRecord
+
+
+class NullHandler:
+    """Обработчик событий, который только считает вызовы"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        if not name.startswith('handle_'):
+            raise AttributeError(name)
+
+        def handle(event_data):
+            self.calls += 1
+
+        return handle
+
+
+class FakePushSource(EventSource):
+    """Источник, отправляющий синтетические события Sysmon с заданной частотой"""
+
+    def __init__(self, rate, duration):
+        self.rate = rate
+        self.duration = duration
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, callback):
+        self.thread = threading.Thread(target=self._push_loop, args=(callback,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5.0)
+
+    def join(self):
+        self.thread.join()
+
+    def _push_loop(self, callback):
+        interval = 1.0 / self.rate
+        deadline = time.perf_counter() + self.duration
+        next_time = time.perf_counter()
+        record_number = 0
+
+        while not self.stop_event.is_set() and time.perf_counter() < deadline:
+            record_number += 1
+            inserts = [''] * 22
+            inserts[4] = 'C:\\Windows\\System32\\svchost.exe'
+            record = EventRecord(record_number, 1, 'Microsoft-Windows-Sysmon', datetime.datetime.now().astimezone(),
+                                 'BENCH', inserts)
+            callback(SYSMON_CHANNEL, record)
+
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def make_config(tmp_dir):
+    return {
+        'features': {'track_processes': True, 'track_services': True, 'track_logins': True},
+        'events': {'checkpoint_file': str(Path(tmp_dir) / 'checkpoints.json')}
+    }
+
+
+def bench_latency(args):
+    import tempfile
+
+    handler = NullHandler()
+    source = FakePushSource(args.rate, args.duration)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        monitor = EventMonitor(make_config(tmp_dir), handler, source=source)
+        monitor.start()
+        source.join()
+        monitor.stop()
+
+    stats = monitor.get_stats()['latency']
+    print(f"Событий доставлено: {handler.calls}")
+    print(f"Задержка p50: {stats['p50_ms']} мс, p99: {stats['p99_ms']} мс, max: {stats['max_ms']} мс")
+
+
+def legacy_dispatch(monitor, log_type, event_id):
+    """Цепочка if/elif в том виде, в котором она была в EventMonitor._process_event"""
+    event_ids = monitor.event_ids
+    features = monitor.config['features']
+
+    if event_id in event_ids['startup'] and features.get('track_services', True):
+        return 'startup'
+    elif event_id in event_ids['login'] and features.get('track_logins', True):
+        if log_type == 'Security':
+            return 'login'
+    elif event_id in event_ids['privileges'] and features.get('track_logins', True):
+        return 'privileges'
+    elif event_id in event_ids['task'] and features.get('track_services', True):
+        return 'task'
+    elif event_id in event_ids['service'] and features.get('track_services', True):
+        return 'service'
+    elif event_id in event_ids['sysmon_process'] and features.get('track_processes', True):
+        return 'sysmon_process'
+    elif event_id in event_ids['sysmon_network'] and features.get('track_processes', True):
+        return 'sysmon_network'
+
+    return None
+
+
+def bench_dispatch(args):
+    import random
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        monitor = EventMonitor(make_config(tmp_dir), NullHandler())
+
+    # Поток событий с преобладанием Sysmon: процессы, сеть, прочие события Sysmon и немного Security
+    population = [(SYSMON_CHANNEL, 3)] * 50 + [(SYSMON_CHANNEL, 1)] * 20 + \
+                 [(SYSMON_CHANNEL, 11)] * 15 + [(SYSMON_CHANNEL, 10)] * 5 + \
+                 [('Security', 4624)] * 5 + [('Security', 4672)] * 5
+    random.seed(42)
+    events = [random.choice(population) for _ in range(args.events)]
+    dispatch = monitor.dispatch
+
+    start = time.perf_counter()
+    for log_type, event_id in events:
+        legacy_dispatch(monitor, log_type, event_id)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in events:
+        dispatch.get(key)
+    table_time = time.perf_counter() - start
+
+    print(f"Событий: {args.events}")
+    print(f"Цепочка if/elif: {legacy_time / args.events * 1e9:.0f} нс/событие")
+    print(f"Таблица диспетчеризации: {table_time / args.events * 1e9:.0f} нс/событие")
+    print(f"Ускорение: {legacy_time / table_time:.1f}x")
+
+
+def bench_patterns(args):
+    import random
+    import string
+    from pattern_matcher import MultiPatternMatcher
+
+    random.seed(42)
+    patterns = [''.join(random.choice(string.ascii_lowercase + '-') for _ in range(random.randint(5, 12)))
+                for _ in range(args.patterns)]
+    command_lines = [
+        'powershell.exe -NoProfile -ExecutionPolicy Bypass -EncodedCommand ' +
+        ''.join(random.choice(string.ascii_letters) for _ in range(120))
+        for _ in range(200)
+    ]
+
+    start = time.perf_counter()
+    matcher = MultiPatternMatcher(patterns)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for command_line in command_lines:
+            lowered = command_line.lower()
+            [pattern for pattern in patterns if pattern in lowered]
+    naive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for command_line in command_lines:
+            matcher.find_all(command_line)
+    matcher_time = time.perf_counter() - start
+
+    total = args.rounds * len(command_lines)
+    print(f"Шаблонов: {args.patterns}, построение автомата: {build_time * 1000:.1f} мс")
+    print(f"Поочередная проверка подстрок: {naive_time / total * 1e6:.1f} мкс/командная строка")
+    print(f"Автомат Ахо-Корасик: {matcher_time / total * 1e6:.1f} мкс/командная строка")
+
+
+def bench_whitelist(args):
+    import os
+    import random
+    import string
+    from whitelist import WhitelistIndex
+
+    random.seed(42)
+
+    def random_path():
+        folder = ''.join(random.choice(string.ascii_lowercase) for _ in range(8))
+        name = ''.join(random.choice(string.ascii_lowercase) for _ in range(10))
+        return f"C:\\Program Files\\{folder}\\{name}.exe"
+
+    entries = [random_path() for _ in range(args.entries)]
+    entries += ['C:\\Tools\\*\\agent.exe', 're:^c:\\\\corp\\\\[a-z]+\\\\updater\\.exe$']
+    lookups = [random.choice(entries[:args.entries]) if i % 2 else random_path() for i in range(args.lookups)]
+
+    start = time.perf_counter()
+    index = WhitelistIndex(entries)
+    build_time = time.perf_counter() - start
+
+    # Прежняя проверка: точное совпадение и перебор имен файлов всего списка
+    legacy_set = set(entries)
+    legacy_lookups = lookups[:max(1, args.lookups // 100)]
+    start = time.perf_counter()
+    for image_path in legacy_lookups:
+        if image_path not in legacy_set:
+            basename = os.path.basename(image_path).lower()
+            basename in (os.path.basename(p).lower() for p in legacy_set)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for image_path in lookups:
+        index.matches(image_path)
+    index_time = time.perf_counter() - start
+
+    print(f"Записей в белом списке: {len(entries)}, построение индекса: {build_time * 1000:.1f} мс")
+    print(f"Перебор списка: {legacy_time / len(legacy_lookups) * 1e6:.1f} мкс/проверка")
+    print(f"Индекс: {index_time / len(lookups) * 1e6:.2f} мкс/проверка")
+
+
+def bench_signatures(args):
+    import os
+    import random
+    import tempfile
+    from signature_scanner import SignatureScanner
+
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, 'bench.sig'), 'w', encoding='utf-8') as f:
+            for index in range(args.signatures):
+                body = ''.join(random.choice('0123456789abcdef') for _ in range(32))
+                f.write(f"Bench.Signature-{index}:{body[:8]}????{body[12:]}\n")
+
+        # Файл без совпадений - худший случай, просматривается целиком
+        sample_path = os.path.join(tmp_dir, 'sample.bin')
+        with open(sample_path, 'wb') as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+
+        size_mb = os.path.getsize(sample_path) / (1024 * 1024)
+        workers_count = args.workers or os.cpu_count() or 2
+
+        for workers in (1, workers_count):
+            scanner = SignatureScanner(tmp_dir, workers=workers, parallel_threshold=16 * 1024 * 1024)
+            # Первый проход прогревает пул процессов и кэш страниц
+            scanner.scan_file(sample_path)
+
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                scanner.scan_file(sample_path)
+            elapsed = (time.perf_counter() - start) / args.rounds
+            scanner.close()
+
+            mode = "последовательно" if workers == 1 else f"{workers} процессов"
+            print(f"Сигнатур: {args.signatures}, файл {size_mb:.0f} МБ, {mode}: {size_mb / elapsed:.1f} МБ/с")
+
+
+def bench_reputation(args):
+    import os
+    import random
+    import socket
+    import tempfile
+    import tracemalloc
+    from ip_reputation import IPReputation
+
+    random.seed(42)
+
+    def random_ipv4():
+        return socket.inet_ntop(socket.AF_INET, random.getrandbits(32).to_bytes(4, 'big'))
+
+    def random_ipv6():
+        return socket.inet_ntop(socket.AF_INET6, random.getrandbits(128).to_bytes(16, 'big'))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, 'bench.netset'), 'w', encoding='utf-8') as f:
+            for index in range(args.entries):
+                if index % 10 == 0:
+                    f.write(f"{random_ipv6()}/{random.randint(32, 128)}\n")
+                elif index % 2:
+                    f.write(f"{random_ipv4()}/{random.randint(16, 32)}\n")
+                else:
+                    f.write(f"{random_ipv4()}\n")
+
+        start = time.perf_counter()
+        reputation = IPReputation(tmp_dir)
+        build_time = time.perf_counter() - start
+
+        # Память таблиц после загрузки, временные структуры к этому моменту освобождены
+        tracemalloc.start()
+        traced = IPReputation(tmp_dir)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del traced
+
+        stats = reputation.get_stats()
+        check_reputation_overlaps(tmp_dir)
+        print(f"Записей: {stats['entries']} (диапазонов IPv4: {stats['ipv4_ranges']}, IPv6: {stats['ipv6_ranges']}), "
+              f"загрузка: {build_time * 1000:.0f} мс")
+        print(f"Память: {memory / stats['entries']:.1f} байт/запись")
+
+        for title, generate in (('IPv4', random_ipv4), ('IPv6', random_ipv6)):
+            lookups = [generate() for _ in range(args.lookups)]
+
+            start = time.perf_counter()
+            for ip in lookups:
+                reputation.lookup(ip)
+            lookup_time = time.perf_counter() - start
+
+            print(f"Проверка адреса {title}: {lookup_time / len(lookups) * 1e9:.0f} нс, "
+                  f"{len(lookups) / lookup_time / 1e6:.2f} млн проверок/с")
+
+
+def check_reputation_overlaps(tmp_dir):
+    """Пересекающиеся сети из нескольких списков: адрес относится к первому по имени файла списку"""
+    import os
+    import random
+    import socket
+    from ip_reputation import IPReputation, parse_network
+
+    rng = random.Random(7)
+    lists_dir = os.path.join(tmp_dir, 'overlaps')
+    os.makedirs(lists_dir)
+
+    # Сети разного размера внутри 10.0.0.0/16, чтобы списки часто пересекались
+    networks = {}
+    for name in ('a-block', 'b-tor', 'c-scanners'):
+        networks[name] = [f"10.0.{rng.randrange(256)}.{rng.randrange(256)}/{rng.randint(20, 32)}" for _ in range(50)]
+        with open(os.path.join(lists_dir, f'{name}.netset'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(networks[name]) + '\n')
+    ranges = [(name, parse_network(network)) for name in sorted(networks) for network in networks[name]]
+
+    reputation = IPReputation(lists_dir)
+    errors = 0
+    for _ in range(20000):
+        value = (10 << 24) | rng.getrandbits(16)
+        ip = socket.inet_ntop(socket.AF_INET, value.to_bytes(4, 'big'))
+        expected = next((name for name, (_, first, last) in ranges if first <= value <= last), None)
+        if reputation.lookup(ip) != expected:
+            errors += 1
+
+    if errors:
+        print(f"ОШИБКА: пересекающиеся списки, неверных ответов {errors} из 20000")
+    else:
+        print("Пересекающиеся списки: все 20000 ответов совпадают с перебором")
+
+
+def bench_rules(args):
+    import random
+    import string
+    import tempfile
+    import yaml
+    from rule_engine import RuleEngine, EventFields
+
+    random.seed(42)
+
+    def word():
+        return ''.join(random.choice(string.ascii_lowercase) for _ in range(random.randint(4, 10)))
+
+    def random_rule(index):
+        # Most rules target process creation, as in real rule sets
+        kind = random.random()
+        if kind < 0.6:
+            event_id, prefix = 1, 'process'
+            fields = ['image', 'command_line', 'parent_image', 'user']
+        elif kind < 0.8:
+            event_id, prefix = 3, 'network'
+            fields = ['image', 'dst_ip', 'dst_port']
+        else:
+            event_id, prefix = random.randint(4, 30), 'process'
+            fields = ['image', 'command_line']
+
+        tests = []
+        for _ in range(random.randint(2, 4)):
+            field = f"{prefix}.{random.choice(fields)}"
+            operator = random.choice(['contains', 'endswith', 'startswith', 'equals', 'regex', 'range'])
+            if operator == 'range' and prefix == 'network':
+                low = random.randint(1, 65000)
+                tests.append({'field': 'network.dst_port', 'range': [low, low + random.randint(1, 500)]})
+            elif operator == 'range':
+                tests.append({'field': 'process.command_line', 'contains': word()})
+            elif operator == 'regex':
+                tests.append({'field': field, 'regex': f"{word()}\\d+"})
+            else:
+                tests.append({'field': field, operator: [word() for _ in range(random.randint(1, 5))]})
+
+        return {
+            'id': f'rule-{index}',
+            'channel': SYSMON_CHANNEL,
+            'event_id': event_id,
+            'condition': {random.choice(['all', 'any']): tests}
+        }
+
+    def random_event():
+        event_id = random.choice([1, 1, 1, 3, 3, 5, 7, 11, 13])
+        return {
+            'log_type': SYSMON_CHANNEL,
+            'event_id': event_id,
+            'process': {
+                'image': f"C:\\Program Files\\{word()}\\{word()}.exe",
+                'command_line': ' '.join(word() for _ in range(8)),
+                'parent_image': f"C:\\Windows\\System32\\{word()}.exe",
+                'user': f"DOMAIN\\{word()}"
+            },
+            'network': {
+                'image': f"C:\\Windows\\{word()}.exe",
+                'dst_ip': f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}",
+                'dst_port': str(random.randint(1, 65535))
+            }
+        }
+
+    events = [random_event() for _ in range(args.events)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(Path(tmp_dir) / 'bench.yml', 'w', encoding='utf-8') as f:
+            yaml.safe_dump([random_rule(index) for index in range(args.rules)], f)
+
+        start = time.perf_counter()
+        engine = RuleEngine(tmp_dir)
+        load_time = time.perf_counter() - start
+
+    rules = engine.ruleset.rules
+
+    # Without the index every rule is checked for its channel and event ID first
+    start = time.perf_counter()
+    for event_data in events:
+        fields = EventFields(event_data, engine.ruleset.matchers)
+        for rule in rules:
+            if rule.channel == event_data['log_type'] and event_data['event_id'] in rule.event_ids:
+                rule.predicate(fields)
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hits = 0
+    for event_data in events:
+        hits += len(engine.evaluate(event_data['log_type'], event_data['event_id'], event_data))
+    indexed_time = time.perf_counter() - start
+
+    stats = engine.get_stats()
+    evaluated = sum(rule['evaluations'] for rule in engine.get_rule_stats())
+
+    print(f"Правил: {stats['rules']}, загрузка и компиляция: {load_time * 1000:.0f} мс")
+    print(f"Событий: {args.events}, правил на событие в среднем: {evaluated / args.events:.1f}, срабатываний: {hits}")
+    print(f"Перебор всех правил: {args.events / linear_time:.0f} соб/с")
+    print(f"Индекс по журналу и коду события: {args.events / indexed_time:.0f} соб/с "
+          f"({indexed_time / args.events * 1e6:.1f} мкс/событие, с учетом статистики правил)")
+    print("Самые затратные правила:")
+    for rule in stats['slowest']:
+        print(f"  {rule['id']}: {rule['avg_us']} мкс, проверок {rule['evaluations']}, срабатываний {rule['hits']}")
+
+
+def bench_sigma(args):
+    import random
+    from rule_engine import Rule, RuleSet, EventFields, FieldMatchers
+    from sigma import convert_sigma
+
+    random.seed(42)
+    binaries = ['powershell', 'pwsh', 'cmd', 'wscript', 'cscript', 'mshta', 'rundll32', 'regsvr32', 'certutil',
+                'bitsadmin', 'wmic', 'schtasks', 'reg', 'net', 'net1', 'whoami', 'msiexec', 'installutil',
+                'msbuild', 'forfiles', 'curl', 'vssadmin', 'bcdedit', 'wevtutil', 'sc', 'taskkill']
+    words = ['-enc', '-nop', 'hidden', 'bypass', 'downloadstring', 'iex', 'frombase64string', '/c', 'urlcache',
+             'javascript:', 'scrobj.dll', 'delete shadows', '/priv', 'add', '/create', 'comsvcs', 'minidump',
+             'lsass', 'clear-log', 'recoveryenabled', 'http://', 'https://', '.ps1', 'appdata', 'temp',
+             'invoke-', 'webclient', 'start-process', '-w 1', 'reflection.assembly']
+
+    def random_sigma(index):
+        detection = {
+            'selection_img': {'Image|endswith': [f"\\{name}.exe" for name in random.sample(binaries, random.randint(1, 3))]},
+            'selection_cli': {'CommandLine|contains': random.sample(words, random.randint(1, 4))}
+        }
+        condition = 'all of selection_*'
+        if random.random() < 0.3:
+            detection['filter'] = {'ParentImage|startswith': 'C:\\Program Files\\'}
+            condition += ' and not filter'
+        return {
+            'title': f'sigma-{index}',
+            'logsource': {'category': 'process_creation', 'product': 'windows'},
+            'detection': dict(detection, condition=condition)
+        }
+
+    def random_event():
+        return {
+            'log_type': SYSMON_CHANNEL,
+            'event_id': 1,
+            'process': {
+                'image': f"C:\\Windows\\System32\\{random.choice(binaries)}.exe",
+                'command_line': ' '.join(random.choice(words + ['-file', 'x.txt', '/s', '/q', 'localhost'])
+                                         for _ in range(random.randint(2, 10))),
+                'parent_image': random.choice(['C:\\Windows\\explorer.exe', 'C:\\Program Files\\Agent\\a.exe']),
+                'user': 'DOMAIN\\user'
+            }
+        }
+
+    documents = [convert_sigma(random_sigma(index)) for index in range(args.rules)]
+    events = [random_event() for _ in range(args.events)]
+
+    def build(matchers):
+        start = time.perf_counter()
+        rules = [Rule.from_dict(document, matchers=matchers) for document in documents]
+        ruleset = RuleSet(rules, matchers=matchers)
+        return ruleset, time.perf_counter() - start
+
+    def run(ruleset):
+        route = ruleset.index[(SYSMON_CHANNEL, 1)]
+        hits = 0
+        start = time.perf_counter()
+        for event_data in events:
+            fields = EventFields(event_data, ruleset.matchers)
+            for rule in route.candidates(fields):
+                if rule.predicate(fields):
+                    hits += 1
+        return hits, time.perf_counter() - start
+
+    separate, separate_build = build(None)
+    shared, shared_build = build(FieldMatchers())
+
+    separate_hits, separate_time = run(separate)
+    shared_hits, shared_time = run(shared)
+
+    print(f"Правил Sigma: {args.rules}, событий: {args.events}, срабатываний: {shared_hits}")
+    if separate_hits != shared_hits:
+        print(f"ОШИБКА: результаты различаются ({separate_hits} и {shared_hits})")
+    print(f"Отдельные проверки в каждом правиле: {separate_time / args.events * 1e6:.1f} мкс/событие "
+          f"(компиляция {separate_build * 1000:.0f} мс)")
+    print(f"Общие проверки по полям ({len(shared.matchers)} уникальных): {shared_time / args.events * 1e6:.1f} "
+          f"мкс/событие (компиляция {shared_build * 1000:.0f} мс)")
+    print(f"Ускорение: {separate_time / shared_time:.1f}x")
+
+
+def bench_proctree(args):
+    import random
+    import tracemalloc
+    from process_tree import ProcessTree
+
+    random.seed(42)
+    images = [f"C:\\Program Files\\App{index}\\app{index}.exe" for index in range(200)]
+    users = [f"DOMAIN\\user{index}" for index in range(50)]
+
+    def guid(number):
+        text = f"{number:032x}"
+        return f"{{{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}}}"
+
+    # Заранее готовим поток событий: большинство процессов запускают несколько
+    # долгоживущих (explorer, services), остальные - один из недавних;
+    # часть процессов завершается вскоре после запуска
+    events = []
+    running = list(range(1, 9))
+    for number in range(9, args.events + 9):
+        parent = random.choice(running[:8] if random.random() < 0.7 else running[-64:])
+        image = random.choice(images)
+        events.append(('add', guid(number), str(number % 65536), image,
+                       f"{image} --task {number} --option value", random.choice(users), guid(parent), parent))
+        running.append(number)
+        if len(running) > 256 and random.random() < 0.8:
+            events.append(('exit', guid(running.pop(random.randrange(8, len(running) - 64)))))
+
+    tree = ProcessTree(max_processes=args.max_processes)
+    start = time.perf_counter()
+    for event in events:
+        if event[0] == 'add':
+            _, process_guid, pid, image, command_line, user, parent_guid, parent_pid = event
+            tree.add(process_guid, pid, image, command_line, user, parent_guid, parent_pid, started=0)
+        else:
+            tree.exit(event[1], 0)
+    elapsed = time.perf_counter() - start
+
+    # Память заполненного дерева: строим его заново под tracemalloc
+    tracemalloc.start()
+    traced = ProcessTree(max_processes=args.max_processes)
+    for event in events:
+        if event[0] == 'add':
+            _, process_guid, pid, image, command_line, user, parent_guid, parent_pid = event
+            traced.add(process_guid, pid, image, command_line, user, parent_guid, parent_pid, started=0)
+        else:
+            traced.exit(event[1], 0)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    stats = tree.get_stats()
+    print(f"Событий: {len(events)}, в дереве: {stats['tracked']} (завершено: {stats['exited']}), "
+          f"вытеснено: {stats['evicted']}")
+    print(f"Обработка: {len(events) / elapsed:.0f} событий/с")
+    print(f"Память: {memory / stats['tracked']:.0f} байт/процесс, {memory / 1024 / 1024:.1f} МБ всего")
+
+    nodes = list(tree.nodes.values())
+    sample = [random.choice(nodes) for _ in range(100000)]
+    depth = 0
+    start = time.perf_counter()
+    for node in sample:
+        depth += len(tree.ancestors(node))
+    lookup_time = time.perf_counter() - start
+    print(f"Цепочка предков: {lookup_time / len(sample) * 1e9:.0f} нс, средняя глубина {depth / len(sample):.1f}")
+
+
+def bench_correlation(args):
+    import json
+    import random
+    import tracemalloc
+    from correlator import Correlator, Sequence
+
+    random.seed(42)
+    with open(project_root / 'config.json', 'r', encoding='utf-8') as f:
+        sequences = [Sequence.from_dict(data) for data in json.load(f)['correlation']['sequences']]
+
+    # Поток событий с нескольких компьютеров: запуски процессов (часть - из
+    # временного каталога), создание ими файлов и изредка установка службы
+    # из созданного файла. Соседние события слегка перемешаны, как при
+    # чтении разных журналов с разной скоростью.
+    events = []
+    expected = 0
+    timestamp = 1700000000.0
+    for number in range(args.events):
+        timestamp += random.expovariate(args.rate)
+        host = f"PC{random.randrange(args.hosts)}"
+        guid = f"{{{number:08x}-0000-0000-0000-000000000000}}"
+        from_temp = random.random() < 0.1
+        folder = 'C:\\Users\\user\\AppData\\Local\\Temp' if from_temp else 'C:\\Program Files\\App'
+        image = f"{folder}\\tool{number % 500}.exe"
+        events.append((SYSMON_CHANNEL, 1, {'process': {'process_guid': guid, 'image': image}},
+                       timestamp, host))
+
+        if random.random() < 0.3:
+            target = f"C:\\Windows\\drop{number}.exe"
+            events.append((SYSMON_CHANNEL, 11, {'file': {'process_guid': guid, 'target_filename': target}},
+                           timestamp + random.uniform(0, 5), host))
+            if random.random() < 0.05:
+                events.append(('System', 7045, {'service': {'name': f"svc{number}", 'binary': target}},
+                               timestamp + random.uniform(5, 30), host))
+                expected += from_temp
+
+    events.sort(key=lambda event: event[3] + random.uniform(-2, 2))
+
+    incidents = []
+    correlator = Correlator(sequences, lambda sequence, host, trail: incidents.append(sequence.id),
+                            lateness=10, max_runs=args.max_runs)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    peak_runs = 0
+    for channel, event_id, data, event_time, host in events:
+        data['timestamp'] = event_time
+        data['computer'] = host
+        correlator.process(channel, event_id, data)
+        peak_runs = max(peak_runs, correlator.runs)
+    correlator.flush()
+    elapsed = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = correlator.get_stats()
+    print(f"Событий: {len(events)}, обработка: {len(events) / elapsed:.0f} событий/с")
+    print(f"Незавершенных цепочек: максимум {peak_runs}, в конце {stats['runs']}, истекло {stats['expired']}, "
+          f"вытеснено {stats['evicted']}, опоздавших событий {stats['late']}")
+    print(f"Инцидентов: {len(incidents)} (ожидалось {expected}), пик памяти {peak_memory / 1024 / 1024:.1f} МБ")
+
+
+def bench_logons(args):
+    import random
+    import tracemalloc
+    from logon_failures import FailedLogonTracker
+
+    random.seed(42)
+
+    # Фон из редких ошибок входа с множества адресов и несколько атак подбора пароля
+    events = []
+    timestamp = 1700000000.0
+    attackers = [f"203.0.113.{index}" for index in range(args.attackers)]
+    for index in range(args.events):
+        timestamp += 0.01
+        if random.random() < 0.1:
+            events.append((f"user{random.randrange(50)}", random.choice(attackers), timestamp))
+        else:
+            address = f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}"
+            events.append((f"user{random.randrange(100000)}", address, timestamp))
+
+    tracker = FailedLogonTracker(max_keys=args.max_keys)
+    start = time.perf_counter()
+    bursts = 0
+    for username, address, event_time in events:
+        bursts += len(tracker.record(username, address, event_time))
+    elapsed = time.perf_counter() - start
+
+    # Память заполненных счетчиков: повторяем под tracemalloc
+    tracemalloc.start()
+    traced = FailedLogonTracker(max_keys=args.max_keys)
+    for username, address, event_time in events:
+        traced.record(username, address, event_time)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    stats = tracker.get_stats()
+    print(f"Событий: {len(events)}, обработка: {len(events) / elapsed:.0f} событий/с "
+          f"({elapsed / len(events) * 1e6:.2f} мкс/событие)")
+    print(f"Ключей: пользователей {stats['users']}, адресов {stats['ips']}, вытеснено {stats['evicted']}, "
+          f"память {memory / 1024 / 1024:.1f} МБ")
+    top = tracker.get_top(limit=3)
+    print(f"Атак: {bursts}, больше всего ошибок: {', '.join(f'{key} ({count})' for key, count in top['ip'])}")
+
+
+def bench_heavyhitters(args):
+    import random
+    import tracemalloc
+    from collections import Counter
+    from heavy_hitters import SpaceSaving
+
+    random.seed(42)
+
+    # Распределение Ципфа: немногие ключи встречаются часто, остальные - единицы раз
+    weights = [1 / (rank + 1) ** args.skew for rank in range(args.keys)]
+    keys = [f"C:\\Program Files\\App{rank}\\app{rank}.exe" for rank in range(args.keys)]
+    stream = random.choices(keys, weights=weights, k=args.events)
+
+    sketch = SpaceSaving(args.capacity)
+    start = time.perf_counter()
+    for key in stream:
+        sketch.add(key)
+    elapsed = time.perf_counter() - start
+
+    # Память: заполненный скетч против точного словаря всех ключей
+    tracemalloc.start()
+    traced = SpaceSaving(args.capacity)
+    for key in stream:
+        traced.add(key)
+    sketch_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    tracemalloc.start()
+    exact = Counter(stream)
+    exact_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    top = sketch.top(args.top)
+    expected = [key for key, _ in exact.most_common(args.top)]
+    found = len(set(key for key, _, _ in top) & set(expected))
+    max_error = max(count - exact[key] for key, count, _ in top)
+
+    print(f"Событий: {len(stream)}, различных ключей: {len(exact)}, обработка: {len(stream) / elapsed:.0f} событий/с "
+          f"({elapsed / len(stream) * 1e6:.2f} мкс/событие)")
+    print(f"Память: скетч на {args.capacity} ключей {sketch_memory / 1024:.0f} КБ, "
+          f"точный подсчет {exact_memory / 1024:.0f} КБ")
+    print(f"Точность топ-{args.top}: совпало {found} из {len(expected)}, "
+          f"наибольшая переоценка {max_error} (граница {len(stream) // args.capacity})")
+
+
+def bench_baseline(args):
+    import random
+    import tempfile
+    import tracemalloc
+    from login_baseline import LoginBaselines
+
+    random.seed(42)
+
+    # У каждого пользователя свой рабочий день и свои компьютеры; часть входов подменена необычными
+    routines = []
+    for index in range(args.users):
+        start_hour = random.randrange(6, 12)
+        routines.append((f"user{index}", start_hour, [f"pc{random.randrange(5000)}" for _ in range(2)]))
+
+    events = []
+    start = 1767600000.0  # понедельник
+    for day in range(args.days):
+        for username, start_hour, hosts in routines:
+            if day % 7 >= 5 and random.random() < 0.9:
+                continue
+            for _ in range(random.randint(1, 3)):
+                if random.random() < args.anomalies:
+                    hour = random.choice([0, 1, 2, 3, 4, 22, 23])
+                    events.append((username, '10', f"203.0.113.{random.randrange(256)}",
+                                   start + day * 86400 + hour * 3600, True))
+                else:
+                    hour = start_hour + random.randrange(9)
+                    events.append((username, random.choice(['2', '7', '7']), random.choice(hosts),
+                                   start + day * 86400 + hour * 3600 + random.randrange(3600), False))
+    events.sort(key=lambda event: event[3])
+
+    def run():
+        path = tempfile.mktemp(suffix='.json')
+        return LoginBaselines(path, max_users=args.users)
+
+    baselines = run()
+    counts = {(True, True): 0, (True, False): 0, (False, True): 0, (False, False): 0}
+    began = time.perf_counter()
+    for username, login_type, host, timestamp, injected in events:
+        result = baselines.score(username, login_type, host, timestamp)
+        if not result['learning']:
+            counts[(injected, result['anomalous'])] += 1
+    elapsed = time.perf_counter() - began
+
+    # Память профилей: повторяем под tracemalloc
+    tracemalloc.start()
+    traced = run()
+    for username, login_type, host, timestamp, _ in events:
+        traced.score(username, login_type, host, timestamp)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    normal = counts[(False, True)] + counts[(False, False)]
+    injected = counts[(True, True)] + counts[(True, False)]
+    print(f"Входов: {len(events)}, оценка: {len(events) / elapsed:.0f} входов/с "
+          f"({elapsed / len(events) * 1e6:.2f} мкс/вход)")
+    print(f"Профилей: {args.users}, память {memory / 1024 / 1024:.1f} МБ ({memory / args.users:.0f} байт на пользователя)")
+    print(f"Обнаружено необычных входов: {counts[(True, True)]} из {injected}, "
+          f"ложных срабатываний: {counts[(False, True)]} из {normal} ({counts[(False, True)] / max(1, normal):.2%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки Windows Monitor Agent')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    latency_parser = subparsers.add_parser('latency', help='Задержка доставки событий от источника до обработчика')
+    latency_parser.add_argument('--rate', type=int, default=2000, help='Событий в секунду')
+    latency_parser.add_argument('--duration', type=float, default=5.0, help='Длительность в секундах')
+    latency_parser.set_defaults(func=bench_latency)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help='Стоимость выбора обработчика для одного события')
+    dispatch_parser.add_argument('--events', type=int, default=1000000, help='Количество событий')
+    dispatch_parser.set_defaults(func=bench_dispatch)
+
+    patterns_parser = subparsers.add_parser('patterns', help='Поиск подозрительных шаблонов в командной строке')
+    patterns_parser.add_argument('--patterns', type=int, default=5000, help='Количество шаблонов')
+    patterns_parser.add_argument('--rounds', type=int, default=20, help='Количество проходов')
+    patterns_parser.set_defaults(func=bench_patterns)
+
+    whitelist_parser = subparsers.add_parser('whitelist', help='Проверка процесса по белому списку')
+    whitelist_parser.add_argument('--entries', type=int, default=50000, help='Размер белого списка')
+    whitelist_parser.add_argument('--lookups', type=int, default=100000, help='Количество проверок')
+    whitelist_parser.set_defaults(func=bench_whitelist)
+
+    signatures_parser = subparsers.add_parser('signatures', help='Скорость проверки файла по локальной базе сигнатур')
+    signatures_parser.add_argument('--signatures', type=int, default=1000, help='Количество сигнатур')
+    signatures_parser.add_argument('--size', type=int, default=128, help='Размер файла в МБ')
+    signatures_parser.add_argument('--workers', type=int, help='Количество процессов (по умолчанию - число ядер)')
+    signatures_parser.add_argument('--rounds', type=int, default=3, help='Количество проходов')
+    signatures_parser.set_defaults(func=bench_signatures)
+
+    reputation_parser = subparsers.add_parser('reputation', help='Проверка адресов по спискам IP-репутации')
+    reputation_parser.add_argument('--entries', type=int, default=500000, help='Количество адресов и сетей в списках')
+    reputation_parser.add_argument('--lookups', type=int, default=1000000, help='Количество проверок')
+    reputation_parser.set_defaults(func=bench_reputation)
+
+    rules_parser = subparsers.add_parser('rules', help='Проверка событий правилами обнаружения')
+    rules_parser.add_argument('--rules', type=int, default=1000, help='Количество правил')
+    rules_parser.add_argument('--events', type=int, default=20000, help='Количество событий')
+    rules_parser.set_defaults(func=bench_rules)
+
+    sigma_parser = subparsers.add_parser('sigma', help='Правила Sigma с общими проверками полей')
+    sigma_parser.add_argument('--rules', type=int, default=500, help='Количество правил')
+    sigma_parser.add_argument('--events', type=int, default=5000, help='Количество событий')
+    sigma_parser.set_defaults(func=bench_sigma)
+
+    proctree_parser = subparsers.add_parser('proctree', help='Дерево процессов: скорость и память')
+    proctree_parser.add_argument('--events', type=int, default=1000000, help='Количество запусков процессов')
+    proctree_parser.add_argument('--max-processes', type=int, default=100000, help='Предел размера дерева')
+    proctree_parser.set_defaults(func=bench_proctree)
+
+    correlation_parser = subparsers.add_parser('correlation', help='Корреляция событий в инциденты')
+    correlation_parser.add_argument('--events', type=int, default=200000, help='Количество запусков процессов')
+    correlation_parser.add_argument('--rate', type=float, default=200, help='Запусков процессов в секунду')
+    correlation_parser.add_argument('--hosts', type=int, default=20, help='Количество компьютеров')
+    correlation_parser.add_argument('--max-runs', type=int, default=10000, help='Предел незавершенных цепочек')
+    correlation_parser.set_defaults(func=bench_correlation)
+
+    logons_parser = subparsers.add_parser('logons', help='Счетчики неудачных входов по пользователям и адресам')
+    logons_parser.add_argument('--events', type=int, default=1000000, help='Количество неудачных входов')
+    logons_parser.add_argument('--attackers', type=int, default=5, help='Количество атакующих адресов')
+    logons_parser.add_argument('--max-keys', type=int, default=10000, help='Предел ключей каждого вида')
+    logons_parser.set_defaults(func=bench_logons)
+
+    heavyhitters_parser = subparsers.add_parser('heavyhitters', help='Самые частые ключи потока в фиксированной памяти')
+    heavyhitters_parser.add_argument('--events', type=int, default=1000000, help='Количество событий')
+    heavyhitters_parser.add_argument('--keys', type=int, default=200000, help='Количество различных ключей')
+    heavyhitters_parser.add_argument('--skew', type=float, default=1.1, help='Показатель распределения Ципфа')
+    heavyhitters_parser.add_argument('--capacity', type=int, default=1000, help='Емкость скетча')
+    heavyhitters_parser.add_argument('--top', type=int, default=10, help='Размер топа')
+    heavyhitters_parser.set_defaults(func=bench_heavyhitters)
+
+    baseline_parser = subparsers.add_parser('baseline', help='Профили входов пользователей и оценка необычных входов')
+    baseline_parser.add_argument('--users', type=int, default=2000, help='Количество пользователей')
+    baseline_parser.add_argument('--days', type=int, default=60, help='Количество дней')
+    baseline_parser.add_argument('--anomalies', type=float, default=0.01, help='Доля необычных входов')
+    baseline_parser.set_defaults(func=bench_baseline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import random
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from collections import namedtuple
+
+# Добавляем директорию модулей агента в путь для импорта
+script_path = Path(__file__).resolve()
+project_root = script_path.parent.parent
+sys.path.append(str(project_root / 'src' / 'agent'))
+
+from event_reader import CheckpointStore, EventLogReader
+
+CHANNEL = 'Security'
+
+FakeRecord = namedtuple('FakeRecord', 'RecordNumber')
+
+
+class Crash(Exception):
+    """Остановка агента посреди пакета"""
+
+
+class FakeEvtlog:
+    """
+    Журнал событий в памяти с интерфейсом win32evtlog. Записи читаются
+    пакетами по batch_size, чтение с позиции может вернуть seek_overlap уже
+    прочитанных записей.
+    """
+
+    EVENTLOG_SEQUENTIAL_READ = 0x0001
+    EVENTLOG_SEEK_READ = 0x0002
+    EVENTLOG_FORWARDS_READ = 0x0004
+
+    def __init__(self, batch_size=64, seek_overlap=0):
+        self.batch_size = batch_size
+        self.seek_overlap = seek_overlap
+        self.oldest = 1
+        self.newest = 0
+        self.positions = {}
+        self.handles = 0
+
+    def write(self, count):
+        self.newest += count
+
+    def clear(self):
+        # Номера записей начинаются заново
+        self.oldest = 1
+        self.newest = 0
+
+    def overwrite(self, count):
+        # Самые старые записи вытесняются новыми
+        self.oldest = min(self.oldest + count, self.newest + 1)
+
+    def OpenEventLog(self, server, log_type):
+        self.handles += 1
+        self.positions[self.handles] = self.oldest
+        return self.handles
+
+    def CloseEventLog(self, handle):
+        del self.positions[handle]
+
+    def GetOldestEventLogRecord(self, handle):
+        return self.oldest
+
+    def GetNumberOfEventLogRecords(self, handle):
+        return self.newest - self.oldest + 1
+
+    def ReadEventLog(self, handle, flags, offset):
+        if flags & self.EVENTLOG_SEEK_READ:
+            start = max(self.oldest, offset - self.seek_overlap)
+        else:
+            start = max(self.oldest, self.positions[handle])
+        end = min(self.newest, start + self.batch_size - 1)
+        self.positions[handle] = end + 1
+        return [FakeRecord(number) for number in range(start, end + 1)]
+
+
+class Reading:
+    """Чтение журнала новым экземпляром агента: хранилище позиций загружается из файла"""
+
+    def __init__(self, evtlog, path):
+        self.checkpoints = CheckpointStore(path)
+        self.reader = EventLogReader(CHANNEL, self.checkpoints, evtlog=evtlog)
+        self.delivered = []
+
+    def drain(self, callback=None):
+        def deliver(event):
+            if callback:
+                callback(event.RecordNumber)
+            self.delivered.append(event.RecordNumber)
+
+        try:
+            return self.reader.drain(deliver)
+        finally:
+            self.reader.close()
+
+
+class Checks:
+    def __init__(self, seed, rounds):
+        self.rng = random.Random(seed)
+        self.rounds = rounds
+        self.failures = 0
+        self.logger = logging.getLogger('CheckReader')
+
+    def expect(self, name, condition, details=''):
+        if condition:
+            self.logger.info(f"{name}: ок")
+        else:
+            self.failures += 1
+            self.logger.error(f"{name}: ошибка {details}")
+
+    def check_in_order(self, name, delivered, expected):
+        self.expect(name, delivered == expected,
+                    f"(получено {len(delivered)} записей, ожидалось {len(expected)}, "
+                    f"первая {delivered[:1]}, последняя {delivered[-1:]})")
+
+    def backlog(self, tmp_dir):
+        """Большое отставание читается полностью, по одному разу и по порядку"""
+        for seek_overlap in (0, 5):
+            path = Path(tmp_dir) / f'backlog-{seek_overlap}.json'
+            evtlog = FakeEvtlog(batch_size=64, seek_overlap=seek_overlap)
+            evtlog.write(100)
+            Reading(evtlog, path).drain()
+
+            evtlog.write(10000)
+            reading = Reading(evtlog, path)
+            reading.drain()
+            self.check_in_order(f"отставание 10000 записей (повтор при позиционировании {seek_overlap})",
+                                reading.delivered, list(range(101, 10101)))
+
+            evtlog.write(10)
+            reading.drain()
+            self.check_in_order(f"новые записи после отставания (повтор при позиционировании {seek_overlap})",
+                                reading.delivered[10000:], list(range(10101, 10111)))
+
+    def first_run(self, tmp_dir):
+        """При первом запуске история не читается"""
+        path = Path(tmp_dir) / 'first.json'
+        evtlog = FakeEvtlog()
+        evtlog.write(1000)
+        reading = Reading(evtlog, path)
+        reading.drain()
+        self.expect("первый запуск не читает историю", not reading.delivered)
+
+        evtlog.write(10)
+        reading = Reading(evtlog, path)
+        reading.drain()
+        self.check_in_order("записи после первого запуска", reading.delivered, list(range(1001, 1011)))
+
+    def stop(self, tmp_dir):
+        """Остановка посреди пакета: очередь обрабатывается, ни одна запись не теряется и не повторяется"""
+        for number in range(self.rounds):
+            path = Path(tmp_dir) / f'stop-{number}.json'
+            evtlog = FakeEvtlog(batch_size=self.rng.randint(1, 100))
+            evtlog.write(1)
+            Reading(evtlog, path).drain()
+            evtlog.write(1000)
+
+            reading = Reading(evtlog, path)
+            checkpoints = reading.checkpoints
+            crash_at = self.rng.randint(2, 1000)
+            queue = []
+
+            def enqueue(record_number):
+                if record_number == crash_at:
+                    raise Crash()
+                checkpoints.acquire(CHANNEL, record_number)
+                queue.append(record_number)
+
+            try:
+                reading.drain(enqueue)
+            except Crash:
+                pass
+
+            # Как EventMonitor.stop: очередь обрабатывается до конца, затем сохраняются позиции
+            self.rng.shuffle(queue)
+            for record_number in queue:
+                checkpoints.release(CHANNEL, record_number)
+            checkpoints.save()
+
+            restart = Reading(evtlog, path)
+            restart.drain()
+            self.check_in_order(f"остановка на записи {crash_at} (пакет {evtlog.batch_size})",
+                                reading.delivered + restart.delivered, list(range(2, 1002)))
+
+    def kill(self, tmp_dir):
+        """
+        Аварийное завершение посреди пакета при обработке не по порядку:
+        необработанные записи читаются заново, обработанные до первой
+        необработанной - нет
+        """
+        for number in range(self.rounds):
+            path = Path(tmp_dir) / f'kill-{number}.json'
+            evtlog = FakeEvtlog(batch_size=self.rng.randint(1, 100), seek_overlap=self.rng.choice((0, 3)))
+            evtlog.write(1)
+            Reading(evtlog, path).drain()
+            evtlog.write(1000)
+
+            reading = Reading(evtlog, path)
+            checkpoints = reading.checkpoints
+            crash_at = self.rng.randint(2, 1001)
+            queue = []
+            saved = {}
+
+            def enqueue(record_number):
+                if record_number == crash_at:
+                    # Файл остается таким, каким был сохранен к моменту сбоя
+                    saved['data'] = path.read_bytes()
+                    raise Crash()
+                checkpoints.acquire(CHANNEL, record_number)
+                queue.append(record_number)
+                # Обработчики завершают записи в произвольном порядке
+                while queue and self.rng.random() < 0.5:
+                    checkpoints.release(CHANNEL, queue.pop(self.rng.randrange(len(queue))))
+
+            try:
+                reading.drain(enqueue)
+            except Crash:
+                pass
+            path.write_bytes(saved['data'])
+
+            handled = set(range(2, crash_at)) - set(queue)
+            unhandled = sorted(set(range(2, 1002)) - handled)
+
+            restart = Reading(evtlog, path)
+            restart.drain()
+            delivered = restart.delivered
+            name = f"сбой на записи {crash_at} (пакет {evtlog.batch_size}, в обработке {len(queue)})"
+            self.check_in_order(name, delivered, list(range(delivered[0] if delivered else 1002, 1002)))
+            self.expect(f"{name}: необработанные записи прочитаны заново", set(unhandled) <= set(delivered))
+
+            # Сохраненная позиция не заходит за первую необработанную запись, чтение продолжается сразу за ней
+            checkpoint = json.loads(saved['data'])[CHANNEL]
+            self.expect(f"{name}: позиция {checkpoint} до первой необработанной записи",
+                        checkpoint < unhandled[0] and (not delivered or delivered[0] == checkpoint + 1))
+
+    def cleared(self, tmp_dir):
+        """После очистки журнала чтение начинается с первой записи"""
+        path = Path(tmp_dir) / 'cleared.json'
+        evtlog = FakeEvtlog(batch_size=50)
+        evtlog.write(1)
+        Reading(evtlog, path).drain()
+        evtlog.write(500)
+        Reading(evtlog, path).drain()
+
+        evtlog.clear()
+        evtlog.write(200)
+        reading = Reading(evtlog, path)
+        reading.drain()
+        self.check_in_order("очищенный журнал", reading.delivered, list(range(1, 201)))
+
+    def wrapped(self, tmp_dir):
+        """После перезаписи журнала чтение продолжается с самой старой сохранившейся записи"""
+        path = Path(tmp_dir) / 'wrapped.json'
+        evtlog = FakeEvtlog(batch_size=50)
+        evtlog.write(1)
+        Reading(evtlog, path).drain()
+        evtlog.write(500)
+        Reading(evtlog, path).drain()
+
+        evtlog.write(1000)
+        evtlog.overwrite(799)
+        reading = Reading(evtlog, path)
+        reading.drain()
+        self.check_in_order("перезаписанный журнал", reading.delivered, list(range(800, 1502)))
+
+    def run(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for check in (self.backlog, self.first_run, self.stop, self.kill, self.cleared, self.wrapped):
+                check(tmp_dir)
+        return self.failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка чтения журналов по позициям без потерь и повторов')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора случайных чисел')
+    parser.add_argument('--rounds', type=int, default=20, help='Количество прогонов со сбоями')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    failures = Checks(args.seed, args.rounds).run()
+    logging.getLogger('CheckReader').info(f"Ошибок: {failures}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import datetime
+import logging
+import tempfile
+from pathlib import Path
+
+import yaml
+
+# Добавляем директорию модулей агента в путь для импорта
+script_path = Path(__file__).resolve()
+project_root = script_path.parent.parent
+sys.path.append(str(project_root / 'src' / 'agent'))
+
+from event_monitor import EventMonitor, SYSMON_CHANNEL
+from event_sources import EventRecord
+from rule_engine import RuleEngine, RULE_PATTERNS
+
+# Источники событий для примеров по журналу
+SOURCE_NAMES = {
+    SYSMON_CHANNEL: 'Microsoft-Windows-Sysmon',
+    'Security': 'Microsoft-Windows-Security-Auditing',
+    'System': 'Service Control Manager'
+}
+
+
+class ExampleHandler:
+    """Обработчик, который только запоминает сработавшие правила"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.matches = {}
+
+    def handle_rules(self, event_data):
+        matched = self.rules.evaluate(event_data['log_type'], event_data['event_id'], event_data)
+        self.matches[event_data['computer']] = {rule.id for rule in matched}
+
+    def __getattr__(self, name):
+        # Встроенные обработчики только разбирают поля события
+        if name.startswith('handle_'):
+            return lambda *args: None
+        raise AttributeError(name)
+
+
+def load_examples(path):
+    """(правило, номер примера, журнал, код события, строки, ожидается ли срабатывание)"""
+    files = set()
+    for pattern in RULE_PATTERNS:
+        files.update(Path(path).rglob(pattern))
+
+    examples = []
+    for file in sorted(files):
+        with open(file, 'r', encoding='utf-8') as f:
+            documents = [document for document in yaml.safe_load_all(f) if document]
+        for rule in (data for document in documents for data in (document if isinstance(document, list) else [document])):
+            if not isinstance(rule, dict):
+                continue
+            event_ids = rule.get('event_id')
+            event_id = int(event_ids[0] if isinstance(event_ids, list) else event_ids or 0)
+            for index, example in enumerate(rule.get('examples') or [], 1):
+                examples.append((rule.get('id'), index, rule.get('channel'), event_id,
+                                 [str(value) for value in example.get('inserts', [])], bool(example.get('match', True))))
+    return examples
+
+
+def check(path):
+    """Прогоняет примеры событий через разбор полей агента и правила, возвращает число ошибок"""
+    logger = logging.getLogger('CheckRules')
+    rules = RuleEngine(path)
+    handler = ExampleHandler(rules)
+    examples = load_examples(path)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = {'events': {'checkpoint_file': str(Path(tmp_dir) / 'checkpoints.json')}}
+        monitor = EventMonitor(config, handler, source=object())
+        monitor.queue.start()
+        for number, (_, _, channel, event_id, inserts, _) in enumerate(examples):
+            record = EventRecord(number + 1, event_id, SOURCE_NAMES.get(channel, ''),
+                                 datetime.datetime.now().astimezone(), f"example-{number}", inserts)
+            monitor._process_event(channel, record)
+        monitor.queue.stop()
+
+    failures = 0
+    for number, (rule_id, index, channel, event_id, _, expected) in enumerate(examples):
+        matched = rule_id in handler.matches.get(f"example-{number}", set())
+        if matched == expected:
+            logger.info(f"{rule_id}, пример {index}: {'срабатывает' if matched else 'не срабатывает'}, как ожидалось")
+        else:
+            failures += 1
+            logger.error(f"{rule_id}, пример {index}: ожидалось {'срабатывание' if expected else 'отсутствие срабатывания'}")
+
+    logger.info(f"Проверено примеров: {len(examples)}, ошибок: {failures}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка правил обнаружения на примерах событий')
+    parser.add_argument('--rules', default=str(project_root / 'rules'), help='Каталог с правилами')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if check(args.rules):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -334,7 +334,6 @@ def check_dependencies():
         'pyyaml',
         'schedule',
         'requests',
-        'pyclamd',
         'fpdf2',
         'psutil',
         'python-dotenv',
@@ -118,6 +118,32 @@ def export_windows_events(output_dir, event_logs=None, days=7):
     
     return output_dir
 
+def load_event_day(events_dir, day_stem):
+    """Загрузка событий за день из сжатого JSON-файла и/или журнала JSONL"""
+    event_data = {}
+    
+    json_file = events_dir / f"{day_stem}.json"
+    if json_file.exists():
+        with open(json_file, 'r', encoding='utf-8') as f:
+            for category, events in json.load(f).items():
+                event_data.setdefault(category, []).extend(events)
+    
+    jsonl_file = events_dir / f"{day_stem}.jsonl"
+    if jsonl_file.exists():
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Последняя строка может быть недописана
+                    continue
+                event_data.setdefault(entry['category'], []).append(entry['event'])
+    
+    return event_data
+
 def export_agent_logs(output_dir, agent_log_dir=None, agent_data_dir=None):
     """Экспорт логов агента и данных о событиях в указанный каталог"""
     logger = logging.getLogger('ExportLogs')
@@ -157,21 +183,25 @@ def export_agent_logs(output_dir, agent_log_dir=None, agent_data_dir=None):
             
             logger.info(f"Копирование данных о событиях из {events_dir}")
             
-            event_files = list(events_dir.glob("*.json"))
+            # Дни могут храниться как в сжатом JSON, так и в журнале JSONL (текущий день)
+            event_files = list(events_dir.glob("*.json")) + list(events_dir.glob("*.jsonl"))
+            day_stems = sorted(set(event_file.stem for event_file in event_files))
             
             for event_file in event_files:
                 try:
-                    # Копируем JSON-файл
                     shutil.copy(event_file, events_output)
+                except Exception as e:
+                    logger.error(f"Ошибка при копировании файла {event_file.name}: {str(e)}")
+            
+            for day_stem in day_stems:
+                try:
+                    # Текстовое представление для удобства просмотра
+                    txt_file = events_output / f"{day_stem}.txt"
                     
-                    # Также создаем текстовое представление для удобства просмотра
-                    txt_file = events_output / f"{event_file.stem}.txt"
-                    
-                    with open(event_file, 'r', encoding='utf-8') as f_in:
-                        event_data = json.load(f_in)
+                    event_data = load_event_day(events_dir, day_stem)
                     
                     with open(txt_file, 'w', encoding='utf-8') as f_out:
-                        f_out.write(f"# События за {event_file.stem}\n")
+                        f_out.write(f"# События за {day_stem}\n")
                         f_out.write("# ==========================================\n\n")
                         
                         # Запуски системы
@@ -199,10 +229,10 @@ def export_agent_logs(output_dir, agent_log_dir=None, agent_data_dir=None):
                             f_out.write(f"Причина: {event.get('reason', 'Н/Д')}\n")
                             f_out.write("-" * 50 + "\n")
                     
-                    logger.info(f"Обработан файл событий: {event_file.name}")
+                    logger.info(f"Обработаны события: {day_stem}")
                     
                 except Exception as e:
-                    logger.error(f"Ошибка при обработке файла {event_file.name}: {str(e)}")
+                    logger.error(f"Ошибка при обработке событий {day_stem}: {str(e)}")
         else:
             logger.warning(f"Директория с данными о событиях не найдена: {events_dir}")
     
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+# Добавляем директорию модулей агента в путь для импорта
+script_path = Path(__file__).resolve()
+project_root = script_path.parent.parent
+sys.path.append(str(project_root / 'src' / 'agent'))
+
+from event_store import JournalStore, SQLiteEventStore
+
+def setup_logging():
+    logger = logging.getLogger('MigrateEvents')
+    logger.setLevel(logging.INFO)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(formatter)
+
+    logger.addHandler(console_handler)
+
+    return logger
+
+def migrate(events_dir, db_path, force=False):
+    """Импорт файлов data/events/*.json и *.jsonl в базу SQLite"""
+    logger = logging.getLogger('MigrateEvents')
+
+    events_dir = Path(events_dir)
+    if not events_dir.exists():
+        logger.error(f"Директория с данными о событиях не найдена: {events_dir}")
+        return False
+
+    # Читаем файлы без фонового сброса буфера - хранилище используется только для чтения
+    source = JournalStore(events_dir, flush_interval=0)
+    target = SQLiteEventStore(db_path, flush_interval=0)
+
+    dates = sorted(set(
+        path.stem[len('events_'):]
+        for path in list(events_dir.glob('events_*.json')) + list(events_dir.glob('events_*.jsonl'))
+    ))
+
+    imported_total = 0
+
+    try:
+        for date in dates:
+            if target.has_day(date) and not force:
+                logger.info(f"{date}: события уже есть в базе, пропускаем (используйте --force)")
+                continue
+
+            try:
+                events = source.load_day(date)
+            except Exception as e:
+                logger.error(f"{date}: ошибка чтения файла: {str(e)}")
+                continue
+
+            count = 0
+            for category, records in events.items():
+                target.append_many(category, records)
+                count += len(records)
+
+            imported_total += count
+            logger.info(f"{date}: импортировано событий: {count}")
+    finally:
+        source.close()
+        target.close()
+
+    logger.info(f"Импорт завершен, всего событий: {imported_total}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт сохраненных событий в базу SQLite')
+    parser.add_argument('--events-dir', default='./data/events', help='Каталог с файлами событий')
+    parser.add_argument('--db', default='./data/events.db', help='Путь к базе SQLite')
+    parser.add_argument('--force', action='store_true', help='Импортировать дни, которые уже есть в базе')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    if not migrate(args.events_dir, args.db, args.force):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
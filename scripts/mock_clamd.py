@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальный сервер, имитирующий clamd (команды PING, VERSION, SCAN, INSTREAM
+и сессии IDSESSION/END в формате с нулевым терминатором).
+Файл считается зараженным, если содержит строку из --signature.
+Используется для проверки клиента ClamAV без установленного антивируса:
+укажите "host": "127.0.0.1", "port": 3311 в секции "clamav" конфигурации.
+"""
+
+import time
+import struct
+import argparse
+import socketserver
+
+class MockState:
+    def __init__(self, signature, db_version, delay, drop_after):
+        self.signature = signature.encode('utf-8')
+        self.db_version = db_version
+        self.delay = delay
+        self.drop_after = drop_after
+        self.commands = 0
+
+    def check(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        return 'Mock.Test-Signature FOUND' if self.signature in data else 'OK'
+
+def make_handler(state):
+    class MockClamdHandler(socketserver.BaseRequestHandler):
+        def setup(self):
+            self.buffer = b''
+
+        def _read_exact(self, size):
+            while len(self.buffer) < size:
+                data = self.request.recv(65536)
+                if not data:
+                    raise ConnectionError()
+                self.buffer += data
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+
+        def _read_command(self):
+            while b'\0' not in self.buffer:
+                data = self.request.recv(65536)
+                if not data:
+                    return None
+                self.buffer += data
+            command, self.buffer = self.buffer.split(b'\0', 1)
+            return command[1:].decode('utf-8', errors='replace')
+
+        def _read_stream(self):
+            data = b''
+            while True:
+                size = struct.unpack('!L', self._read_exact(4))[0]
+                if size == 0:
+                    return data
+                data += self._read_exact(size)
+
+        def _execute(self, command):
+            if command == 'PING':
+                return 'PONG'
+            if command == 'VERSION':
+                return f'ClamAV 1.0.0/{state.db_version}/Mon Jan  1 00:00:00 2024'
+            if command.startswith('SCAN '):
+                path = command[5:]
+                try:
+                    with open(path, 'rb') as f:
+                        return f'{path}: {state.check(f.read())}'
+                except OSError as e:
+                    return f'{path}: {e.strerror}. ERROR'
+            if command == 'INSTREAM':
+                return f'stream: {state.check(self._read_stream())}'
+            return 'UNKNOWN COMMAND'
+
+        def handle(self):
+            session = False
+            request_id = 0
+
+            try:
+                while True:
+                    command = self._read_command()
+                    if command is None or command == 'END':
+                        return
+
+                    state.commands += 1
+                    if state.drop_after and state.commands % state.drop_after == 0:
+                        # Имитация перезапуска clamd - соединение обрывается без ответа
+                        print(f"Соединение разорвано после команды {command}")
+                        return
+
+                    if command == 'IDSESSION':
+                        session = True
+                        continue
+
+                    reply = self._execute(command)
+                    if session:
+                        request_id += 1
+                        reply = f'{request_id}: {reply}'
+                    self.request.sendall(reply.encode('utf-8') + b'\0')
+
+                    if not session:
+                        return
+            except ConnectionError:
+                return
+
+    return MockClamdHandler
+
+class ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def main():
+    parser = argparse.ArgumentParser(description='Имитация clamd для тестирования агента')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=3311, help='Порт для прослушивания')
+    parser.add_argument('--signature', default='X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR', help='Строка, по которой файл считается зараженным')
+    parser.add_argument('--db-version', default='27000', help='Версия базы сигнатур в ответе VERSION')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка проверки одного файла в секундах')
+    parser.add_argument('--drop-after', type=int, default=0, help='Разрывать соединение каждые N команд (0 - никогда)')
+    args = parser.parse_args()
+
+    state = MockState(args.signature, args.db_version, args.delay, args.drop_after)
+    server = ThreadingServer((args.host, args.port), make_handler(state))
+
+    print(f"Имитация clamd запущена на {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
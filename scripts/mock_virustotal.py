@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальный сервер, имитирующий VirusTotal API v3 (GET /files/<sha256>).
+Используется для проверки клиента VirusTotal без расхода квоты:
+укажите "base_url": "http://127.0.0.1:8765" в секции "virustotal" конфигурации.
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class MockState:
+    def __init__(self, verdicts, rate_limit, delay):
+        self.verdicts = verdicts
+        self.rate_limit = rate_limit
+        self.delay = delay
+        self.request_times = []
+        self.lock = threading.Lock()
+
+    def is_rate_limited(self):
+        if not self.rate_limit:
+            return False
+
+        now = time.time()
+        with self.lock:
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if len(self.request_times) >= self.rate_limit:
+                return True
+            self.request_times.append(now)
+            return False
+
+def make_handler(state):
+    class MockVirusTotalHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = self.path.rstrip('/').split('/')
+            if len(parts) < 3 or parts[-2] != 'files':
+                return self._reply(404, {'error': {'code': 'NotFoundError'}})
+
+            if not self.headers.get('x-apikey'):
+                return self._reply(401, {'error': {'code': 'WrongCredentialsError'}})
+
+            if state.is_rate_limited():
+                return self._reply(429, {'error': {'code': 'QuotaExceededError'}})
+
+            if state.delay:
+                time.sleep(state.delay)
+
+            stats = state.verdicts.get(parts[-1].lower())
+            if stats is None:
+                return self._reply(404, {'error': {'code': 'NotFoundError'}})
+
+            self._reply(200, {'data': {'id': parts[-1], 'attributes': {'last_analysis_stats': stats}}})
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} - {format % args}")
+
+    return MockVirusTotalHandler
+
+def main():
+    parser = argparse.ArgumentParser(description='Имитация VirusTotal API для тестирования агента')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=8765, help='Порт для прослушивания')
+    parser.add_argument('--verdicts', help='JSON-файл {sha256: {"malicious": N, "suspicious": N, "harmless": N, ...}}')
+    parser.add_argument('--rate-limit', type=int, default=0, help='Максимум запросов в минуту (0 - без ограничения)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка ответа в секундах')
+    args = parser.parse_args()
+
+    verdicts = {}
+    if args.verdicts:
+        with open(args.verdicts, 'r', encoding='utf-8') as f:
+            verdicts = {k.lower(): v for k, v in json.load(f).items()}
+
+    state = MockState(verdicts, args.rate_limit, args.delay)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+
+    print(f"Имитация VirusTotal API запущена на http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+import yaml
+
+# Добавляем директорию модулей агента в путь для импорта
+script_path = Path(__file__).resolve()
+project_root = script_path.parent.parent
+sys.path.append(str(project_root / 'src' / 'agent'))
+
+from sigma import SigmaError, convert_sigma, is_sigma_rule
+from rule_engine import Rule, RuleError, FieldMatchers, EventFields
+
+# Проверки преобразования: (поле Sigma с модификаторами, значение, значение в событии, ожидается ли совпадение)
+CONVERSION_CHECKS = [
+    ('CommandLine|contains', 'http*://', 'curl http://a', True),
+    ('CommandLine|contains', 'http*://', 'CURL HTTP://A', True),
+    ('CommandLine|re', 'http.*://', 'CURL HTTP://A', False),
+    ('CommandLine|re', 'http.*://', 'curl http://a', True),
+    ('Image', r'*\Temp\\?.exe', r'C:\TEMP\A.EXE', True),
+    ('Image', r'*\Temp\?.exe', r'C:\Temp\A.exe', False),
+    ('Image', r'C:\Windows\System32\cmd.exe', r'c:\windows\system32\cmd.exe', True),
+    ('Image|contains', r'C:\Users\\*\AppData', r'C:\Users\bob\AppData\Local\x.exe', True),
+    ('Image|contains', r'C:\Users\\*\AppData', r'c:\users\BOB\appdata\x.exe', True),
+    ('Image|contains', r'C:\Users\\*\AppData', r'C:\Users\*\Desktop\x.exe', False),
+    ('Image|endswith', r'\AppData\\*.exe', r'C:\Users\bob\AppData\x.exe', True),
+    ('CommandLine|contains', r'\*', 'dir *', True),
+    ('CommandLine|contains', r'\*', 'dir', False),
+    ('CommandLine', r'a*\*', 'abc*', True),
+    ('CommandLine', r'a*\*', 'abc', False)
+]
+
+# Пути полей событий запуска процессов
+CHECK_FIELDS = {'Image': 'image', 'CommandLine': 'command_line'}
+
+def setup_logging():
+    logger = logging.getLogger('SigmaConvert')
+    logger.setLevel(logging.INFO)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(formatter)
+
+    logger.addHandler(console_handler)
+
+    return logger
+
+def convert(sources, output):
+    """Преобразование правил Sigma в формат правил агента"""
+    logger = logging.getLogger('SigmaConvert')
+
+    files = []
+    for source in sources:
+        source = Path(source)
+        files += sorted(source.rglob('*.yml')) + sorted(source.rglob('*.yaml')) if source.is_dir() else [source]
+
+    rules = []
+    skipped = 0
+
+    for path in files:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                documents = list(yaml.safe_load_all(f))
+        except Exception as e:
+            logger.error(f"{path}: ошибка чтения файла: {str(e)}")
+            continue
+
+        for document in documents:
+            if not is_sigma_rule(document):
+                continue
+
+            try:
+                rule = convert_sigma(document, default_id=path.stem)
+                # Проверяем, что правило компилируется так же, как при загрузке агентом
+                Rule.from_dict(rule, path.name, FieldMatchers())
+            except (SigmaError, RuleError) as e:
+                logger.warning(f"{path.name}: пропущено: {str(e)}")
+                skipped += 1
+                continue
+
+            rules.append(rule)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(rules, f, allow_unicode=True, sort_keys=False)
+
+    logger.info(f"Преобразовано правил: {len(rules)}, пропущено: {skipped}, результат: {output}")
+    return bool(rules)
+
+def check():
+    """Проверка преобразования значений Sigma на примерах, возвращает число ошибок"""
+    logger = logging.getLogger('SigmaConvert')
+    failures = 0
+
+    for key, value, event_value, expected in CONVERSION_CHECKS:
+        document = {
+            'title': 'check',
+            'logsource': {'category': 'process_creation', 'product': 'windows'},
+            'detection': {'selection': {key: value}, 'condition': 'selection'}
+        }
+        matchers = FieldMatchers()
+        rule = Rule.from_dict(convert_sigma(document), 'check', matchers)
+        matchers.finish()
+        event_data = {'process': {CHECK_FIELDS[key.split('|')[0]]: event_value}}
+
+        matched = rule.predicate(EventFields(event_data, matchers))
+        if matched == expected:
+            logger.info(f"{key}: {value!r} и {event_value!r}: {'совпадают' if matched else 'не совпадают'}, как ожидалось")
+        else:
+            failures += 1
+            logger.error(f"{key}: {value!r} и {event_value!r}: ожидалось {'совпадение' if expected else 'несовпадение'}")
+
+    logger.info(f"Проверок: {len(CONVERSION_CHECKS)}, ошибок: {failures}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='Преобразование правил Sigma в правила агента')
+    parser.add_argument('sources', nargs='*', help='Файлы или каталоги с правилами Sigma')
+    parser.add_argument('--output', default='./rules/sigma.yml', help='Файл для сохранения правил')
+    parser.add_argument('--check', action='store_true', help='Проверить преобразование значений на примерах')
+    args = parser.parse_args()
+
+    setup_logging()
+
+    if args.check:
+        if check():
+            sys.exit(1)
+        return
+
+    if not args.sources:
+        parser.error('не указаны правила Sigma')
+
+    if not convert(args.sources, args.output):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
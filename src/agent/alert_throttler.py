@@ -0,0 +1,131 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+DEFAULT_FINGERPRINT = ['category', 'user', 'image', 'destination']
+
+
+class AlertThrottler:
+    """
+    Suppresses repeated alerts before they reach the notifier.
+
+    Alerts are keyed by a fingerprint built from the configured fields. The
+    first alert of a key is sent at once; repeats within `window` seconds
+    are only counted, and when the window ends a single summary with the
+    number of repeats and the latest message is sent instead. Keys expire
+    with their window and at most `max_keys` are tracked, the oldest being
+    evicted (and summarized) first.
+    """
+
+    def __init__(self, notifier, window=300, fingerprint=None, max_keys=10000, flush_interval=10.0):
+        self.notifier = notifier
+        self.window = window
+        self.fingerprint = fingerprint or DEFAULT_FINGERPRINT
+        self.max_keys = max_keys
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger('AlertThrottler')
+
+        # key -> [window_start, suppressed, last_message], ordered by window_start
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.sent = 0
+        self.suppressed = 0
+        self.summaries = 0
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._flush_loop, name='alert-throttler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+        # Repeats counted so far are reported before shutdown
+        with self.lock:
+            entries, self.entries = self.entries, OrderedDict()
+        for entry in entries.values():
+            self._send_summary(entry)
+
+    def send(self, category, message, **fields):
+        if self.window <= 0:
+            self._deliver(message)
+            return True
+
+        fields['category'] = category
+        key = tuple(fields.get(name) for name in self.fingerprint)
+        now = time.time()
+        expired = []
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                entry[2] = message
+                self.suppressed += 1
+                return False
+
+            if entry is not None:
+                expired.append(self.entries.pop(key))
+
+            self.entries[key] = [now, 0, message]
+            while len(self.entries) > self.max_keys:
+                expired.append(self.entries.popitem(last=False)[1])
+
+        for old_entry in expired:
+            self._send_summary(old_entry)
+
+        self._deliver(message)
+        return True
+
+    def flush(self, now=None):
+        """Sends summaries for windows that have ended and forgets their keys"""
+        now = now if now is not None else time.time()
+        expired = []
+
+        with self.lock:
+            while self.entries:
+                key, entry = next(iter(self.entries.items()))
+                if now - entry[0] < self.window:
+                    break
+                expired.append(self.entries.pop(key))
+
+        for entry in expired:
+            self._send_summary(entry)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'tracked': len(self.entries),
+                'sent': self.sent,
+                'suppressed': self.suppressed,
+                'summaries': self.summaries
+            }
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Error flushing alert summaries: {str(e)}")
+
+    def _send_summary(self, entry):
+        window_start, suppressed, message = entry
+        if not suppressed:
+            return
+
+        minutes = max(1, round(self.window / 60))
+        with self.lock:
+            self.summaries += 1
+        self._deliver(f"{message}\n🔁 Повторов: ×{suppressed} за последние {minutes} мин")
+
+    def _deliver(self, message):
+        with self.lock:
+            self.sent += 1
+        self.notifier.send_message(message)
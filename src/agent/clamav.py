@@ -0,0 +1,325 @@
+import time
+import queue
+import socket
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Chunk size for INSTREAM, must not exceed StreamMaxLength of clamd
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class ClamdError(Exception):
+    pass
+
+
+class ClamdConnection:
+    """
+    A clamd connection kept inside one IDSESSION and speaking the
+    null-terminated ('z') protocol. Commands are pipelined and their
+    replies matched to requests by the id clamd prefixes them with.
+    clamd ends an idle session after its IdleTimeout (30 s by default).
+    """
+
+    def __init__(self, address, timeout=30.0):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.buffer = b''
+        self.next_id = 1
+        self.last_used = time.time()
+        self._send('IDSESSION')
+
+    def close(self):
+        try:
+            self._send('END')
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _send(self, command):
+        self.sock.sendall(b'z' + command.encode('utf-8') + b'\0')
+
+    def _request(self, command):
+        self._send(command)
+        request_id = self.next_id
+        self.next_id += 1
+        return request_id
+
+    def _request_stream(self, file_path):
+        request_id = self._request('INSTREAM')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK_SIZE), b''):
+                self.sock.sendall(struct.pack('!L', len(chunk)) + chunk)
+        self.sock.sendall(struct.pack('!L', 0))
+        return request_id
+
+    def _read_reply(self):
+        while b'\0' not in self.buffer:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ClamdError("Connection closed by clamd")
+            self.buffer += data
+
+        reply, self.buffer = self.buffer.split(b'\0', 1)
+        request_id, _, reply = reply.decode('utf-8', errors='replace').partition(': ')
+        if not request_id.isdigit():
+            raise ClamdError(f"Unexpected reply: {request_id}")
+        return int(request_id), reply
+
+    def _collect(self, request_ids):
+        replies = {}
+        while len(replies) < len(request_ids):
+            request_id, reply = self._read_reply()
+            replies[request_id] = reply
+
+        self.last_used = time.time()
+        return [replies.get(request_id, '') for request_id in request_ids]
+
+    def command(self, command):
+        return self._collect([self._request(command)])[0]
+
+    def scan_batch(self, paths, stream=False):
+        """Sends all scans before reading any reply and returns the raw reply for each path"""
+        if stream:
+            request_ids = [self._request_stream(path) for path in paths]
+        else:
+            request_ids = [self._request(f'SCAN {path}') for path in paths]
+        return self._collect(request_ids)
+
+
+def parse_scan_reply(reply):
+    """Returns the signature name for a FOUND reply, '' for OK; raises ClamdError otherwise"""
+    # Replies look like '<path>: OK', '<path>: <signature> FOUND' or '<path>: <message> ERROR'
+    _, _, status = reply.rpartition(': ')
+    if status == 'OK':
+        return ''
+    if status.endswith(' FOUND'):
+        return status[:-len(' FOUND')]
+    raise ClamdError(reply)
+
+
+class ClamdClient:
+    """
+    Batched clamd client.
+
+    Files are queued with submit() and picked up by a small pool of
+    workers, each holding a persistent connection and sending whatever is
+    queued (up to batch_size files) as one pipelined IDSESSION. Verdicts are
+    cached by (sha256, signature database version), so a database update
+    invalidates them. A lost connection is re-established with exponential
+    backoff; files queued meanwhile are answered with None (not scanned).
+    """
+
+    def __init__(self, address=('127.0.0.1', 3310), pool_size=2, batch_size=16, timeout=30.0,
+                 stream=False, cache_size=10000, version_interval=300.0, idle_timeout=25.0,
+                 max_backoff=300.0):
+        self.address = address
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.stream = stream
+        self.cache_size = cache_size
+        self.version_interval = version_interval
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger('ClamdClient')
+
+        self.queue = queue.Queue()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.db_version = None
+        self.version_checked = 0.0
+        self.available = True
+        self.retry_at = 0.0
+        self.backoff = 1.0
+
+        self.scans = 0
+        self.batches = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.reconnects = 0
+
+    def start(self):
+        self.stop_event.clear()
+        for index in range(self.pool_size):
+            thread = threading.Thread(target=self._worker, name=f'clamd-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+        # Fail whatever is left so callers waiting on futures don't hang
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and not item[2].done():
+                item[2].set_result(None)
+
+    def ping(self):
+        connection = ClamdConnection(self.address, self.timeout)
+        try:
+            return connection.command('PING') == 'PONG'
+        finally:
+            connection.close()
+
+    def submit(self, file_path, file_hash=None):
+        """Returns a Future resolved with the signature name, '' if clean or None if not scanned"""
+        future = Future()
+
+        with self.lock:
+            key = (file_hash, self.db_version)
+            if file_hash and self.db_version and key in self.cache:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                future.set_result(self.cache[key])
+                return future
+
+        self.queue.put((file_path, file_hash, future))
+        return future
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'available': self.available,
+                'db_version': self.db_version,
+                'queued': self.queue.qsize(),
+                'scans': self.scans,
+                'batches': self.batches,
+                'cache_hits': self.cache_hits,
+                'errors': self.errors,
+                'reconnects': self.reconnects
+            }
+
+    def _worker(self):
+        connection = None
+
+        while not self.stop_event.is_set():
+            item = self.queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+
+            # Don't reuse a session clamd has probably closed for idleness
+            if connection is not None and time.time() - connection.last_used > self.idle_timeout:
+                connection.close()
+                connection = None
+
+            try:
+                connection = self._scan_with_retry(connection, batch)
+            except Exception as e:
+                connection = None
+                self._mark_unavailable(e)
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+        if connection is not None:
+            connection.close()
+
+    def _scan_with_retry(self, connection, batch):
+        # A reused connection may have been dropped by clamd, retry once on a fresh one
+        if connection is not None:
+            try:
+                self._refresh_version(connection)
+                self._scan(connection, batch)
+                return connection
+            except (OSError, ClamdError):
+                connection.close()
+
+        connection = self._connect()
+        try:
+            self._refresh_version(connection)
+            self._scan(connection, batch)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def _connect(self):
+        with self.lock:
+            if not self.available and time.time() < self.retry_at:
+                raise ClamdError("clamd unavailable, waiting to reconnect")
+
+        connection = ClamdConnection(self.address, self.timeout)
+
+        with self.lock:
+            if not self.available:
+                self.reconnects += 1
+                self.logger.info("ClamAV connection re-established")
+            self.available = True
+            self.backoff = 1.0
+
+        return connection
+
+    def _mark_unavailable(self, error):
+        with self.lock:
+            self.errors += 1
+            if self.available or time.time() >= self.retry_at:
+                self.logger.warning(f"ClamAV error, retrying in {self.backoff:.0f}s: {str(error)}")
+                self.retry_at = time.time() + self.backoff
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.available = False
+
+    def _refresh_version(self, connection):
+        if time.time() - self.version_checked < self.version_interval:
+            return
+
+        # 'ClamAV 1.0.1/26950/Mon Jun 26 07:35:17 2023' - the second field is the database version
+        parts = connection.command('VERSION').split('/')
+        with self.lock:
+            self.db_version = parts[1] if len(parts) > 1 else parts[0]
+            self.version_checked = time.time()
+
+    def _scan(self, connection, batch):
+        paths = [file_path for file_path, _, _ in batch]
+        replies = connection.scan_batch(paths, stream=self.stream)
+
+        with self.lock:
+            self.batches += 1
+            self.scans += len(batch)
+
+        for (file_path, file_hash, future), reply in zip(batch, replies):
+            try:
+                verdict = parse_scan_reply(reply)
+            except ClamdError as e:
+                self.logger.error(f"ClamAV scan error for {file_path}: {str(e)}")
+                future.set_result(None)
+                continue
+
+            if file_hash:
+                with self.lock:
+                    self.cache[(file_hash, self.db_version)] = verdict
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+
+            future.set_result(verdict)
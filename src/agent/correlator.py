@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from pathlib import Path
+
+from rule_engine import RuleError, EventFields, compile_condition
+
+# A root event fanning out (e.g. a dropper writing many files) cannot grow a run without bound
+MAX_LINKS_PER_RUN = 32
+
+
+def normalize_key(value):
+    """Join values are compared without case, surrounding whitespace and quotes"""
+    if value is None:
+        return ''
+    return str(value).strip().strip('"').strip().lower()
+
+
+class Step:
+    __slots__ = ('channel', 'event_ids', 'title', 'predicate', 'join', 'key', 'show')
+
+    def __init__(self, channel, event_ids, title, predicate, join, key, show):
+        self.channel = channel
+        self.event_ids = event_ids
+        self.title = title
+        self.predicate = predicate
+        self.join = join
+        self.key = key
+        self.show = show
+
+
+class Sequence:
+    """
+    Ordered steps that must all occur on one computer within window seconds
+    of the first. Step N (N > 0) only continues a run if the value of its
+    'join' field equals the value of the 'key' field of step N - 1, which is
+    how steps are tied to one process, user or file.
+    """
+
+    def __init__(self, sequence_id, title, severity, window, steps):
+        self.id = sequence_id
+        self.title = title
+        self.severity = severity
+        self.window = window
+        self.steps = steps
+
+    @classmethod
+    def from_dict(cls, data, default_window=60):
+        if not isinstance(data, dict):
+            raise RuleError(f"Sequence must be a mapping, got {data!r}")
+
+        sequence_id = data.get('id')
+        steps = data.get('steps')
+        if not sequence_id or not isinstance(steps, list) or len(steps) < 2:
+            raise RuleError("Sequence needs 'id' and at least two 'steps'")
+
+        compiled = []
+        for index, step in enumerate(steps):
+            try:
+                compiled.append(cls._step(step))
+            except RuleError as e:
+                raise RuleError(f"Sequence {sequence_id}, step {index + 1}: {str(e)}")
+
+        for index in range(1, len(compiled)):
+            if bool(compiled[index].join) != bool(compiled[index - 1].key):
+                raise RuleError(f"Sequence {sequence_id}, step {index + 1}: 'join' needs a 'key' "
+                                f"in the previous step and the other way round")
+
+        window = data.get('window', default_window)
+        if not isinstance(window, (int, float)) or window <= 0:
+            raise RuleError(f"Sequence {sequence_id}: invalid window {window!r}")
+
+        return cls(str(sequence_id), data.get('title', str(sequence_id)), data.get('severity', 'high'),
+                   window, compiled)
+
+    @staticmethod
+    def _step(data):
+        if not isinstance(data, dict) or not data.get('channel'):
+            raise RuleError("step needs a 'channel'")
+
+        event_ids = data.get('event_id')
+        try:
+            event_ids = tuple(int(event_id) for event_id in (event_ids if isinstance(event_ids, list) else [event_ids]))
+        except (TypeError, ValueError):
+            raise RuleError(f"invalid event_id {data.get('event_id')!r}")
+
+        predicate = None
+        if data.get('condition') is not None:
+            predicate, _ = compile_condition(data['condition'])
+
+        key = data.get('key')
+        join = data.get('join')
+        title = data.get('title') or f"{data['channel']} {', '.join(map(str, event_ids))}"
+        return Step(data['channel'], event_ids, title, predicate, join, key, data.get('show') or key or join)
+
+
+class Run:
+    """Partial match of one sequence, started by an event matching its first step"""
+
+    __slots__ = ('sequence', 'host', 'start', 'deadline', 'links', 'fired')
+
+    def __init__(self, sequence, host, start):
+        self.sequence = sequence
+        self.host = host
+        self.start = start
+        self.deadline = start + sequence.window
+        # pending buckets this run waits in
+        self.links = []
+        self.fired = False
+
+
+class Correlator:
+    """
+    Streaming correlation of events into incidents.
+
+    Each event is checked against the steps of all sequences when it
+    arrives; only the steps it matches (with their join and key values) are
+    kept. Those are buffered and processed in event-time order once the
+    watermark - the newest event time seen minus 'lateness' seconds - has
+    passed them, so events read from different channels at different
+    speeds are still correlated in the order they happened. Runs whose
+    window ended before the watermark are dropped, and their number is
+    capped by max_runs (oldest first), which bounds memory. Runs, the
+    buffer and the watermark are saved to checkpoint_file periodically and
+    on stop, and restored on start.
+    """
+
+    def __init__(self, sequences, on_incident, lateness=10.0, max_runs=10000, max_buffer=10000,
+                 checkpoint_file=None, checkpoint_interval=60.0):
+        self.sequences = {sequence.id: sequence for sequence in sequences}
+        self.on_incident = on_incident
+        self.lateness = lateness
+        self.max_runs = max_runs
+        self.max_buffer = max_buffer
+        self.checkpoint_file = Path(checkpoint_file) if checkpoint_file else None
+        self.checkpoint_interval = checkpoint_interval
+        self.logger = logging.getLogger('Correlator')
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # (channel, event_id) -> [(sequence, step index, step)], later steps first
+        # so an event never continues a run it has just started
+        self.index = {}
+        for sequence in self.sequences.values():
+            for position, step in enumerate(sequence.steps):
+                for event_id in step.event_ids:
+                    self.index.setdefault((step.channel, event_id), []).append((sequence, position, step))
+        for entries in self.index.values():
+            entries.sort(key=lambda entry: -entry[1])
+
+        # (sequence id, step, host, join value) -> [(run, trail)]
+        self.pending = {}
+        # (deadline, order, run) for expiry, and (start, order, run) for the max_runs cap
+        self.deadlines = []
+        self.starts = []
+        self.order = 0
+        self.runs = 0
+
+        # (time, order, host, matches) not yet passed by the watermark
+        self.buffer = []
+        self.max_time = None
+        self.watermark = None
+        self.last_event = time.time()
+
+        self.events = 0
+        self.late = 0
+        self.expired = 0
+        self.evicted = 0
+        self.incidents = 0
+
+        self.load()
+
+    def keys(self):
+        return set(self.index)
+
+    def process(self, channel, event_id, event_data):
+        """Matches one event against the sequence steps and advances the runs the watermark has passed"""
+        entries = self.index.get((channel, event_id))
+        if not entries:
+            return
+
+        fields = EventFields(event_data)
+        matches = []
+        for sequence, position, step in entries:
+            try:
+                if step.predicate is not None and not step.predicate(fields):
+                    continue
+            except Exception as e:
+                self.logger.error(f"Error evaluating sequence {sequence.id}: {str(e)}")
+                continue
+            matches.append((
+                sequence.id, position,
+                normalize_key(fields.get(step.join)) if step.join else '',
+                normalize_key(fields.get(step.key)) if step.key else '',
+                str(fields.get(step.show) or '') if step.show else ''
+            ))
+
+        if not matches:
+            return
+
+        timestamp = event_data['timestamp']
+        host = event_data.get('computer') or ''
+        incidents = []
+
+        with self.lock:
+            self.events += 1
+            self.last_event = time.time()
+
+            if self.watermark is not None and timestamp < self.watermark:
+                self.late += 1
+                return
+
+            self.order += 1
+            heapq.heappush(self.buffer, (timestamp, self.order, host, matches))
+            if self.max_time is None or timestamp > self.max_time:
+                self.max_time = timestamp
+
+            self._advance(self.max_time - self.lateness, incidents)
+
+        self._fire(incidents)
+
+    def _advance(self, watermark, incidents):
+        if self.watermark is None or watermark > self.watermark:
+            self.watermark = watermark
+
+        buffer = self.buffer
+        while buffer and (buffer[0][0] <= self.watermark or len(buffer) > self.max_buffer):
+            timestamp, _, host, matches = heapq.heappop(buffer)
+            self._expire(timestamp)
+            for match in matches:
+                self._apply(timestamp, host, match, incidents)
+
+        self._expire(self.watermark)
+
+    def _apply(self, timestamp, host, match, incidents):
+        sequence_id, position, join, key, shown = match
+        sequence = self.sequences.get(sequence_id)
+        if sequence is None or position >= len(sequence.steps):
+            return
+        step = sequence.steps[position]
+        entry = (timestamp, step.title, shown)
+
+        if position == 0:
+            run = Run(sequence, host, timestamp)
+            self._link(run, 1, key, (entry,))
+            self.order += 1
+            heapq.heappush(self.deadlines, (run.deadline, self.order, run))
+            heapq.heappush(self.starts, (run.start, self.order, run))
+            self.runs += 1
+            self._cap()
+            return
+
+        waiting = self.pending.get((sequence_id, position, host, join))
+        if not waiting:
+            return
+
+        for run, trail in list(waiting):
+            if run.fired or timestamp > run.deadline or timestamp < trail[-1][0]:
+                continue
+            trail = trail + (entry,)
+            if position == len(sequence.steps) - 1:
+                run.fired = True
+                self._unlink(run)
+                self.incidents += 1
+                incidents.append((sequence, host, trail))
+                continue
+            self._link(run, position + 1, key, trail)
+
+    def _link(self, run, position, key, trail):
+        if len(run.links) >= MAX_LINKS_PER_RUN:
+            return
+        bucket = (run.sequence.id, position, run.host, key)
+        self.pending.setdefault(bucket, []).append((run, trail))
+        run.links.append(bucket)
+
+    def _unlink(self, run):
+        if not run.links:
+            return
+        for bucket in run.links:
+            waiting = self.pending.get(bucket)
+            if waiting is None:
+                continue
+            waiting[:] = [item for item in waiting if item[0] is not run]
+            if not waiting:
+                del self.pending[bucket]
+        run.links = []
+        self.runs -= 1
+
+    def _expire(self, watermark):
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] < watermark:
+            run = heapq.heappop(deadlines)[2]
+            if not run.fired and run.links:
+                self.expired += 1
+            run.fired = True
+            self._unlink(run)
+
+    def _cap(self):
+        starts = self.starts
+        while self.runs > self.max_runs and starts:
+            run = heapq.heappop(starts)[2]
+            if run.fired or not run.links:
+                continue
+            run.fired = True
+            self._unlink(run)
+            self.evicted += 1
+
+        # Finished runs are dropped from the heaps once they dominate them
+        if len(starts) > 2 * self.max_runs:
+            self.starts = [item for item in starts if not item[2].fired]
+            heapq.heapify(self.starts)
+        if len(self.deadlines) > 2 * self.max_runs:
+            self.deadlines = [item for item in self.deadlines if not item[2].fired]
+            heapq.heapify(self.deadlines)
+
+    def _fire(self, incidents):
+        for sequence, host, trail in incidents:
+            try:
+                self.on_incident(sequence, host, list(trail))
+            except Exception as e:
+                self.logger.error(f"Error in incident callback for {sequence.id}: {str(e)}")
+
+    def flush(self):
+        """Moves the watermark up to the newest event, processing everything buffered"""
+        incidents = []
+        with self.lock:
+            if self.max_time is None:
+                return
+            self._advance(self.max_time, incidents)
+        self._fire(incidents)
+
+    def flush_idle(self):
+        """Flushes once no event arrived for 'lateness' seconds, so a quiet system still gets its incidents"""
+        if time.time() - self.last_event >= self.lateness:
+            self.flush()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._maintenance_loop, name='correlator', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.save()
+
+    def _maintenance_loop(self):
+        last_save = time.time()
+        while not self.stop_event.wait(1.0):
+            try:
+                self.flush_idle()
+                if time.time() - last_save >= self.checkpoint_interval:
+                    self.save()
+                    last_save = time.time()
+            except Exception as e:
+                self.logger.error(f"Error in correlation maintenance: {str(e)}")
+
+    def _state(self):
+        runs = {}
+        for (sequence_id, position, host, join), waiting in self.pending.items():
+            for run, trail in waiting:
+                state = runs.setdefault(id(run), {
+                    'sequence': sequence_id,
+                    'host': host,
+                    'start': run.start,
+                    'links': []
+                })
+                state['links'].append([position, join, [list(entry) for entry in trail]])
+
+        return {
+            'max_time': self.max_time,
+            'watermark': self.watermark,
+            'buffer': [[timestamp, host, [list(match) for match in matches]]
+                       for timestamp, _, host, matches in sorted(self.buffer)],
+            'runs': list(runs.values())
+        }
+
+    def save(self):
+        if self.checkpoint_file is None:
+            return
+
+        with self.lock:
+            data = self._state()
+
+        self.checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_file.with_name(self.checkpoint_file.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.checkpoint_file)
+        except Exception as e:
+            self.logger.error(f"Error saving correlation state to {self.checkpoint_file}: {str(e)}")
+
+    def load(self):
+        if self.checkpoint_file is None or not self.checkpoint_file.exists():
+            return
+
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error loading correlation state from {self.checkpoint_file}: {str(e)}")
+            return
+
+        with self.lock:
+            self.max_time = data.get('max_time')
+            self.watermark = data.get('watermark')
+
+            for timestamp, host, matches in data.get('buffer', []):
+                self.order += 1
+                heapq.heappush(self.buffer, (timestamp, self.order, host, [tuple(match) for match in matches]))
+
+            # Runs of sequences that were removed or shortened since the save are dropped
+            for state in data.get('runs', []):
+                sequence = self.sequences.get(state['sequence'])
+                if sequence is None:
+                    continue
+                run = Run(sequence, state['host'], state['start'])
+                for position, join, trail in state['links']:
+                    if position < len(sequence.steps):
+                        self._link(run, position, join, tuple(tuple(entry) for entry in trail))
+                if not run.links:
+                    continue
+                self.order += 1
+                heapq.heappush(self.deadlines, (run.deadline, self.order, run))
+                heapq.heappush(self.starts, (run.start, self.order, run))
+                self.runs += 1
+
+        self.logger.info(f"Restored {self.runs} correlation runs and {len(self.buffer)} buffered events")
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'sequences': len(self.sequences),
+                'runs': self.runs,
+                'buffered': len(self.buffer),
+                'events': self.events,
+                'late': self.late,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'incidents': self.incidents,
+                'watermark': self.watermark
+            }
@@ -1,65 +1,311 @@
 import os
-import json
+import re
 import logging
 import datetime
-from pathlib import Path
-import requests
-import clamd
+import threading
+from concurrent.futures import Future
+from collections import deque
 import psutil
 
+from event_store import create_event_store, empty_day
+from pattern_matcher import MultiPatternMatcher
+from whitelist import WhitelistIndex
+from scan_pipeline import ScanPipeline
+from hash_cache import FileHashCache
+from virustotal import VirusTotalClient, PRIORITY_HIGH, PRIORITY_NORMAL
+from clamav import ClamdClient
+from signature_scanner import SignatureScanner
+from ip_reputation import IPReputation
+from alert_throttler import AlertThrottler
+from rule_engine import RuleEngine, RuleError
+from correlator import Correlator, Sequence
+from process_tree import ProcessTree
+from logon_failures import FailedLogonTracker
+from heavy_hitters import HeavyHitters
+from login_baseline import LoginBaselines, source_host
+
+# Records per category listed in the report of a past day; counts cover the whole day
+REPORT_RECORDS = 100
+
+# Default indicators, can be overridden in the 'detection' config section
+DEFAULT_SUSPICIOUS_LOCATIONS = [
+    '\\temp\\', '\\windows\\temp\\', '\\appdata\\local\\temp\\',
+    '\\users\\public\\', '\\programdata\\', '\\downloads\\'
+]
+
+DEFAULT_SUSPICIOUS_ARGUMENTS = [
+    '-enc', '-encodedcommand', '-windowstyle hidden',
+    'iex(', 'invoke-expression', 'downloadstring',
+    'bypass', 'hidden', 'webclient'
+]
+
+TASK_COMMAND = re.compile(r'<Command>\s*(.*?)\s*</Command>', re.IGNORECASE | re.DOTALL)
+
+
+def executable_path(command):
+    """The executable of a service or task command line, without quotes and arguments"""
+    command = command.strip()
+    if command.startswith('"'):
+        end = command.find('"', 1)
+        return command[1:end] if end != -1 else command[1:]
+    lowered = command.lower()
+    end = lowered.find('.exe')
+    if end != -1:
+        return command[:end + 4]
+    return command.split(' ', 1)[0]
+
 class EventHandler:
     def __init__(self, config, telegram_notifier):
         self.config = config
         self.telegram = telegram_notifier
-        self.today_events = {
-            'startup': [],
-            'login': [],
-            'privilege': [],
-            'task': [],
-            'service': [],
-            'suspicious_process': []
-        }
-        self.today_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        self.storage_path = Path('./data/events')
-        self.storage_path.mkdir(parents=True, exist_ok=True)
         
-        self.process_whitelist = set(self.config['monitoring'].get('process_whitelist', []))
-        self.service_whitelist = set(self.config['monitoring'].get('service_whitelist', []))
-        self.task_whitelist = set(self.config['monitoring'].get('task_whitelist', []))
+        # Repeated alerts are collapsed into periodic summaries
+        alerts = config.get('alerts', {})
+        self.alerts = AlertThrottler(
+            telegram_notifier,
+            window=alerts.get('window', 300),
+            fingerprint=alerts.get('fingerprint'),
+            max_keys=alerts.get('max_keys', 10000)
+        )
+        self.alerts.start()
+        self.today_date = datetime.datetime.now().strftime('%Y-%m-%d')
+        self.lock = threading.RLock()
+        
+        self.store = create_event_store(self.config.get('storage', {}))
+        
+        # Finish compaction of previous days and continue today's journal after a restart
+        self.store.compact_pending(self.today_date)
+        self.today_events = self.store.load_day(self.today_date)
+        
+        # Live view for /status and today's /report, updated on every insert
+        status_events = self.config.get('reporting', {}).get('status_events', 5)
+        self.latest_events = deque(maxlen=status_events)
+        self.today_counts = {}
+        self._init_live_view()
+        
+        self._load_detection_config()
+        
+        # Live process graph for ancestry of Sysmon process events
+        process_tree = self.config.get('process_tree', {})
+        self.process_tree = ProcessTree(
+            max_processes=process_tree.get('max_processes', 100000),
+            max_command_line=process_tree.get('max_command_line', 1024)
+        )
+        
+        # Sliding-window failed logon counters per user and source IP
+        failed_logons = self.config.get('failed_logons', {})
+        self.failed_logons = FailedLogonTracker(
+            window=failed_logons.get('window', 300),
+            bucket=failed_logons.get('bucket', 10),
+            user_threshold=failed_logons.get('user_threshold', 10),
+            ip_threshold=failed_logons.get('ip_threshold', 20),
+            max_keys=failed_logons.get('max_keys', 10000),
+            idle_timeout=failed_logons.get('idle_timeout', 3600),
+            top_size=failed_logons.get('top_size', 10)
+        )
+        
+        # Daily top processes, destinations and parent -> child pairs in fixed memory
+        heavy_hitters = self.config.get('heavy_hitters', {})
+        self.heavy_hitters = HeavyHitters(
+            heavy_hitters.get('path', './data/top'),
+            capacity=heavy_hitters.get('capacity', 1000),
+            top_n=heavy_hitters.get('top_n', 10),
+            save_interval=heavy_hitters.get('save_interval', 300)
+        )
+        self.heavy_hitters.start()
+        
+        # Per-user login habits; 'anomalous' mode only alerts on logins that do not fit them
+        login_baseline = self.config.get('login_baseline', {})
+        self.login_alert_mode = login_baseline.get('mode', 'all')
+        self.login_baselines = LoginBaselines(
+            login_baseline.get('path', './data/login_baseline.json'),
+            half_life_days=login_baseline.get('half_life_days', 30),
+            min_logins=login_baseline.get('min_logins', 20),
+            threshold=login_baseline.get('threshold', 1.0),
+            max_users=login_baseline.get('max_users', 10000),
+            max_hosts=login_baseline.get('max_hosts', 16),
+            save_interval=login_baseline.get('save_interval', 300)
+        )
+        self.login_baselines.start()
         
         self.vt_api_key = self.config.get('vt_api_key', '')
-        self.clamav_enabled = False
         
         self.setup_logging()
+        self.try_setup_signatures()
+        self.try_setup_reputation()
+        self.try_setup_rules()
+        self.try_setup_correlation()
         self.try_setup_clamav()
+        self.try_setup_virustotal()
+        
+        # File checks run in the background, alerts are sent without waiting for them
+        scanning = self.config.get('scanning', {})
+        self.notify_clean = scanning.get('notify_clean', False)
+        self.hash_cache = FileHashCache(
+            scanning.get('hash_cache_file', './data/hash_cache.json'),
+            max_entries=scanning.get('hash_cache_size', 10000)
+        )
+        self.scanner = ScanPipeline(
+            self._check_file_suspicious,
+            on_result=self._on_scan_result,
+            workers=scanning.get('workers', 2)
+        )
     
     def setup_logging(self):
         self.logger = logging.getLogger('EventHandler')
         self.logger.setLevel(logging.INFO)
     
+    def _load_detection_config(self):
+        # Whitelists are compiled into hashed, case-normalized indexes
+        monitoring = self.config['monitoring']
+        self.process_whitelist = WhitelistIndex(monitoring.get('process_whitelist', []))
+        self.service_whitelist = WhitelistIndex(monitoring.get('service_whitelist', []), match_basename=False)
+        self.task_whitelist = WhitelistIndex(monitoring.get('task_whitelist', []), match_basename=False)
+        
+        # Pattern sets are compiled once into Aho-Corasick automata
+        detection = self.config.get('detection', {})
+        self.location_matcher = MultiPatternMatcher(
+            detection.get('suspicious_locations', DEFAULT_SUSPICIOUS_LOCATIONS)
+        )
+        self.argument_matcher = MultiPatternMatcher(
+            detection.get('suspicious_arguments', DEFAULT_SUSPICIOUS_ARGUMENTS)
+        )
+    
+    def update_config(self, config):
+        self.config = config
+        self._load_detection_config()
+        self.logger.info(f"Detection config updated: {len(self.location_matcher)} location and "
+                         f"{len(self.argument_matcher)} argument patterns")
+    
+    def try_setup_signatures(self):
+        self.signatures = None
+        signatures = self.config.get('signatures', {})
+        path = signatures.get('path', './data/signatures')
+        if not signatures.get('enabled', True) or not os.path.isdir(path):
+            return
+        
+        try:
+            self.signatures = SignatureScanner(
+                path,
+                workers=signatures.get('workers', 2),
+                parallel_threshold=signatures.get('parallel_threshold_mb', 32) * 1024 * 1024
+            )
+        except Exception as e:
+            self.logger.error(f"Error loading local signatures, local scanning disabled: {str(e)}")
+    
+    def try_setup_reputation(self):
+        self.ip_reputation = None
+        reputation = self.config.get('reputation', {})
+        path = reputation.get('path', './data/blocklists')
+        if not reputation.get('enabled', True) or not os.path.isdir(path):
+            return
+        
+        try:
+            self.ip_reputation = IPReputation(path, reload_interval=reputation.get('reload_interval', 60))
+            self.ip_reputation.start()
+        except Exception as e:
+            self.logger.error(f"Error loading IP blocklists, reputation checks disabled: {str(e)}")
+    
+    def try_setup_rules(self):
+        self.rules = None
+        rules = self.config.get('rules', {})
+        path = rules.get('path', './rules')
+        if not rules.get('enabled', True) or not os.path.isdir(path):
+            return
+        
+        try:
+            self.rules = RuleEngine(path, reload_interval=rules.get('reload_interval', 30))
+            self.rules.start()
+        except Exception as e:
+            self.logger.error(f"Error loading detection rules, rule engine disabled: {str(e)}")
+    
+    def try_setup_correlation(self):
+        self.correlator = None
+        correlation = self.config.get('correlation', {})
+        if not correlation.get('enabled', True) or not correlation.get('sequences'):
+            return
+        
+        sequences = []
+        for data in correlation['sequences']:
+            try:
+                sequences.append(Sequence.from_dict(data, correlation.get('window', 60)))
+            except RuleError as e:
+                self.logger.error(f"Skipping correlation sequence: {str(e)}")
+        if not sequences:
+            return
+        
+        try:
+            self.correlator = Correlator(
+                sequences,
+                self._on_incident,
+                lateness=correlation.get('lateness', 10),
+                max_runs=correlation.get('max_runs', 10000),
+                checkpoint_file=correlation.get('checkpoint_file', './data/correlation.json'),
+                checkpoint_interval=correlation.get('checkpoint_interval', 60)
+            )
+            self.correlator.start()
+            self.logger.info(f"Correlation enabled with {len(sequences)} sequences")
+        except Exception as e:
+            self.logger.error(f"Error setting up correlation, disabled: {str(e)}")
+    
     def try_setup_clamav(self):
+        self.clamav = None
+        clamav = self.config.get('clamav', {})
+        if not clamav.get('enabled', True):
+            return
+        
+        # A unix socket path takes precedence over host and port
+        address = clamav.get('socket') or (clamav.get('host', '127.0.0.1'), clamav.get('port', 3310))
+        self.clamav = ClamdClient(
+            address,
+            pool_size=clamav.get('pool_size', 2),
+            batch_size=clamav.get('batch_size', 16),
+            timeout=clamav.get('timeout', 30),
+            stream=clamav.get('stream', False),
+            max_backoff=clamav.get('max_backoff', 300)
+        )
+        self.clamav.start()
+        
+        # Scanning stays enabled if clamd is down, the client reconnects on its own
         try:
-            self.clamav = clamd.ClamdNetworkSocket()
             self.clamav.ping()
-            self.clamav_enabled = True
             self.logger.info("ClamAV connection established")
         except Exception as e:
-            self.logger.warning(f"ClamAV connection failed, virus scanning disabled: {str(e)}")
-            self.clamav_enabled = False
+            self.logger.warning(f"ClamAV is not available yet, will retry in background: {str(e)}")
+    
+    def try_setup_virustotal(self):
+        self.vt_client = None
+        if not self.vt_api_key:
+            return
+        
+        vt = self.config.get('virustotal', {})
+        self.vt_client = VirusTotalClient(
+            self.vt_api_key,
+            base_url=vt.get('base_url', 'https://www.virustotal.com/api/v3'),
+            tier=vt.get('tier', 'public'),
+            requests_per_minute=vt.get('requests_per_minute'),
+            burst=vt.get('burst'),
+            timeout=(vt.get('connect_timeout', 5), vt.get('read_timeout', 15)),
+            pool_size=vt.get('pool_size', 4),
+            workers=vt.get('workers', 1),
+            cache_file=vt.get('cache_file', './data/vt_cache.json'),
+            ttl=vt.get('cache_ttl'),
+            max_pending=vt.get('max_pending', 10000)
+        )
+        self.vt_client.start()
+        self.logger.info(f"VirusTotal lookups enabled ({vt.get('tier', 'public')} tier)")
     
     def handle_system_startup(self, event_data):
         self.logger.info(f"System startup detected: {event_data['time']}")
         
-        self.today_events['startup'].append({
+        self._store_event('startup', {
             'time': event_data['time'],
             'description': event_data['description']
         })
         
-        self._save_event_data()
-        
         # Send notification to Telegram
         message = f"🖥️ Обнаружено включение компьютера\nВремя: {event_data['time']}\nКомпьютер: {event_data['computer']}"
-        self.telegram.send_message(message)
+        self.alerts.send('startup', message)
     
     def handle_user_login(self, event_data):
         login_type_str = {
@@ -68,22 +314,94 @@ class EventHandler:
             '10': 'Удаленный доступ (RDP)'
         }.get(event_data.get('login_type', ''), 'Неизвестный')
         
-        username = event_data.get('username', 'Неизвестный пользователь')
+        username = event_data.get('username') or 'Неизвестный пользователь'
+        host = source_host(event_data.get('source_ip'), event_data.get('workstation'))
+        
+        result = self.login_baselines.score(username, event_data.get('login_type', ''), host, event_data['timestamp'])
+        reasons = [self._login_reason(reason) for reason in result['reasons'] if reason['score'] >= 0.5]
         
-        self.logger.info(f"User login: {username} ({login_type_str}) at {event_data['time']}")
+        self.logger.info(f"User login: {username} ({login_type_str}) at {event_data['time']}, score {result['score']}")
         
-        self.today_events['login'].append({
+        self._store_event('login', {
             'time': event_data['time'],
             'username': username,
             'login_type': login_type_str,
+            'source': host,
+            'score': result['score'],
+            'anomalous': result['anomalous'],
+            'reasons': reasons,
             'description': event_data['description']
         })
         
-        self._save_event_data()
+        # Without a baseline a login cannot be judged usual, so users that are
+        # new or still being learned are reported in the 'anomalous' mode too
+        if self.login_alert_mode == 'anomalous' and not result['anomalous'] and not result['learning']:
+            return
         
         # Send notification to Telegram
-        message = f"👤 Вход в систему\nПользователь: {username}\nТип входа: {login_type_str}\nВремя: {event_data['time']}"
-        self.telegram.send_message(message)
+        if result['anomalous']:
+            title = "⚠️ Необычный вход в систему"
+        elif result['new_user']:
+            title = "🆕 Первый вход пользователя"
+        else:
+            title = "👤 Вход в систему"
+        message = f"{title}\nПользователь: {username}\nТип входа: {login_type_str}"
+        if host:
+            message += f"\nИсточник: {host}"
+        if result['learning']:
+            message += f"\nОценка: профиль еще собирается ({result['logins']} из {self.login_baselines.min_logins} входов)"
+        else:
+            message += f"\nОценка: {result['score']:.1f}"
+            if reasons:
+                message += f" ({'; '.join(reasons)})"
+        message += f"\nВремя: {event_data['time']}"
+        # Unusual logins are never folded into the repeats of ordinary ones
+        category = 'login_anomaly' if result['anomalous'] else 'login'
+        self.alerts.send(category, message, user=username, login_type=login_type_str)
+    
+    @staticmethod
+    def _login_reason(reason):
+        if reason['kind'] == 'time':
+            day, hour = divmod(reason['value'], 24)
+            return f"необычное время: {('пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс')[day]} {hour:02d}:00"
+        if reason['kind'] == 'type':
+            return "необычный тип входа"
+        return f"новый источник: {reason['value'] or 'локальный вход'}"
+    
+    def handle_failed_login(self, event_data):
+        username = event_data.get('username', '')
+        source_ip = event_data.get('source_ip', '')
+        
+        for burst in self.failed_logons.record(username, source_ip, event_data['timestamp']):
+            minutes = max(1, self.failed_logons.window // 60)
+            
+            if burst['kind'] == 'user':
+                self.logger.warning(f"Failed logon burst for user {burst['key']}: {burst['failures']} in {minutes} min")
+                message = f"🚫 Подбор пароля к учетной записи\nПользователь: {burst['key']}"
+                message += f"\nНеудачных входов: {burst['failures']} за {minutes} мин"
+                if burst['others']:
+                    message += f"\nИсточники: {', '.join(burst['others'][:5])}"
+                    if len(burst['others']) > 5:
+                        message += f" и еще {len(burst['others']) - 5}"
+            else:
+                self.logger.warning(f"Failed logon burst from {burst['key']}: {burst['failures']} in {minutes} min")
+                message = f"🚫 Подбор пароля с адреса {burst['key']}"
+                message += f"\nНеудачных входов: {burst['failures']} за {minutes} мин"
+                message += f"\nУчетных записей: {len(burst['others'])}"
+                if burst['others']:
+                    message += f" ({', '.join(burst['others'][:5])}{', ...' if len(burst['others']) > 5 else ''})"
+            message += f"\nВремя: {event_data['time']}"
+            
+            self._store_event('failed_login', {
+                'time': event_data['time'],
+                'kind': burst['kind'],
+                'key': burst['key'],
+                'username': username,
+                'source_ip': source_ip,
+                'failures': burst['failures'],
+                'day_failures': burst['day_failures']
+            })
+            self.alerts.send(f"failed_login:{burst['kind']}:{burst['key']}", message)
     
     def handle_privilege_elevation(self, event_data):
         if 'username' not in event_data:
@@ -91,17 +409,15 @@ class EventHandler:
         
         self.logger.info(f"Privilege elevation: {event_data['username']} at {event_data['time']}")
         
-        self.today_events['privilege'].append({
+        self._store_event('privilege', {
             'time': event_data['time'],
             'username': event_data['username'],
             'description': event_data['description']
         })
         
-        self._save_event_data()
-        
         # Send notification to Telegram, but only if it's not a normal system process
         message = f"🔑 Повышение привилегий\nПользователь: {event_data['username']}\nВремя: {event_data['time']}"
-        self.telegram.send_message(message)
+        self.alerts.send('privilege', message, user=event_data['username'])
     
     def handle_scheduled_task(self, event_data):
         # Extract task name from description (task events have a specific format)
@@ -115,25 +431,32 @@ class EventHandler:
             
             task_name = event_data['description'][task_name_start+11:task_name_end].strip()
         
+        # Task name and executable for correlation and rules
+        inserts = event_data.get('inserts', [])
+        match = TASK_COMMAND.search(inserts[5]) if len(inserts) > 5 and inserts[5] else None
+        event_data['task'] = {
+            'name': task_name,
+            'user': inserts[1] if len(inserts) > 1 else '',
+            'command': executable_path(match.group(1)) if match else ''
+        }
+        
         # Skip if in whitelist
         if task_name in self.task_whitelist:
             return
         
         self.logger.info(f"Scheduled task change: {task_name} at {event_data['time']}")
         
-        self.today_events['task'].append({
+        self._store_event('task', {
             'time': event_data['time'],
             'task_name': task_name,
             'event_id': event_data['event_id'],
             'description': event_data['description']
         })
         
-        self._save_event_data()
-        
         # Send notification to Telegram
         operation = "создана" if event_data['event_id'] == 4698 else "изменена"
         message = f"⏰ Задача планировщика {operation}\nИмя задачи: {task_name}\nВремя: {event_data['time']}"
-        self.telegram.send_message(message)
+        self.alerts.send('task', message, image=task_name)
     
     def handle_service_change(self, event_data):
         # Extract service name from description
@@ -148,6 +471,14 @@ class EventHandler:
                     service_name = line[14:].strip()
                 elif line.startswith('Service File Name:'):
                     service_path = line[19:].strip()
+        
+        # Service name and executable (ImagePath, the second insert of 7045) for correlation and rules
+        inserts = event_data.get('inserts', [])
+        event_data['service'] = {
+            'name': service_name,
+            'path': service_path,
+            'binary': executable_path(inserts[1]) if event_data['event_id'] == 7045 and len(inserts) > 1 else ''
+        }
                     
         # Skip if in whitelist
         if service_name in self.service_whitelist:
@@ -155,7 +486,7 @@ class EventHandler:
         
         self.logger.info(f"Service change: {service_name} at {event_data['time']}")
         
-        self.today_events['service'].append({
+        self._store_event('service', {
             'time': event_data['time'],
             'service_name': service_name,
             'service_path': service_path,
@@ -163,21 +494,14 @@ class EventHandler:
             'description': event_data['description']
         })
         
-        self._save_event_data()
-        
-        # Check if service executable is suspicious
-        is_suspicious = False
-        if os.path.exists(service_path):
-            is_suspicious = self._check_file_suspicious(service_path)
-        
         # Send notification to Telegram
         operation = "установлена" if event_data['event_id'] == 7045 else "изменена"
         message = f"🔧 Служба Windows {operation}\nИмя службы: {service_name}\nПуть: {service_path}\nВремя: {event_data['time']}"
+        self.alerts.send('service', message, image=service_path)
         
-        if is_suspicious:
-            message += "\n⚠️ Служба помечена как подозрительная!"
-            
-        self.telegram.send_message(message)
+        # Check service executable in the background, verdict is sent as a follow-up
+        if os.path.exists(service_path):
+            self.scanner.submit(service_path, {'kind': 'service', 'name': service_name})
     
     def handle_process_creation(self, event_data):
         if 'process' not in event_data:
@@ -188,36 +512,63 @@ class EventHandler:
         command_line = process.get('command_line', '')
         username = process.get('user', 'Неизвестный')
         
+        # Every process goes into the tree, whitelisted ones can still be ancestors
+        node = self.process_tree.add(
+            process.get('process_guid'), process.get('process_id'), image_path, command_line, process.get('user', ''),
+            parent_guid=process.get('parent_process_guid'), parent_pid=process.get('parent_process_id'),
+            parent_image=process.get('parent_image', ''), parent_command_line=process.get('parent_command_line', ''),
+            started=event_data['timestamp']
+        )
+        
+        # Ancestor names, root first, for rules and alerts
+        chain = [ancestor.name for ancestor in reversed(self.process_tree.ancestors(node))] if node else []
+        process['ancestors'] = ' > '.join(chain)
+        
+        # Whitelisted processes are counted too, the summaries show what runs most
+        self.heavy_hitters.add('images', image_path.lower(), event_data['timestamp'])
+        parent_image = process.get('parent_image', '')
+        if parent_image and image_path:
+            pair = f"{os.path.basename(parent_image)} → {os.path.basename(image_path)}".lower()
+            self.heavy_hitters.add('parent_child', pair, event_data['timestamp'])
+        
         # Skip if in whitelist
         if self._is_process_whitelisted(image_path):
             return
         
         # Check if process is suspicious
-        is_suspicious = self._is_process_suspicious(image_path, command_line)
+        reasons = self._is_process_suspicious(image_path, command_line)
         
-        if is_suspicious:
-            self.logger.warning(f"Suspicious process: {image_path} by {username} at {event_data['time']}")
+        if reasons:
+            self.logger.warning(f"Suspicious process: {image_path} by {username} at {event_data['time']} ({'; '.join(reasons)})")
             
-            self.today_events['suspicious_process'].append({
+            self._store_event('suspicious_process', {
                 'time': event_data['time'],
                 'image': image_path,
                 'command_line': command_line,
                 'username': username,
-                'reason': 'Suspicious process behavior or location'
+                'reason': '; '.join(reasons)
             })
             
-            self._save_event_data()
-            
-            # Check if file is malicious
-            malware_result = self._check_file_suspicious(image_path)
-            
             # Send notification to Telegram
             message = f"⚠️ Подозрительный процесс\nПроцесс: {os.path.basename(image_path)}\nПуть: {image_path}\nПользователь: {username}\nВремя: {event_data['time']}"
+            if chain:
+                message += f"\nЦепочка: {' → '.join(chain + [os.path.basename(image_path)])}"
+            message += f"\nПризнаки: {'; '.join(reasons)}"
+            self.alerts.send('suspicious_process', message, user=username, image=image_path)
             
-            if malware_result:
-                message += f"\n🚨 Результат проверки: {malware_result}"
-                
-            self.telegram.send_message(message)
+            # Check file in the background, verdict is sent as a follow-up
+            self.scanner.submit(image_path, {'kind': 'process', 'name': os.path.basename(image_path)})
+    
+    def handle_process_exit(self, event_data):
+        if 'process' not in event_data:
+            return
+        
+        self.process_tree.exit(event_data['process'].get('process_guid'), event_data['timestamp'])
+    
+    def handle_file_creation(self, event_data):
+        # Files created by processes are not alerted on by themselves, they feed rules and correlation
+        if 'file' in event_data:
+            self.logger.debug(f"File created: {event_data['file'].get('target_filename')} by {event_data['file'].get('image')}")
     
     def handle_network_connection(self, event_data):
         if 'network' not in event_data:
@@ -228,173 +579,303 @@ class EventHandler:
         dst_ip = network.get('dst_ip', '')
         dst_port = network.get('dst_port', '')
         
+        # Every connection is counted, not only the suspicious ones
+        if dst_ip:
+            self.heavy_hitters.add('destinations', f"{dst_ip}:{dst_port}", event_data['timestamp'])
+        
         # Check if network connection is suspicious
-        is_suspicious = self._is_network_suspicious(image_path, dst_ip, dst_port)
+        reasons = self._is_network_suspicious(image_path, dst_ip, dst_port)
         
-        if is_suspicious:
-            self.logger.warning(f"Suspicious network connection: {image_path} -> {dst_ip}:{dst_port} at {event_data['time']}")
+        if reasons:
+            self.logger.warning(f"Suspicious network connection: {image_path} -> {dst_ip}:{dst_port} at {event_data['time']} ({'; '.join(reasons)})")
             
             # We could add this to a separate category of events
-            self.today_events['suspicious_process'].append({
+            self._store_event('suspicious_process', {
                 'time': event_data['time'],
                 'image': image_path,
                 'connection': f"{dst_ip}:{dst_port}",
-                'reason': 'Suspicious network connection'
+                'reason': '; '.join(reasons)
             })
             
-            self._save_event_data()
-            
             # Send notification to Telegram
             message = f"🌐 Подозрительное сетевое соединение\nПроцесс: {os.path.basename(image_path)}\nНазначение: {dst_ip}:{dst_port}\nВремя: {event_data['time']}"
-            self.telegram.send_message(message)
+            message += f"\nПризнаки: {'; '.join(reasons)}"
+            self.alerts.send('network', message, image=image_path, destination=f"{dst_ip}:{dst_port}")
+    
+    def handle_rules(self, event_data):
+        if not self.rules:
+            return
+        
+        for rule in self.rules.evaluate(event_data['log_type'], event_data['event_id'], event_data):
+            self._on_rule_match(rule, event_data)
+    
+    def _on_rule_match(self, rule, event_data):
+        details = event_data.get('process') or event_data.get('network') or {}
+        image_path = details.get('image', '')
+        username = details.get('user') or event_data.get('username') or ''
+        
+        self.logger.warning(f"Rule {rule.id} matched {event_data['log_type']} event {event_data['event_id']} at {event_data['time']}")
+        
+        record = {
+            'time': event_data['time'],
+            'image': image_path,
+            'username': username,
+            'rule': rule.id,
+            'reason': f"Rule {rule.id}: {rule.title}"
+        }
+        if details.get('command_line'):
+            record['command_line'] = details['command_line']
+        if details.get('dst_ip'):
+            record['connection'] = f"{details['dst_ip']}:{details.get('dst_port', '')}"
+        self._store_event('suspicious_process', record)
+        
+        # Send notification to Telegram
+        message = f"📐 Сработало правило обнаружения\nПравило: {rule.title}\nВажность: {rule.severity}"
+        if image_path:
+            message += f"\nПроцесс: {os.path.basename(image_path)}\nПуть: {image_path}"
+        if details.get('ancestors'):
+            message += f"\nЦепочка: {details['ancestors'].replace(' > ', ' → ')} → {os.path.basename(image_path)}"
+        if 'connection' in record:
+            message += f"\nНазначение: {record['connection']}"
+        if username:
+            message += f"\nПользователь: {username}"
+        message += f"\nВремя: {event_data['time']}"
+        self.alerts.send(f"rule:{rule.id}", message, user=username, image=image_path)
+    
+    def handle_correlation(self, event_data):
+        if not self.correlator:
+            return
+        
+        self.correlator.process(event_data['log_type'], event_data['event_id'], event_data)
+    
+    def _on_incident(self, sequence, host, trail):
+        first_time, _, first_value = trail[0]
+        last_time = trail[-1][0]
+        
+        self.logger.warning(f"Incident {sequence.id} on {host}: {len(trail)} steps within {last_time - first_time}s")
+        
+        steps = []
+        for timestamp, title, value in trail:
+            step = f"{datetime.datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')} {title}"
+            steps.append(f"{step}: {value}" if value else step)
+        time_text = datetime.datetime.fromtimestamp(last_time).strftime('%Y-%m-%d %H:%M:%S')
+        
+        self._store_event('suspicious_process', {
+            'time': time_text,
+            'image': first_value,
+            'username': '',
+            'incident': sequence.id,
+            'computer': host,
+            'steps': steps,
+            'reason': f"Incident {sequence.id}: {sequence.title}"
+        })
+        
+        # Send notification to Telegram
+        message = f"🧩 Инцидент: {sequence.title}\nВажность: {sequence.severity}\nКомпьютер: {host}\nШаги:"
+        for number, step in enumerate(steps, 1):
+            message += f"\n{number}. {step}"
+        message += f"\nВремя: {time_text}"
+        self.alerts.send(f"incident:{sequence.id}", message, image=first_value)
     
     def _is_process_whitelisted(self, image_path):
-        if not image_path:
-            return False
-            
-        # Check exact match
-        if image_path in self.process_whitelist:
-            return True
-            
-        # Check basename match
-        basename = os.path.basename(image_path).lower()
-        if basename in (os.path.basename(p).lower() for p in self.process_whitelist):
-            return True
-            
-        return False
+        # Full path, basename, glob and regex entries in one lookup
+        return self.process_whitelist.matches(image_path)
     
     def _is_process_suspicious(self, image_path, command_line):
+        """
+        Returns the list of matched indicators (empty if the process looks normal).
+        Each field is scanned once, whatever the number of patterns.
+        """
         if not image_path:
-            return False
-            
-        # Check for processes running from suspicious locations
-        suspicious_locations = [
-            r'\temp\\', r'\windows\temp\\', r'\appdata\local\temp\\',
-            r'\users\public\\', r'\programdata\\', r'\downloads\\'
-        ]
+            return []
         
-        image_path_lower = image_path.lower()
-        
-        for location in suspicious_locations:
-            if location in image_path_lower:
-                return True
-                
-        # Check for suspicious command line arguments
-        suspicious_args = [
-            '-enc', '-encodedcommand', '-windowstyle hidden', 
-            'iex(', 'invoke-expression', 'downloadstring',
-            'bypass', 'hidden', 'webclient'
-        ]
+        reasons = [f"Suspicious location: {pattern}" for pattern in self.location_matcher.find_all(image_path)]
         
         if command_line:
-            command_line_lower = command_line.lower()
-            for arg in suspicious_args:
-                if arg in command_line_lower:
-                    return True
+            reasons += [f"Suspicious argument: {pattern}" for pattern in self.argument_matcher.find_all(command_line)]
         
-        return False
+        return reasons
     
     def _is_network_suspicious(self, image_path, dst_ip, dst_port):
+        """Returns the list of matched indicators (empty if the connection looks normal)"""
+        reasons = []
+        
         # Suspicious ports
         suspicious_ports = ['4444', '1337', '31337', '8080', '8000']
         
         if dst_port in suspicious_ports:
-            return True
-            
-        # Could add more checks here, like IP reputation lookup
-        return False
+            reasons.append(f"Suspicious port: {dst_port}")
+        
+        # Local IP reputation lists
+        if self.ip_reputation and dst_ip:
+            blocklist = self.ip_reputation.lookup(dst_ip)
+            if blocklist:
+                reasons.append(f"Blocklisted address: {blocklist}")
+        
+        return reasons
     
-    def _check_file_suspicious(self, file_path):
+    def _on_scan_result(self, file_path, verdict, contexts):
+        if not verdict and not self.notify_clean:
+            return
+        
+        context = contexts[0] or {}
+        if context.get('kind') == 'service':
+            title = f"Служба: {context.get('name')}"
+        else:
+            title = f"Процесс: {context.get('name', os.path.basename(file_path))}"
+        
+        if verdict:
+            self.logger.warning(f"Malicious file detected: {file_path} ({verdict})")
+            message = f"🚨 Результат проверки файла\n{title}\nПуть: {file_path}\n{verdict}"
+        else:
+            message = f"✅ Результат проверки файла\n{title}\nПуть: {file_path}\nУгроз не обнаружено"
+        
+        # Coalesced requests share one scan and one follow-up message
+        if len(contexts) > 1:
+            message += f"\nСрабатываний за время проверки: {len(contexts)}"
+        
+        self.telegram.send_message(message)
+    
+    def _check_file_suspicious(self, file_path, context=None):
         if not os.path.exists(file_path):
             return False
-            
-        result = ""
         
-        # Try ClamAV first
-        if self.clamav_enabled:
-            try:
-                scan_result = self.clamav.scan_file(file_path)
-                if scan_result and file_path in scan_result:
-                    if scan_result[file_path][0] == 'FOUND':
-                        result = f"ClamAV: {scan_result[file_path][1]}"
-                        return result
-            except Exception as e:
-                self.logger.error(f"ClamAV scan error: {str(e)}")
+        try:
+            file_hash = self._get_file_hash(file_path)
+        except Exception as e:
+            self.logger.error(f"Error hashing {file_path}: {str(e)}")
+            file_hash = None
         
-        # Try VirusTotal if API key provided
-        if self.vt_api_key:
+        # The local signature database needs no external service and is checked first
+        if self.signatures:
             try:
-                file_hash = self._get_file_hash(file_path)
-                vt_result = self._check_virustotal(file_hash)
-                if vt_result:
-                    result = f"VirusTotal: {vt_result}"
-                    return result
+                name = self.signatures.scan(file_path, file_hash)
+                if name:
+                    return f"Локальная база: {name}"
             except Exception as e:
-                self.logger.error(f"VirusTotal check error: {str(e)}")
+                self.logger.error(f"Local signature scan error: {str(e)}")
+        
+        # ClamAV and VirusTotal checks are queued, the verdict is returned as a Future
+        result = Future()
+        
+        # Try ClamAV first
+        if self.clamav:
+            scan = self.clamav.submit(file_path, file_hash)
+            scan.add_done_callback(lambda future: self._after_clamav(future.result(), file_hash, context, result))
+        else:
+            self._after_clamav(None, file_hash, context, result)
         
         return result
     
+    def _after_clamav(self, signature, file_hash, context, result):
+        if signature:
+            result.set_result(f"ClamAV: {signature}")
+            return
+        
+        # Try VirusTotal if API key provided, service binaries are looked up first
+        if self.vt_client and file_hash:
+            priority = PRIORITY_HIGH if context and context.get('kind') == 'service' else PRIORITY_NORMAL
+            lookup = self._check_virustotal(file_hash, priority)
+            lookup.add_done_callback(lambda future: result.set_result(future.result()))
+        else:
+            result.set_result("")
+    
     def _get_file_hash(self, file_path):
-        import hashlib
+        # Frequently launched binaries are hashed once per modification
+        return self.hash_cache.get(file_path)
+    
+    def _check_virustotal(self, file_hash, priority=PRIORITY_NORMAL):
+        # The lookup waits for the rate limiter, so the verdict is returned as a Future
+        lookup = self.vt_client.lookup(file_hash, priority)
+        result = Future()
+        lookup.add_done_callback(lambda future: result.set_result(self._format_virustotal(future)))
+        return result
+    
+    def _format_virustotal(self, lookup):
+        if lookup.exception() is not None:
+            self.logger.error(f"VirusTotal API error: {str(lookup.exception())}")
+            return ""
         
-        sha256_hash = hashlib.sha256()
+        verdict = lookup.result()
+        if verdict['status'] != 'malicious':
+            return ""
         
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-                
-        return sha256_hash.hexdigest()
+        return (f"VirusTotal: Обнаружено {verdict['malicious']} вредоносных и "
+                f"{verdict['suspicious']} подозрительных детектирований из {verdict['total']}")
     
-    def _check_virustotal(self, file_hash):
-        if not self.vt_api_key:
-            return None
+    def _store_event(self, category, record):
+        # Handlers run on several worker threads
+        with self.lock:
+            current_date = datetime.datetime.now().strftime('%Y-%m-%d')
             
-        url = f"https://www.virustotal.com/api/v3/files/{file_hash}"
-        headers = {
-            "x-apikey": self.vt_api_key
-        }
-        
-        try:
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                if 'data' in result and 'attributes' in result['data']:
-                    stats = result['data']['attributes'].get('last_analysis_stats', {})
-                    malicious = stats.get('malicious', 0)
-                    suspicious = stats.get('suspicious', 0)
-                    total = sum(stats.values())
-                    
-                    if malicious > 0 or suspicious > 0:
-                        return f"Обнаружено {malicious} вредоносных и {suspicious} подозрительных детектирований из {total}"
+            # Reset events and compact yesterday's journal if day changed
+            if current_date != self.today_date:
+                self.store.compact(self.today_date)
+                self.today_events = empty_day()
+                self.today_counts = {}
+                self.today_date = current_date
             
-            return None
-        except Exception as e:
-            self.logger.error(f"VirusTotal API error: {str(e)}")
-            return None
-    
-    def _save_event_data(self):
-        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        
-        # Reset events if day changed
-        if current_date != self.today_date:
-            self.today_events = {
-                'startup': [],
-                'login': [],
-                'privilege': [],
-                'task': [],
-                'service': [],
-                'suspicious_process': []
-            }
-            self.today_date = current_date
+            self.today_events[category].append(record)
+            self.today_counts[category] = self.today_counts.get(category, 0) + 1
+            self.latest_events.append({
+                'type': category,
+                'time': record.get('time', ''),
+                'details': record
+            })
+            
+            try:
+                self.store.append(self.today_date, category, record)
+            except Exception as e:
+                self.logger.error(f"Error saving event data: {str(e)}")
+    
+    def _init_live_view(self):
+        latest = []
         
-        # Save to JSON file
-        file_path = self.storage_path / f"events_{current_date}.json"
+        for category, events in self.today_events.items():
+            self.today_counts[category] = len(events)
+            for event in events:
+                if 'time' in event:
+                    latest.append({'type': category, 'time': event['time'], 'details': event})
         
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.today_events, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.logger.error(f"Error saving event data: {str(e)}")
+        latest.sort(key=lambda x: x['time'])
+        self.latest_events.extend(latest[-self.latest_events.maxlen:])
+    
+    def close(self):
+        self.alerts.stop()
+        self.scanner.shutdown()
+        if self.signatures:
+            self.signatures.close()
+        if self.ip_reputation:
+            self.ip_reputation.stop()
+        if self.rules:
+            self.rules.stop()
+        if self.correlator:
+            self.correlator.stop()
+        self.heavy_hitters.stop()
+        self.login_baselines.stop()
+        if self.clamav:
+            self.clamav.stop()
+        if self.vt_client:
+            self.vt_client.stop()
+        self.hash_cache.save()
+        self.store.close()
+    
+    def get_stats(self):
+        return {
+            'alerts': self.alerts.get_stats(),
+            'scanner': self.scanner.get_stats(),
+            'hash_cache': self.hash_cache.get_stats(),
+            'virustotal': self.vt_client.get_stats() if self.vt_client else None,
+            'clamav': self.clamav.get_stats() if self.clamav else None,
+            'signatures': self.signatures.get_stats() if self.signatures else None,
+            'reputation': self.ip_reputation.get_stats() if self.ip_reputation else None,
+            'rules': self.rules.get_stats() if self.rules else None,
+            'correlation': self.correlator.get_stats() if self.correlator else None,
+            'process_tree': self.process_tree.get_stats(),
+            'failed_logons': self.failed_logons.get_stats(),
+            'heavy_hitters': self.heavy_hitters.get_stats(),
+            'login_baselines': self.login_baselines.get_stats()
+        }
     
     def get_system_status(self):
         # Get system uptime
@@ -409,24 +890,9 @@ class EventHandler:
         
         uptime_formatted = f"{int(days)}д {int(hours)}ч {int(minutes)}м"
         
-        # Get latest events
-        latest_events = []
-        
-        for category in self.today_events:
-            events = self.today_events[category]
-            for event in events:
-                if 'time' in event:
-                    latest_events.append({
-                        'type': category,
-                        'time': event['time'],
-                        'details': event
-                    })
-        
-        # Sort by time (latest first)
-        latest_events.sort(key=lambda x: x['time'], reverse=True)
-        
-        # Take only 5 latest events
-        latest_events = latest_events[:5]
+        # Latest events come from the ring buffer, newest first
+        with self.lock:
+            latest_events = list(reversed(self.latest_events))
         
         return {
             'uptime': uptime_formatted,
@@ -436,31 +902,80 @@ class EventHandler:
             'hostname': os.environ.get('COMPUTERNAME', 'Unknown')
         }
     
+    def get_process_tree(self, query, limit=3):
+        """
+        Returns the processes matching a PID or image name with their
+        ancestry (root first) and children, for the /proctree command.
+        """
+        def describe(node):
+            return {
+                'pid': node.pid,
+                'image': node.image,
+                'command_line': node.command_line,
+                'user': node.user,
+                'started': datetime.datetime.fromtimestamp(node.started).strftime('%Y-%m-%d %H:%M:%S') if node.started else None,
+                'exited': datetime.datetime.fromtimestamp(node.exited).strftime('%Y-%m-%d %H:%M:%S') if node.exited else None
+            }
+        
+        return [
+            {
+                'process': describe(node),
+                'ancestors': [describe(ancestor) for ancestor in reversed(self.process_tree.ancestors(node))],
+                'children': [describe(child) for child in self.process_tree.children(node)]
+            }
+            for node in self.process_tree.find(query, limit=limit)
+        ]
+    
+    def query_events(self, start=None, end=None, category=None, username=None, image=None, limit=100):
+        """
+        Returns stored events in [start, end) filtered by category, user and image.
+        start/end may be epoch seconds, datetime objects or date/time strings.
+        """
+        return self.store.query(start, end, category=category, username=username, image=image, limit=limit)
+    
     def get_daily_report(self, date=None):
         if date is None:
             date = datetime.datetime.now().strftime('%Y-%m-%d')
             
+        # Today's summary comes from the live counters
+        with self.lock:
+            if date == self.today_date:
+                counts = dict(self.today_counts)
+                events = dict(self.today_events)
+                return {
+                    'date': date,
+                    'startup_count': counts.get('startup', 0),
+                    'login_count': counts.get('login', 0),
+                    'failed_login_count': counts.get('failed_login', 0),
+                    'failed_login_top': self._failed_login_top(date, events),
+                    'top': self.heavy_hitters.get_top(date),
+                    'privilege_count': counts.get('privilege', 0),
+                    'task_count': counts.get('task', 0),
+                    'service_count': counts.get('service', 0),
+                    'suspicious_process_count': counts.get('suspicious_process', 0),
+                    'events': events
+                }
+        
         try:
-            file_path = self.storage_path / f"events_{date}.json"
-            
-            if not file_path.exists():
+            if not self.store.has_day(date):
                 return {
                     'date': date,
                     'status': 'Отчет недоступен - нет данных за указанную дату'
                 }
                 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                events = json.load(f)
-                
-            # Calculate statistics
+            # Counts cover the whole day, only the first records of each category are listed
+            counts, events = self.store.day_summary(date, REPORT_RECORDS)
             stats = {
                 'date': date,
-                'startup_count': len(events.get('startup', [])),
-                'login_count': len(events.get('login', [])),
-                'privilege_count': len(events.get('privilege', [])),
-                'task_count': len(events.get('task', [])),
-                'service_count': len(events.get('service', [])),
-                'suspicious_process_count': len(events.get('suspicious_process', [])),
+                'startup_count': counts.get('startup', 0),
+                'login_count': counts.get('login', 0),
+                'failed_login_count': counts.get('failed_login', 0),
+                'failed_login_top': self._failed_login_top(date, events),
+                'top': self.heavy_hitters.get_top(date),
+                'privilege_count': counts.get('privilege', 0),
+                'task_count': counts.get('task', 0),
+                'service_count': counts.get('service', 0),
+                'suspicious_process_count': counts.get('suspicious_process', 0),
                 'events': events
             }
             
@@ -471,4 +986,26 @@ class EventHandler:
             return {
                 'date': date,
                 'status': 'Ошибка при формировании отчета'
-            } 
\ No newline at end of file
+            } 
+    
+    def _failed_login_top(self, date, events):
+        """Users and source IPs with the most failed logons on date, with the day's total if known"""
+        top = self.failed_logons.get_top()
+        if top['day'] == date:
+            return top
+        
+        # Earlier days keep the daily failures stored with each burst
+        counts = {'user': {}, 'ip': {}}
+        for record in events.get('failed_login', []):
+            kind_counts = counts.get(record.get('kind'))
+            if kind_counts is not None:
+                key = record.get('key', '')
+                kind_counts[key] = max(kind_counts.get(key, 0), record.get('day_failures', 0))
+        
+        limit = self.failed_logons.top_size
+        return {
+            'day': date,
+            'failures': None,
+            'user': sorted(counts['user'].items(), key=lambda item: item[1], reverse=True)[:limit],
+            'ip': sorted(counts['ip'].items(), key=lambda item: item[1], reverse=True)[:limit]
+        }
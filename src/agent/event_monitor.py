@@ -1,34 +1,128 @@
-import win32evtlog
-import win32evtlogutil
-import win32con
-import win32security
-import datetime
 import time
-import threading
 import logging
 
+from event_reader import CheckpointStore
+from event_sources import PollingEventSource, SubscriptionEventSource
+from metrics import LatencyStats
+from message_renderer import EventData, MessageRenderer
+from event_queue import EventQueue
+
+SYSMON_CHANNEL = 'Microsoft-Windows-Sysmon/Operational'
+
+# Insert positions of Sysmon event fields (schema 4.x, RuleName first)
+SYSMON_PROCESS_CREATE_FIELDS = {
+    'process_guid': 2,
+    'process_id': 3,
+    'image': 4,
+    'original_file_name': 9,
+    'command_line': 10,
+    'current_directory': 11,
+    'user': 12,
+    'integrity_level': 16,
+    'hashes': 17,
+    'parent_process_guid': 18,
+    'parent_process_id': 19,
+    'parent_image': 20,
+    'parent_command_line': 21
+}
+
+SYSMON_PROCESS_TERMINATE_FIELDS = {
+    'process_guid': 2,
+    'process_id': 3,
+    'image': 4
+}
+
+SYSMON_NETWORK_FIELDS = {
+    'process_guid': 2,
+    'process_id': 3,
+    'image': 4,
+    'user': 5,
+    'protocol': 6,
+    'initiated': 7,
+    'src_ip': 9,
+    'src_hostname': 10,
+    'src_port': 11,
+    'dst_ip': 14,
+    'dst_hostname': 15,
+    'dst_port': 16
+}
+
+SYSMON_FILE_CREATE_FIELDS = {
+    'process_guid': 2,
+    'process_id': 3,
+    'image': 4,
+    'target_filename': 5,
+    'creation_time': 6,
+    'user': 7
+}
+
+# Insert positions of successful logon (4624) fields
+LOGON_FIELDS = {
+    'username': 5,
+    'domain': 6,
+    'login_type': 8,
+    'workstation': 11,
+    'source_ip': 18
+}
+
+# Insert positions of failed logon fields: 4625 (logon failure) and 4771 (Kerberos pre-authentication failure)
+FAILED_LOGON_FIELDS = {
+    4625: {'username': 5, 'domain': 6, 'status': 7, 'sub_status': 9, 'login_type': 10, 'workstation': 13,
+           'source_ip': 19},
+    4771: {'username': 0, 'status': 4, 'source_ip': 6}
+}
+
+
+def parse_inserts(inserts, fields):
+    """Maps event inserts onto named fields, missing ones are empty strings"""
+    count = len(inserts)
+    return {name: inserts[index] if index < count else '' for name, index in fields.items()}
+
+
 class EventMonitor:
-    def __init__(self, config, event_handler):
+    def __init__(self, config, event_handler, source=None):
         self.config = config
         self.event_handler = event_handler
         self.running = False
-        self.thread = None
         self.event_sources = {
             'System': ['Service Control Manager', 'Microsoft-Windows-Power-Troubleshooter'],
             'Security': [],
-            'Microsoft-Windows-Sysmon/Operational': []
+            SYSMON_CHANNEL: []
         }
         self.event_ids = {
             'startup': [6005, 6009],  # Startup events
             'login': [4624],          # Login events
+            'failed_login': [4625, 4771],  # Failed logon, Kerberos pre-authentication failure
             'privileges': [4672],     # Privilege elevation
             'task': [4698, 4699],     # Scheduled task creation/deletion
             'service': [7045, 7040],  # Service install/modification
             'sysmon_process': [1],    # Sysmon Process creation
-            'sysmon_network': [3]     # Sysmon Network connection
+            'sysmon_process_exit': [5],  # Sysmon Process terminated
+            'sysmon_network': [3],    # Sysmon Network connection
+            'sysmon_file': [11]       # Sysmon File created
         }
-        self.last_read_time = {log: int(time.time()) for log in self.event_sources}
+        events_config = self.config.get('events', {})
+        self.mode = events_config.get('mode', 'poll')
+        self.checkpoints = CheckpointStore(events_config.get('checkpoint_file', './data/checkpoints.json'))
+        self.source = source
+        self.latency = LatencyStats()
+        self.renderer = MessageRenderer(events_config.get('message_cache_size', 1024))
+        
+        pipeline_config = self.config.get('pipeline', {})
+        self.queue = EventQueue(
+            max_size=pipeline_config.get('queue_size', 10000),
+            workers=pipeline_config.get('workers', 4),
+            overflow_policy=pipeline_config.get('overflow_policy', 'block'),
+            shed_threshold=pipeline_config.get('shed_threshold', 0.8),
+            low_priority=pipeline_config.get('low_priority', ['sysmon_network'])
+        )
         self.setup_logging()
+        self.dispatch = self._build_dispatch()
+        
+        # Rule changes on disk add or remove event routes
+        self.rules = getattr(event_handler, 'rules', None)
+        if self.rules is not None:
+            self.rules.add_listener(self._on_rules_reloaded)
         
     def setup_logging(self):
         self.logger = logging.getLogger("EventMonitor")
@@ -38,10 +132,13 @@ class EventMonitor:
         if self.running:
             return False
         
+        if self.source is None:
+            self.source = self._create_source()
+        
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        self.thread.start()
-        self.logger.info("Event monitoring started")
+        self.queue.start()
+        self.source.start(self._on_event)
+        self.logger.info(f"Event monitoring started ({self.mode} mode)")
         return True
         
     def stop(self):
@@ -49,92 +146,154 @@ class EventMonitor:
             return False
         
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5.0)
+        self.source.stop()
+        # Handle everything already read before the final checkpoint
+        self.queue.stop()
+        self.checkpoints.save()
         self.logger.info("Event monitoring stopped")
         return True
     
-    def _monitor_loop(self):
-        while self.running:
-            try:
-                for log_type, sources in self.event_sources.items():
-                    self._check_log(log_type, sources)
-            except Exception as e:
-                self.logger.error(f"Error in monitor loop: {str(e)}")
+    def update_config(self, config):
+        self.config = config
+        self.dispatch = self._build_dispatch()
+        self.logger.info(f"Configuration updated, {len(self.dispatch)} event routes active")
+    
+    def _build_dispatch(self):
+        """
+        Builds the (channel, event_id) -> (category, handler) table from the
+        enabled features. Handlers take (event, event_data).
+        """
+        features = self.config.get('features', {})
+        handler = self.event_handler
+        
+        routes = [
+            # category, channel, feature flag, handler
+            ('startup', 'System', 'track_services', lambda event, data: handler.handle_system_startup(data)),
+            ('login', 'Security', 'track_logins', self._parse_login_event),
+            ('failed_login', 'Security', 'track_logins', self._parse_failed_login_event),
+            ('privileges', 'Security', 'track_logins', lambda event, data: handler.handle_privilege_elevation(data)),
+            ('task', 'Security', 'track_services', lambda event, data: handler.handle_scheduled_task(data)),
+            ('service', 'System', 'track_services', lambda event, data: handler.handle_service_change(data)),
+            ('sysmon_process', SYSMON_CHANNEL, 'track_processes', self._parse_sysmon_process),
+            ('sysmon_process_exit', SYSMON_CHANNEL, 'track_processes', self._parse_sysmon_process_exit),
+            ('sysmon_network', SYSMON_CHANNEL, 'track_processes', self._parse_sysmon_network),
+            ('sysmon_file', SYSMON_CHANNEL, 'track_processes', self._parse_sysmon_file)
+        ]
+        
+        dispatch = {}
+        for category, channel, feature, route_handler in routes:
+            if not features.get(feature, True):
+                continue
             
-            time.sleep(10)  # Check every 10 seconds
+            for event_id in self.event_ids[category]:
+                dispatch[(channel, event_id)] = (category, route_handler)
+        
+        # Events covered by detection rules or correlation sequences go through those
+        # stages after the built-in handler (which parses the fields they refer to),
+        # or are routed only for them
+        stages = [
+            ('rules', 'Rules', getattr(handler, 'rules', None), 'handle_rules'),
+            ('correlation', 'Correlation steps', getattr(handler, 'correlator', None), 'handle_correlation')
+        ]
+        for category_name, title, engine, method in stages:
+            if engine is None:
+                continue
+            for key in engine.keys():
+                channel, event_id = key
+                if channel not in self.event_sources:
+                    self.logger.warning(f"{title} for channel {channel} are ignored, the channel is not monitored")
+                    continue
+                category, route_handler = dispatch.get(key, (category_name, None))
+                dispatch[key] = (category, self._with_stage(route_handler, getattr(handler, method)))
+        
+        return dispatch
+    
+    def _with_stage(self, route_handler, stage):
+        def handle(event, event_data):
+            if route_handler is not None:
+                route_handler(event, event_data)
+            stage(event_data)
+        return handle
     
-    def _check_log(self, log_type, sources):
-        flags = win32evtlog.EVENTLOG_BACKWARDS_READ | win32evtlog.EVENTLOG_SEQUENTIAL_READ
-        handle = win32evtlog.OpenEventLog(None, log_type)
+    def _on_rules_reloaded(self):
+        self.dispatch = self._build_dispatch()
+        self.logger.info(f"Detection rules reloaded, {len(self.dispatch)} event routes active")
+    
+    def get_stats(self):
+        return {
+            'mode': self.mode,
+            'latency': self.latency.snapshot(),
+            'messages': self.renderer.get_stats(),
+            'queue': self.queue.get_stats(),
+            'channels': self.source.get_stats() if self.source else {}
+        }
+    
+    def _create_source(self):
+        events_config = self.config.get('events', {})
+        channels = list(self.event_sources)
+        
+        if self.mode == 'subscribe':
+            return SubscriptionEventSource(channels, self.checkpoints)
+        
+        return PollingEventSource(channels, self.checkpoints, interval=events_config.get('poll_interval', 1))
+    
+    def _on_event(self, log_type, event):
+        # The checkpoint may only pass this record once it has been handled
+        record_number = event.RecordNumber
+        self.checkpoints.acquire(log_type, record_number)
+        queued = False
         
         try:
-            events = win32evtlog.ReadEventLog(handle, flags, 0)
-            if events:
-                for event in events:
-                    event_time = int(event.TimeGenerated.timestamp())
-                    
-                    # Skip older events
-                    if event_time <= self.last_read_time[log_type]:
-                        continue
-                    
-                    self.last_read_time[log_type] = event_time
-                    
-                    if not sources or event.SourceName in sources:
-                        self._process_event(log_type, event)
+            sources = self.event_sources.get(log_type)
+            if sources and event.SourceName not in sources:
+                return
+            
+            queued = self._process_event(log_type, event)
+        except Exception as e:
+            self.logger.error(f"Error processing {log_type} record {record_number}: {str(e)}")
         finally:
-            win32evtlog.CloseEventLog(handle)
+            # Skipped and shed records are done with; a record refused because the
+            # monitor is stopping stays in flight and is read again on the next start
+            if not queued and self.running:
+                self.checkpoints.release(log_type, record_number)
     
     def _process_event(self, log_type, event):
+        """Queues the event for its handler, returns True if it was queued"""
         event_id = event.EventID & 0xFFFF  # The real event ID is the lower 16 bits
         
-        event_data = {
+        # Events without a handler (or of a disabled feature) are skipped before any parsing
+        route = self.dispatch.get((log_type, event_id))
+        if route is None:
+            return False
+        
+        category, handler = route
+        
+        # The description is only rendered if a handler reads it
+        event_data = EventData(lambda: self.renderer.render(event, log_type), {
             'log_type': log_type,
             'source': event.SourceName,
             'event_id': event_id,
             'time': event.TimeGenerated.strftime('%Y-%m-%d %H:%M:%S'),
             'timestamp': int(event.TimeGenerated.timestamp()),
             'computer': event.ComputerName,
-            'description': win32evtlogutil.SafeFormatMessage(event, log_type)
-        }
+            'inserts': event.StringInserts or []
+        })
         
-        # Process depending on event type
-        if event_id in self.event_ids['startup'] and self.config['features'].get('track_services', True):
-            self.event_handler.handle_system_startup(event_data)
-            
-        elif event_id in self.event_ids['login'] and self.config['features'].get('track_logins', True):
-            # Parsing login events requires additional logic
-            if log_type == 'Security':
-                self._parse_login_event(event, event_data)
-                
-        elif event_id in self.event_ids['privileges'] and self.config['features'].get('track_logins', True):
-            self.event_handler.handle_privilege_elevation(event_data)
-            
-        elif event_id in self.event_ids['task'] and self.config['features'].get('track_services', True):
-            self.event_handler.handle_scheduled_task(event_data)
-            
-        elif event_id in self.event_ids['service'] and self.config['features'].get('track_services', True):
-            self.event_handler.handle_service_change(event_data)
-            
-        elif event_id in self.event_ids['sysmon_process'] and self.config['features'].get('track_processes', True):
-            self._parse_sysmon_process(event, event_data)
-            
-        elif event_id in self.event_ids['sysmon_network'] and self.config['features'].get('track_processes', True):
-            self._parse_sysmon_network(event, event_data)
+        def task():
+            try:
+                # Event-to-handler latency
+                self.latency.add(max(0.0, time.time() - event.TimeGenerated.timestamp()))
+                handler(event, event_data)
+            finally:
+                self.checkpoints.release(log_type, event.RecordNumber)
+        
+        # Handlers run on the worker pool so slow checks do not stall reading
+        return self.queue.submit(category, task)
     
     def _parse_login_event(self, event, event_data):
         try:
-            # Extract login type and user info
-            # For login events (4624), parse user and login type
-            event_data['login_type'] = None
-            event_data['username'] = None
-            
-            if event.StringInserts:
-                for i, data in enumerate(event.StringInserts):
-                    if i == 8:  # Login type
-                        event_data['login_type'] = data
-                    elif i == 5:  # Account Name
-                        event_data['username'] = data
+            # User, login type and where the login came from (4624)
+            event_data.update(parse_inserts(event.StringInserts or [], LOGON_FIELDS))
             
             # Filter only interactive, RDP, and unlock logins (types 2, 10, 7)
             if event_data['login_type'] in ['2', '7', '10']:
@@ -143,34 +302,52 @@ class EventMonitor:
         except Exception as e:
             self.logger.error(f"Error parsing login event: {str(e)}")
     
+    def _parse_failed_login_event(self, event, event_data):
+        try:
+            if event.StringInserts:
+                event_data.update(parse_inserts(event.StringInserts, FAILED_LOGON_FIELDS[event_data['event_id']]))
+                
+                self.event_handler.handle_failed_login(event_data)
+                
+        except Exception as e:
+            self.logger.error(f"Error parsing failed login event: {str(e)}")
+    
     def _parse_sysmon_process(self, event, event_data):
         try:
             if event.StringInserts:
-                # Extract process information
-                event_data['process'] = {
-                    'image': event.StringInserts[3] if len(event.StringInserts) > 3 else '',
-                    'command_line': event.StringInserts[10] if len(event.StringInserts) > 10 else '',
-                    'parent_image': event.StringInserts[13] if len(event.StringInserts) > 13 else '',
-                    'user': event.StringInserts[6] if len(event.StringInserts) > 6 else ''
-                }
+                # Extract process information, including the GUIDs linking it to its parent
+                event_data['process'] = parse_inserts(event.StringInserts, SYSMON_PROCESS_CREATE_FIELDS)
                 
                 self.event_handler.handle_process_creation(event_data)
                 
         except Exception as e:
             self.logger.error(f"Error parsing Sysmon process event: {str(e)}")
     
+    def _parse_sysmon_process_exit(self, event, event_data):
+        try:
+            if event.StringInserts:
+                event_data['process'] = parse_inserts(event.StringInserts, SYSMON_PROCESS_TERMINATE_FIELDS)
+                
+                self.event_handler.handle_process_exit(event_data)
+                
+        except Exception as e:
+            self.logger.error(f"Error parsing Sysmon process exit event: {str(e)}")
+    
+    def _parse_sysmon_file(self, event, event_data):
+        try:
+            if event.StringInserts:
+                event_data['file'] = parse_inserts(event.StringInserts, SYSMON_FILE_CREATE_FIELDS)
+                
+                self.event_handler.handle_file_creation(event_data)
+                
+        except Exception as e:
+            self.logger.error(f"Error parsing Sysmon file event: {str(e)}")
+    
     def _parse_sysmon_network(self, event, event_data):
         try:
             if event.StringInserts:
                 # Extract network connection information
-                event_data['network'] = {
-                    'image': event.StringInserts[3] if len(event.StringInserts) > 3 else '',
-                    'protocol': event.StringInserts[7] if len(event.StringInserts) > 7 else '',
-                    'src_ip': event.StringInserts[8] if len(event.StringInserts) > 8 else '',
-                    'src_port': event.StringInserts[9] if len(event.StringInserts) > 9 else '',
-                    'dst_ip': event.StringInserts[14] if len(event.StringInserts) > 14 else '',
-                    'dst_port': event.StringInserts[15] if len(event.StringInserts) > 15 else ''
-                }
+                event_data['network'] = parse_inserts(event.StringInserts, SYSMON_NETWORK_FIELDS)
                 
                 self.event_handler.handle_network_connection(event_data)
                 
@@ -0,0 +1,130 @@
+import time
+import queue
+import logging
+import threading
+
+from metrics import LatencyStats
+
+
+class EventQueue:
+    """
+    Bounded queue between event reading and event handling, served by a pool
+    of worker threads.
+
+    Overflow policies:
+    - 'block': the reader waits until a worker frees a slot (backpressure)
+    - 'shed': low-priority events are dropped once the queue is filled above
+      shed_threshold, all other events still block when the queue is full
+    """
+
+    def __init__(self, max_size=10000, workers=4, overflow_policy='block',
+                 shed_threshold=0.8, low_priority=None):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.max_size = max_size
+        self.workers = workers
+        self.overflow_policy = overflow_policy
+        self.shed_limit = max(1, int(max_size * shed_threshold))
+        self.low_priority = set(low_priority or [])
+        self.threads = []
+        self.running = False
+        self.wait_time = LatencyStats()
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('EventQueue')
+
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        self.threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"event-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        Stops the workers once every queued event has been handled. The
+        read checkpoints are saved after this, so nothing is left behind.
+        """
+        if not self.running:
+            return
+
+        self.running = False
+
+        # Workers finish the events already queued and exit on the sentinel;
+        # putting it waits for the workers to free a slot
+        for _ in self.threads:
+            self.queue.put(None)
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
+
+    def submit(self, category, task):
+        """
+        Queues task() for a worker. Returns False if the event was shed.
+        """
+        if (self.overflow_policy == 'shed' and category in self.low_priority
+                and self.queue.qsize() >= self.shed_limit):
+            with self.lock:
+                self.dropped[category] = self.dropped.get(category, 0) + 1
+            return False
+
+        item = (time.monotonic(), category, task)
+
+        while True:
+            try:
+                self.queue.put(item, timeout=1.0)
+                break
+            except queue.Full:
+                if not self.running:
+                    with self.lock:
+                        self.dropped[category] = self.dropped.get(category, 0) + 1
+                    return False
+
+        with self.lock:
+            self.submitted += 1
+
+        return True
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'depth': self.queue.qsize(),
+                'max_size': self.max_size,
+                'workers': self.workers,
+                'policy': self.overflow_policy,
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'failed': self.failed,
+                'dropped': dict(self.dropped),
+                'wait_time': self.wait_time.snapshot()
+            }
+
+    def _worker_loop(self):
+        while True:
+            item = self.queue.get()
+
+            if item is None:
+                self.queue.task_done()
+                break
+
+            enqueued_at, category, task = item
+            self.wait_time.add(time.monotonic() - enqueued_at)
+
+            try:
+                task()
+                with self.lock:
+                    self.processed += 1
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                self.logger.error(f"Error handling {category} event: {str(e)}")
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,255 @@
+import os
+import json
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from metrics import ChannelStats
+
+try:
+    import win32evtlog
+except ImportError:
+    win32evtlog = None
+
+
+class CheckpointStore:
+    """
+    Stores the last processed record number for every event channel.
+    The state is kept in a single JSON file and replaced atomically on save.
+
+    Readers set the last record read; records handed to the handlers are
+    marked in flight until they are handled. Only the record below which
+    every record has been handled is saved, so records still queued when
+    the agent stops or crashes are read again on the next start.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.logger = logging.getLogger('CheckpointStore')
+        self.records = self._load()
+        # channel -> record numbers in flight, in the order they were read
+        self.in_flight = {}
+
+    def _load(self):
+        if not self.path.exists():
+            return {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {str(k): int(v) for k, v in data.items()}
+        except Exception as e:
+            self.logger.error(f"Error loading checkpoints from {self.path}: {str(e)}")
+            return {}
+
+    def get(self, channel):
+        with self.lock:
+            return self.records.get(channel)
+
+    def set(self, channel, record_number):
+        with self.lock:
+            self.records[channel] = int(record_number)
+
+    def acquire(self, channel, record_number):
+        """Marks a read record as not yet handled"""
+        with self.lock:
+            self.in_flight.setdefault(channel, OrderedDict())[record_number] = None
+
+    def release(self, channel, record_number):
+        """Marks a record as handled (or deliberately skipped)"""
+        with self.lock:
+            records = self.in_flight.get(channel)
+            if records is not None:
+                records.pop(record_number, None)
+
+    def committed(self, channel):
+        """The last record number below which every record of channel has been handled"""
+        with self.lock:
+            return self._committed(channel)
+
+    def _committed(self, channel):
+        last = self.records.get(channel)
+        records = self.in_flight.get(channel)
+        if last is None or not records:
+            return last
+        return min(last, next(iter(records)) - 1)
+
+    def save(self):
+        with self.lock:
+            data = {channel: self._committed(channel) for channel in self.records}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+
+        # Channel readers run in separate threads and share the same file
+        with self.save_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self.logger.error(f"Error saving checkpoints to {self.path}: {str(e)}")
+
+
+class EventLogReader:
+    """
+    Reads an event log channel forward by record number.
+
+    Every call to drain() delivers all records written since the last
+    checkpoint, batch by batch, so nothing is lost when more events arrive
+    between polls than fit into a single ReadEventLog buffer.
+    """
+
+    def __init__(self, log_type, checkpoints, evtlog=None):
+        self.log_type = log_type
+        self.checkpoints = checkpoints
+        self.evtlog = evtlog or win32evtlog
+        self.handle = None
+        self.backlog = 0
+        self.logger = logging.getLogger('EventLogReader')
+
+        if self.evtlog is None:
+            raise RuntimeError("win32evtlog is not available")
+
+    def open(self):
+        if self.handle is None:
+            self.handle = self.evtlog.OpenEventLog(None, self.log_type)
+        return self.handle
+
+    def close(self):
+        if self.handle is not None:
+            try:
+                self.evtlog.CloseEventLog(self.handle)
+            finally:
+                self.handle = None
+
+    def _record_range(self):
+        oldest = self.evtlog.GetOldestEventLogRecord(self.handle)
+        count = self.evtlog.GetNumberOfEventLogRecords(self.handle)
+        return oldest, oldest + count - 1
+
+    def _start_record(self, oldest, newest):
+        last = self.checkpoints.get(self.log_type)
+
+        if last is None:
+            # First run: start from the current end of the log, do not replay history
+            self.checkpoints.set(self.log_type, newest)
+            self.checkpoints.save()
+            return newest
+
+        if last > newest:
+            # The log was cleared and record numbers started over
+            self.logger.warning(f"Log {self.log_type} was cleared, restarting from record {oldest}")
+            return oldest - 1
+
+        if last < oldest - 1:
+            # Records were overwritten before we could read them
+            self.logger.warning(f"Log {self.log_type} wrapped, {oldest - 1 - last} records were lost")
+            return oldest - 1
+
+        return last
+
+    def drain(self, callback):
+        """
+        Delivers every new record to callback(event) in record order.
+        Returns the number of delivered records.
+        """
+        self.open()
+
+        oldest, newest = self._record_range()
+        last = self._start_record(oldest, newest)
+        self.backlog = max(0, newest - last)
+
+        if last >= newest:
+            return 0
+
+        delivered = 0
+        seek_flags = self.evtlog.EVENTLOG_SEEK_READ | self.evtlog.EVENTLOG_FORWARDS_READ
+        sequential_flags = self.evtlog.EVENTLOG_SEQUENTIAL_READ | self.evtlog.EVENTLOG_FORWARDS_READ
+
+        events = self.evtlog.ReadEventLog(self.handle, seek_flags, last + 1)
+
+        try:
+            while events:
+                for event in events:
+                    # Seek reads may return records we have already seen
+                    if event.RecordNumber <= last:
+                        continue
+
+                    callback(event)
+                    last = event.RecordNumber
+                    delivered += 1
+
+                self.checkpoints.set(self.log_type, last)
+                self.checkpoints.save()
+                events = self.evtlog.ReadEventLog(self.handle, sequential_flags, 0)
+        finally:
+            self.checkpoints.set(self.log_type, last)
+            self.checkpoints.save()
+
+        return delivered
+
+
+class ChannelReader:
+    """
+    Long-lived reader of a single channel running in its own thread.
+
+    The log handle stays open between polls and is reopened with exponential
+    backoff after an error, so a slow or failing channel does not delay the
+    others.
+    """
+
+    def __init__(self, log_type, checkpoints, callback, interval=1.0,
+                 max_backoff=60.0, evtlog=None):
+        self.log_type = log_type
+        self.callback = callback
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.reader = EventLogReader(log_type, checkpoints, evtlog=evtlog)
+        self.stats = ChannelStats(log_type)
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger('ChannelReader')
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._read_loop, name=f"reader-{self.log_type}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5.0)
+        self.reader.close()
+
+    def _deliver(self, event):
+        self.stats.record_event(event.TimeGenerated.timestamp())
+        self.callback(self.log_type, event)
+
+    def _read_loop(self):
+        backoff = 1.0
+
+        while not self.stop_event.is_set():
+            try:
+                if self.reader.handle is None:
+                    self.reader.open()
+
+                self.reader.drain(self._deliver)
+                self.stats.record_backlog(self.reader.backlog)
+                backoff = 1.0
+                self.stop_event.wait(self.interval)
+            except Exception as e:
+                self.logger.error(f"Error reading {self.log_type}, reopening in {backoff:.0f}s: {str(e)}")
+                self.stats.record_error(e)
+
+                try:
+                    self.reader.close()
+                except Exception:
+                    self.reader.handle = None
+
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self.stats.record_reopen()
@@ -0,0 +1,254 @@
+import time
+import datetime
+import logging
+import threading
+import xml.etree.ElementTree as ET
+
+try:
+    import win32evtlog
+except ImportError:
+    win32evtlog = None
+
+from event_reader import ChannelReader
+from metrics import ChannelStats
+
+EVENT_NS = '{http://schemas.microsoft.com/win/2004/08/events/event}'
+
+
+class EventRecord:
+    """
+    Event record built from rendered event XML.
+    Exposes the same attributes as the records returned by ReadEventLog.
+    """
+
+    __slots__ = ('RecordNumber', 'EventID', 'SourceName', 'TimeGenerated',
+                 'ComputerName', 'StringInserts')
+
+    def __init__(self, record_number, event_id, source_name, time_generated,
+                 computer_name, string_inserts):
+        self.RecordNumber = record_number
+        self.EventID = event_id
+        self.SourceName = source_name
+        self.TimeGenerated = time_generated
+        self.ComputerName = computer_name
+        self.StringInserts = string_inserts
+
+
+def _parse_system_time(value):
+    # SystemTime looks like 2024-01-01T12:00:00.1234567Z
+    text = (value or '').rstrip('Z')
+    if '.' in text:
+        base, fraction = text.split('.', 1)
+        text = f"{base}.{fraction[:6]}"
+        parsed = datetime.datetime.strptime(text, '%Y-%m-%dT%H:%M:%S.%f')
+    else:
+        parsed = datetime.datetime.strptime(text, '%Y-%m-%dT%H:%M:%S')
+
+    return parsed.replace(tzinfo=datetime.timezone.utc).astimezone()
+
+
+def parse_event_xml(xml_text):
+    root = ET.fromstring(xml_text)
+    system = root.find(f'{EVENT_NS}System')
+
+    provider = system.find(f'{EVENT_NS}Provider')
+    event_id_node = system.find(f'{EVENT_NS}EventID')
+    qualifiers = int(event_id_node.get('Qualifiers') or 0)
+    time_created = system.find(f'{EVENT_NS}TimeCreated')
+
+    inserts = []
+    event_data = root.find(f'{EVENT_NS}EventData')
+    if event_data is not None:
+        inserts = [data.text or '' for data in event_data.findall(f'{EVENT_NS}Data')]
+
+    source_name = provider.get('EventSourceName') or provider.get('Name') or ''
+
+    return EventRecord(
+        int(system.findtext(f'{EVENT_NS}EventRecordID') or 0),
+        (qualifiers << 16) | int(event_id_node.text),
+        source_name,
+        _parse_system_time(time_created.get('SystemTime')),
+        system.findtext(f'{EVENT_NS}Computer') or '',
+        inserts
+    )
+
+
+class EventSource:
+    """
+    Delivers event records to a callback(log_type, record).
+    EventMonitor only depends on this interface, so any source that calls
+    the callback (including a fake one) can drive it.
+    """
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def get_stats(self):
+        return {}
+
+
+class PollingEventSource(EventSource):
+    """Runs an independent ChannelReader with its own open handle per channel."""
+
+    def __init__(self, channels, checkpoints, interval=1.0, evtlog=None):
+        self.channels = list(channels)
+        self.checkpoints = checkpoints
+        self.interval = interval
+        self.evtlog = evtlog
+        self.readers = {}
+
+    def start(self, callback):
+        for log_type in self.channels:
+            reader = ChannelReader(log_type, self.checkpoints, callback,
+                                   interval=self.interval, evtlog=self.evtlog)
+            self.readers[log_type] = reader
+            reader.start()
+
+    def stop(self):
+        for reader in self.readers.values():
+            reader.stop()
+        self.checkpoints.save()
+
+    def get_stats(self):
+        return {log_type: reader.stats.snapshot() for log_type, reader in self.readers.items()}
+
+
+class SubscriptionEventSource(EventSource):
+    """
+    Push-based source built on EvtSubscribe.
+    Windows invokes the callback as soon as an event is written to the channel.
+    Every channel has its own subscription, which is recreated with
+    exponential backoff after a subscription error.
+    """
+
+    def __init__(self, channels, checkpoints, save_interval=1.0, max_backoff=60.0, evtlog=None):
+        self.channels = list(channels)
+        self.checkpoints = checkpoints
+        self.save_interval = save_interval
+        self.max_backoff = max_backoff
+        self.evtlog = evtlog or win32evtlog
+        self.subscriptions = {}
+        self.backoff = {}
+        self.stats = {log_type: ChannelStats(log_type) for log_type in self.channels}
+        self.callback = None
+        self.running = False
+        self.last_save = 0.0
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('SubscriptionEventSource')
+
+        if self.evtlog is None:
+            raise RuntimeError("win32evtlog is not available")
+
+    def start(self, callback):
+        self.callback = callback
+        self.running = True
+
+        for log_type in self.channels:
+            self._subscribe(log_type)
+
+    def stop(self):
+        self.running = False
+
+        with self.lock:
+            subscriptions = list(self.subscriptions.values())
+            self.subscriptions = {}
+
+        for subscription in subscriptions:
+            self._close(subscription)
+
+        self.checkpoints.save()
+
+    def get_stats(self):
+        return {log_type: stats.snapshot() for log_type, stats in self.stats.items()}
+
+    def _close(self, subscription):
+        try:
+            subscription.Close()
+        except Exception:
+            pass
+
+    def _subscribe(self, log_type):
+        if not self.running:
+            return
+
+        last = self.checkpoints.get(log_type)
+
+        if last is None:
+            flags = self.evtlog.EvtSubscribeToFutureEvents
+            query = '*'
+        else:
+            # Resume right after the last processed record
+            flags = self.evtlog.EvtSubscribeStartAtOldestRecord
+            query = f'*[System[EventRecordID > {last}]]'
+
+        try:
+            subscription = self.evtlog.EvtSubscribe(
+                log_type,
+                flags,
+                Callback=self._on_event,
+                Context=log_type,
+                Query=query
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to subscribe to {log_type}: {str(e)}")
+            self._schedule_resubscribe(log_type, e)
+            return
+
+        with self.lock:
+            self.subscriptions[log_type] = subscription
+        self.logger.info(f"Subscribed to {log_type}")
+
+    def _schedule_resubscribe(self, log_type, error):
+        self.stats[log_type].record_error(error)
+
+        with self.lock:
+            subscription = self.subscriptions.pop(log_type, None)
+            delay = self.backoff.get(log_type, 1.0)
+            self.backoff[log_type] = min(delay * 2, self.max_backoff)
+
+        # This runs inside the subscription's own callback, where closing it
+        # (EvtClose) deadlocks, so the old handle is closed on the timer thread
+        if not self.running:
+            delay = 0
+        else:
+            self.logger.warning(f"Resubscribing to {log_type} in {delay:.0f}s")
+        timer = threading.Timer(delay, self._resubscribe, args=(log_type, subscription))
+        timer.daemon = True
+        timer.start()
+
+    def _resubscribe(self, log_type, old_subscription=None):
+        if old_subscription is not None:
+            self._close(old_subscription)
+
+        if not self.running:
+            return
+
+        self.stats[log_type].record_reopen()
+        self._subscribe(log_type)
+
+    def _on_event(self, reason, log_type, event_handle):
+        if reason != self.evtlog.EvtSubscribeActionDeliver:
+            self.logger.error(f"Subscription error on {log_type}: {event_handle}")
+            self._schedule_resubscribe(log_type, event_handle)
+            return
+
+        try:
+            xml_text = self.evtlog.EvtRender(event_handle, self.evtlog.EvtRenderEventXml)
+            record = parse_event_xml(xml_text)
+        except Exception as e:
+            self.logger.error(f"Error rendering {log_type} event: {str(e)}")
+            self.stats[log_type].record_error(e)
+            return
+
+        self.backoff.pop(log_type, None)
+        self.stats[log_type].record_event(record.TimeGenerated.timestamp())
+        self.callback(log_type, record)
+
+        self.checkpoints.set(log_type, record.RecordNumber)
+        now = time.monotonic()
+        if now - self.last_save >= self.save_interval:
+            self.last_save = now
+            self.checkpoints.save()
@@ -0,0 +1,508 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+from pathlib import Path
+
+EVENT_CATEGORIES = ['startup', 'login', 'failed_login', 'privilege', 'task', 'service', 'suspicious_process']
+
+# Events buffered for SQLite while writes fail; the oldest are dropped beyond this
+MAX_PENDING = 100000
+
+
+def empty_day():
+    return {category: [] for category in EVENT_CATEGORIES}
+
+
+def read_journal(path, events=None):
+    """
+    Reads a JSONL journal into the daily {category: [records]} layout.
+    A truncated last line (e.g. after a crash) is skipped.
+    """
+    events = events if events is not None else empty_day()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            events.setdefault(entry['category'], []).append(entry['event'])
+
+    return events
+
+
+class JournalStore:
+    """
+    Append-only per-day event journal.
+
+    Every event is written as one JSON line to events_YYYY-MM-DD.jsonl.
+    Writes are buffered and flushed every `flush_every` events or
+    `flush_interval` seconds, optionally followed by fsync. At day rollover
+    the journal is compacted into the daily events_YYYY-MM-DD.json file.
+    """
+
+    def __init__(self, storage_path, flush_interval=1.0, flush_every=100, fsync=False):
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.file = None
+        self.file_date = None
+        self.pending = 0
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+        self.logger = logging.getLogger('JournalStore')
+
+        if self.flush_interval:
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
+
+    def journal_path(self, date):
+        return self.storage_path / f"events_{date}.jsonl"
+
+    def daily_path(self, date):
+        return self.storage_path / f"events_{date}.json"
+
+    def append(self, date, category, record):
+        line = json.dumps({'category': category, 'event': record}, ensure_ascii=False)
+
+        with self.lock:
+            if self.file_date != date:
+                self._close_file()
+                self.file = open(self.journal_path(date), 'a', encoding='utf-8')
+                self.file_date = date
+
+            self.file.write(line + '\n')
+            self.pending += 1
+
+            if self.pending >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.stop_event.set()
+        if self.flush_thread:
+            self.flush_thread.join(timeout=5.0)
+
+        with self.lock:
+            self._close_file()
+
+    def load_day(self, date):
+        """Reads a day from the compacted file and/or the journal"""
+        with self.lock:
+            if self.file_date == date:
+                self._flush()
+
+            events = empty_day()
+
+            daily_path = self.daily_path(date)
+            if daily_path.exists():
+                with open(daily_path, 'r', encoding='utf-8') as f:
+                    for category, records in json.load(f).items():
+                        events.setdefault(category, []).extend(records)
+
+            journal_path = self.journal_path(date)
+            if journal_path.exists():
+                read_journal(journal_path, events)
+
+            return events
+
+    def has_day(self, date):
+        return self.daily_path(date).exists() or self.journal_path(date).exists()
+
+    def count_by_category(self, date):
+        return {category: len(records) for category, records in self.load_day(date).items()}
+
+    def day_summary(self, date, limit=None):
+        """(counts by category, at most limit records per category) for date, from one read of the day"""
+        events = self.load_day(date)
+        counts = {category: len(records) for category, records in events.items()}
+        if limit:
+            events = {category: records[:limit] for category, records in events.items()}
+        return counts, events
+
+    def query(self, start=None, end=None, category=None, username=None, image=None, limit=100):
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        dates = sorted(set(
+            path.stem[len('events_'):]
+            for path in list(self.storage_path.glob('events_*.json')) + list(self.storage_path.glob('events_*.jsonl'))
+        ))
+        results = []
+
+        for date in dates:
+            day_start, day_end = _day_bounds(date)
+            if (start is not None and day_end <= start) or (end is not None and day_start >= end):
+                continue
+
+            for record_category, records in self.load_day(date).items():
+                if category and record_category != category:
+                    continue
+
+                for record in records:
+                    timestamp = _record_timestamp(record)
+                    if start is not None and timestamp < start:
+                        continue
+                    if end is not None and timestamp >= end:
+                        continue
+                    if username and record.get('username') != username:
+                        continue
+                    if image and record.get('image') != image:
+                        continue
+                    results.append(dict(record, category=record_category))
+
+        results.sort(key=_record_timestamp)
+        return results[:limit] if limit else results
+
+    def compact(self, date):
+        """Merges the journal of a finished day into the daily JSON file"""
+        with self.lock:
+            journal_path = self.journal_path(date)
+            if not journal_path.exists():
+                return
+
+            if self.file_date == date:
+                self._close_file()
+
+            events = self.load_day(date)
+            daily_path = self.daily_path(date)
+            tmp_path = daily_path.with_name(daily_path.name + '.tmp')
+
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(events, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, daily_path)
+                journal_path.unlink()
+                self.logger.info(f"Compacted event journal for {date}")
+            except Exception as e:
+                self.logger.error(f"Error compacting event journal for {date}: {str(e)}")
+
+    def compact_pending(self, today):
+        """Compacts journals of previous days left over e.g. after downtime at midnight"""
+        for journal_path in sorted(self.storage_path.glob('events_*.jsonl')):
+            date = journal_path.stem[len('events_'):]
+            if date != today:
+                self.compact(date)
+
+    def _flush(self):
+        if self.file is None or not self.pending:
+            return
+
+        try:
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        except Exception as e:
+            self.logger.error(f"Error flushing event journal: {str(e)}")
+
+        self.pending = 0
+
+    def _close_file(self):
+        if self.file is not None:
+            self._flush()
+            self.file.close()
+            self.file = None
+            self.file_date = None
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+def _day_bounds(date):
+    start = datetime.datetime.strptime(date, '%Y-%m-%d')
+    end = start + datetime.timedelta(days=1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _record_timestamp(record):
+    try:
+        return int(datetime.datetime.strptime(record['time'], '%Y-%m-%d %H:%M:%S').timestamp())
+    except (KeyError, TypeError, ValueError):
+        return int(time.time())
+
+
+def _to_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    if isinstance(value, str):
+        return _record_timestamp({'time': value}) if ' ' in value else _day_bounds(value)[0]
+    return int(value)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    user_id INTEGER REFERENCES users(id),
+    image_id INTEGER REFERENCES images(id),
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_category_timestamp ON events(category_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id);
+CREATE INDEX IF NOT EXISTS idx_events_image ON events(image_id);
+"""
+
+
+class SQLiteEventStore:
+    """
+    SQLite event store with the same interface as JournalStore plus SQL
+    aggregates and range queries.
+
+    Categories, users and images are kept in lookup tables; inserts are
+    buffered and written in one transaction every `flush_every` events or
+    `flush_interval` seconds. The database runs in WAL mode so report
+    queries do not block writers.
+    """
+
+    def __init__(self, db_path, flush_interval=1.0, flush_every=100):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.pending = []
+        self.dimension_ids = {'categories': {}, 'users': {}, 'images': {}}
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+        self.logger = logging.getLogger('SQLiteEventStore')
+
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+
+        if self.flush_interval:
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
+
+    def append(self, date, category, record):
+        with self.lock:
+            self.pending.append((category, record))
+            if len(self.pending) >= self.flush_every:
+                self._flush()
+
+    def append_many(self, category, records):
+        with self.lock:
+            self.pending.extend((category, record) for record in records)
+            self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.stop_event.set()
+        if self.flush_thread:
+            self.flush_thread.join(timeout=5.0)
+
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+    def compact(self, date):
+        # Rows are already in their final form
+        pass
+
+    def compact_pending(self, today):
+        pass
+
+    def has_day(self, date):
+        start, end = _day_bounds(date)
+        with self.lock:
+            self._flush()
+            row = self.conn.execute(
+                'SELECT 1 FROM events WHERE timestamp >= ? AND timestamp < ? LIMIT 1', (start, end)
+            ).fetchone()
+        return row is not None
+
+    def load_day(self, date):
+        start, end = _day_bounds(date)
+        events = empty_day()
+
+        for category, record in self._select(start, end):
+            events.setdefault(category, []).append(record)
+
+        return events
+
+    def count_by_category(self, date):
+        start, end = _day_bounds(date)
+        counts = {category: 0 for category in EVENT_CATEGORIES}
+
+        with self.lock:
+            self._flush()
+            rows = self.conn.execute(
+                'SELECT c.name, COUNT(*) FROM events e JOIN categories c ON c.id = e.category_id '
+                'WHERE e.timestamp >= ? AND e.timestamp < ? GROUP BY c.name',
+                (start, end)
+            ).fetchall()
+
+        counts.update(dict(rows))
+        return counts
+
+    def day_summary(self, date, limit=None):
+        """
+        (counts by category, at most limit records per category) for date:
+        counts are SQL aggregates and only the listed records are read
+        """
+        start, end = _day_bounds(date)
+        counts = self.count_by_category(date)
+        events = empty_day()
+        for category, count in counts.items():
+            if count:
+                events[category] = [record for _, record in self._select(start, end, category=category, limit=limit)]
+        return counts, events
+
+    def query(self, start=None, end=None, category=None, username=None, image=None, limit=100):
+        """
+        Returns events in [start, end) filtered by category, user and image.
+        start/end may be epoch seconds, datetime objects or date/time strings.
+        """
+        return [
+            dict(record, category=record_category)
+            for record_category, record in self._select(
+                _to_timestamp(start), _to_timestamp(end), category=category,
+                username=username, image=image, limit=limit
+            )
+        ]
+
+    def _select(self, start, end, category=None, username=None, image=None, limit=None):
+        sql = ('SELECT c.name, e.data FROM events e JOIN categories c ON c.id = e.category_id '
+               'LEFT JOIN users u ON u.id = e.user_id LEFT JOIN images i ON i.id = e.image_id')
+        conditions = []
+        params = []
+
+        if start is not None:
+            conditions.append('e.timestamp >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('e.timestamp < ?')
+            params.append(end)
+        if category:
+            conditions.append('c.name = ?')
+            params.append(category)
+        if username:
+            conditions.append('u.name = ?')
+            params.append(username)
+        if image:
+            conditions.append('i.path = ?')
+            params.append(image)
+
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+
+        sql += ' ORDER BY e.timestamp, e.id'
+
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.lock:
+            self._flush()
+            rows = self.conn.execute(sql, params).fetchall()
+
+        return [(name, json.loads(data)) for name, data in rows]
+
+    def _dimension_id(self, table, value):
+        if not value:
+            return None
+
+        ids = self.dimension_ids[table]
+        if value in ids:
+            return ids[value]
+
+        column = 'path' if table == 'images' else 'name'
+        self.conn.execute(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', (value,))
+        row = self.conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (value,)).fetchone()
+        ids[value] = row[0]
+        return row[0]
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, []
+
+        try:
+            with self.conn:
+                rows = [
+                    (
+                        _record_timestamp(record),
+                        self._dimension_id('categories', category),
+                        self._dimension_id('users', record.get('username')),
+                        self._dimension_id('images', record.get('image')),
+                        json.dumps(record, ensure_ascii=False, default=str)
+                    )
+                    for category, record in pending
+                ]
+                self.conn.executemany(
+                    'INSERT INTO events (timestamp, category_id, user_id, image_id, data) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            # Lookup ids may belong to a rolled back transaction
+            for ids in self.dimension_ids.values():
+                ids.clear()
+
+            # The batch goes back in front of newer events and is retried on the next flush
+            self.pending = pending + self.pending
+            dropped = len(self.pending) - MAX_PENDING
+            if dropped > 0:
+                del self.pending[:dropped]
+                self.logger.error(f"Dropped {dropped} oldest unwritten events, {MAX_PENDING} are kept")
+            self.logger.error(f"Error writing {len(pending)} events to {self.db_path}, will retry: {str(e)}")
+        except Exception as e:
+            for ids in self.dimension_ids.values():
+                ids.clear()
+            self.logger.error(f"Error preparing {len(pending)} events for {self.db_path}: {str(e)}")
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+def create_event_store(storage_config):
+    flush_interval = storage_config.get('flush_interval', 1.0)
+    flush_every = storage_config.get('flush_every', 100)
+
+    if storage_config.get('backend', 'json') == 'sqlite':
+        return SQLiteEventStore(
+            storage_config.get('sqlite_path', './data/events.db'),
+            flush_interval=flush_interval,
+            flush_every=flush_every
+        )
+
+    return JournalStore(
+        storage_config.get('path', './data/events'),
+        flush_interval=flush_interval,
+        flush_every=flush_every,
+        fsync=storage_config.get('fsync', False)
+    )
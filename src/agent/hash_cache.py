@@ -0,0 +1,140 @@
+import os
+import json
+import mmap
+import time
+import ntpath
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from metrics import RateMeter
+
+# Files at least this large are hashed through mmap instead of buffered reads
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+
+class FileHashCache:
+    """
+    SHA-256 cache for executables keyed by path and validated by
+    (size, mtime_ns, device, inode/file id), so a replaced or modified file
+    is always re-hashed. Bounded by LRU eviction and persisted as a JSON
+    file replaced atomically on save.
+    """
+
+    def __init__(self, path, max_entries=10000, read_size=1024 * 1024, save_interval=60.0):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.read_size = read_size
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.logger = logging.getLogger('FileHashCache')
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_hashed = RateMeter()
+        self.dirty = False
+        self.last_save = time.time()
+
+        self.entries = self._load()
+
+    def _load(self):
+        entries = OrderedDict()
+        if not self.path.exists():
+            return entries
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, value in data.items():
+                entries[key] = (tuple(value[0]), value[1])
+        except Exception as e:
+            self.logger.error(f"Error loading hash cache from {self.path}: {str(e)}")
+            return OrderedDict()
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        return entries
+
+    @staticmethod
+    def _identity(stat):
+        return (stat.st_size, stat.st_mtime_ns, stat.st_dev, stat.st_ino)
+
+    def get(self, file_path):
+        """Returns the SHA-256 hex digest of file_path, hashing it only on a cache miss"""
+        key = ntpath.normcase(file_path)
+        identity = self._identity(os.stat(file_path))
+
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == identity:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        digest = self._hash_file(file_path, identity[0])
+
+        # Don't cache a hash of a file that changed while it was being read
+        if self._identity(os.stat(file_path)) != identity:
+            return digest
+
+        with self.lock:
+            self.entries[key] = (identity, digest)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            save_due = time.time() - self.last_save >= self.save_interval
+
+        if save_due:
+            self.save()
+
+        return digest
+
+    def _hash_file(self, file_path, size):
+        sha256_hash = hashlib.sha256()
+
+        with open(file_path, 'rb') as f:
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    sha256_hash.update(mapped)
+            else:
+                for block in iter(lambda: f.read(self.read_size), b''):
+                    sha256_hash.update(block)
+
+        self.bytes_hashed.mark(size)
+        return sha256_hash.hexdigest()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {key: [list(identity), digest] for key, (identity, digest) in self.entries.items()}
+            self.dirty = False
+            self.last_save = time.time()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+
+        with self.save_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self.logger.error(f"Error saving hash cache to {self.path}: {str(e)}")
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'bytes_hashed_per_min': self.bytes_hashed.sum()
+            }
@@ -0,0 +1,248 @@
+import os
+import json
+import heapq
+import logging
+import datetime
+import threading
+from pathlib import Path
+
+SKETCHES = ('images', 'destinations', 'parent_child')
+
+
+class SpaceSaving:
+    """
+    Approximate most frequent keys of a stream in fixed memory (the
+    Space-Saving algorithm). At most capacity keys are counted; a new key
+    replaces one with the smallest count and inherits that count, which is
+    remembered as its possible overestimation. Any key seen more than
+    total / capacity times is guaranteed to be kept. Keys are grouped by
+    count, so an update costs O(1).
+    """
+
+    __slots__ = ('capacity', 'counts', 'errors', 'buckets', 'minimum', 'total')
+
+    def __init__(self, capacity=1000):
+        self.capacity = max(1, capacity)
+        self.counts = {}
+        self.errors = {}
+        # count -> keys with that count (a dict used as an ordered set)
+        self.buckets = {}
+        self.minimum = 0
+        self.total = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key):
+        self.total += 1
+
+        count = self.counts.get(key)
+        if count is not None:
+            self._move(key, count)
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.errors[key] = 0
+            self.buckets.setdefault(1, {})[key] = None
+            self.minimum = 1
+            return
+
+        # The key with the smallest count makes room and hands its count over
+        minimum = self.minimum
+        bucket = self.buckets[minimum]
+        victim = next(iter(bucket))
+        del bucket[victim]
+        del self.counts[victim]
+        del self.errors[victim]
+
+        self.counts[key] = minimum
+        self.errors[key] = minimum
+        bucket[key] = None
+        self._move(key, minimum)
+
+    def _move(self, key, count):
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.minimum == count:
+                self.minimum = count + 1
+
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, {})[key] = None
+
+    def top(self, limit):
+        """[(key, count, error)], most frequent first; the true count is between count - error and count"""
+        items = heapq.nlargest(limit, self.counts.items(), key=lambda item: item[1])
+        return [(key, count, self.errors[key]) for key, count in items]
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'items': [[key, count, self.errors[key]] for key, count in self.counts.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data, capacity):
+        sketch = cls(capacity)
+        items = sorted(data.get('items', []), key=lambda item: item[1], reverse=True)[:sketch.capacity]
+        for key, count, error in items:
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+            sketch.buckets.setdefault(count, {})[key] = None
+        sketch.minimum = min(sketch.buckets) if sketch.buckets else 0
+        sketch.total = data.get('total', 0)
+        return sketch
+
+
+class HeavyHitters:
+    """
+    Daily top images, destinations and parent -> child pairs.
+
+    Each summary is a SpaceSaving sketch of fixed capacity, whatever the
+    number of distinct keys. The day follows the event timestamps: the
+    first event of a new day saves the top keys of the finished day to
+    top_YYYY-MM-DD.json and starts empty sketches. The current day is saved
+    to current.json every save_interval seconds and on stop, and restored
+    on start.
+    """
+
+    def __init__(self, path='./data/top', capacity=1000, top_n=10, save_interval=300):
+        self.path = Path(path)
+        self.capacity = capacity
+        self.top_n = top_n
+        self.save_interval = save_interval
+        self.logger = logging.getLogger('HeavyHitters')
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.sketches = {name: SpaceSaving(capacity) for name in SKETCHES}
+        self.day = None
+        self.day_end = None
+
+        self.load()
+
+    def _set_day(self, day):
+        self.day = day.isoformat()
+        self.day_end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+
+    def add(self, name, key, timestamp):
+        if not key:
+            return
+
+        finished = None
+        with self.lock:
+            if self.day_end is None or timestamp >= self.day_end:
+                if self.day is not None:
+                    finished = (self.day, self._summary())
+                self._set_day(datetime.date.fromtimestamp(timestamp))
+                self.sketches = {sketch: SpaceSaving(self.capacity) for sketch in SKETCHES}
+            self.sketches[name].add(key)
+
+        if finished:
+            self._save_day(*finished)
+
+    def _summary(self):
+        return {
+            name: {'total': sketch.total, 'top': [list(item) for item in sketch.top(self.top_n)]}
+            for name, sketch in self.sketches.items()
+        }
+
+    def _day_file(self, date):
+        return self.path / f"top_{date}.json"
+
+    def _write(self, path, data):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self.logger.error(f"Error saving {path}: {str(e)}")
+
+    def _save_day(self, date, summary):
+        self._write(self._day_file(date), {'date': date, 'summary': summary})
+        self.logger.info(f"Saved top summaries for {date}")
+
+    def get_top(self, date=None, limit=None):
+        """
+        {sketch name: {'total': events, 'top': [(key, count, error)]}} for
+        date (the current day by default), None if nothing was recorded
+        """
+        limit = limit or self.top_n
+        with self.lock:
+            if date is None or date == self.day:
+                if self.day is None:
+                    return None
+                return {
+                    name: {'total': sketch.total, 'top': sketch.top(limit)}
+                    for name, sketch in self.sketches.items()
+                }
+
+        try:
+            with open(self._day_file(date), 'r', encoding='utf-8') as f:
+                summary = json.load(f)['summary']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.logger.error(f"Error loading top summaries for {date}: {str(e)}")
+            return None
+
+        return {
+            name: {'total': data['total'], 'top': [tuple(item) for item in data['top'][:limit]]}
+            for name, data in summary.items()
+        }
+
+    def save(self):
+        with self.lock:
+            if self.day is None:
+                return
+            data = {'date': self.day, 'sketches': {name: sketch.to_dict() for name, sketch in self.sketches.items()}}
+        self._write(self.path / 'current.json', data)
+
+    def load(self):
+        current = self.path / 'current.json'
+        if not current.exists():
+            return
+
+        try:
+            with open(current, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            day = datetime.date.fromisoformat(data['date'])
+            sketches = {
+                name: SpaceSaving.from_dict(data['sketches'].get(name, {}), self.capacity)
+                for name in SKETCHES
+            }
+        except Exception as e:
+            self.logger.error(f"Error loading top summaries from {current}: {str(e)}")
+            return
+
+        # The day is continued; if it is over, the first event of the new day saves it
+        self._set_day(day)
+        self.sketches = sketches
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._save_loop, name='heavy-hitters', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.save()
+
+    def _save_loop(self):
+        while not self.stop_event.wait(self.save_interval):
+            self.save()
+
+    def get_stats(self):
+        with self.lock:
+            stats = {'day': self.day}
+            for name, sketch in self.sketches.items():
+                stats[name] = {'tracked': len(sketch), 'events': sketch.total}
+            return stats
@@ -0,0 +1,250 @@
+import heapq
+import socket
+import logging
+import threading
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from socket import inet_pton, AF_INET, AF_INET6
+
+BLOCKLIST_PATTERNS = ('*.txt', '*.netset', '*.ipset')
+
+# Typecode for unsigned ints of at least 32 bits
+UINT32_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+
+
+def parse_network(text):
+    """Parses an address or CIDR range into (family, first, last) with integer bounds"""
+    address, _, prefix = text.partition('/')
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    bits = 128 if family == socket.AF_INET6 else 32
+
+    value = int.from_bytes(socket.inet_pton(family, address), 'big')
+    prefix = int(prefix) if prefix else bits
+    if not 0 <= prefix <= bits:
+        raise ValueError(f"Invalid prefix length: {text}")
+
+    host_mask = (1 << (bits - prefix)) - 1
+    first = value & ~host_mask
+    return family, first, first | host_mask
+
+
+class IntervalTable:
+    """
+    Sorted, non-overlapping address ranges with the index of the list each
+    came from. Where ranges overlap, every address keeps the lowest list
+    index covering it, so the list loaded first wins; overlapping ranges
+    are split at the boundaries where the winning list changes, and
+    adjacent ranges of the same list are merged. A lookup is one binary
+    search over the range starts; with
+    bucket_bits set, a table of the first range in every bucket of the
+    top address bits narrows that search to a few comparisons.
+    """
+
+    def __init__(self, ranges, typecode=None, address_bits=32, bucket_bits=0):
+        starts, ends, labels = [], [], []
+
+        # Sweep over the ranges by start, keeping the ranges covering the
+        # current address in a heap ordered by list index
+        ranges = sorted(ranges)
+        active = []
+        index = 0
+        position = 0
+        while index < len(ranges) or active:
+            if not active:
+                position = max(position, ranges[index][0])
+            while index < len(ranges) and ranges[index][0] <= position:
+                first, last, label = ranges[index]
+                heapq.heappush(active, (label, last))
+                index += 1
+            while active and active[0][1] < position:
+                heapq.heappop(active)
+            if not active:
+                continue
+
+            # The winning list holds until its range ends or another range starts
+            label, end = active[0]
+            if index < len(ranges) and ranges[index][0] <= end:
+                end = ranges[index][0] - 1
+
+            if ends and ends[-1] + 1 == position and labels[-1] == label:
+                ends[-1] = end
+            else:
+                starts.append(position)
+                ends.append(end)
+                labels.append(label)
+            position = end + 1
+
+        # IPv4 bounds fit into a compact array, IPv6 ones stay Python ints
+        if typecode:
+            self.starts = array(typecode, starts)
+            self.ends = array(typecode, ends)
+        else:
+            self.starts = starts
+            self.ends = ends
+        self.labels = array('H', labels)
+
+        self.shift = address_bits - bucket_bits
+        self.buckets = None
+        if bucket_bits:
+            buckets = array(UINT32_TYPECODE, bytes(array(UINT32_TYPECODE).itemsize * ((1 << bucket_bits) + 1)))
+            position = 0
+            for bucket in range((1 << bucket_bits) + 1):
+                bucket_start = bucket << self.shift
+                while position < len(starts) and starts[position] < bucket_start:
+                    position += 1
+                buckets[bucket] = position
+            self.buckets = buckets
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, value):
+        if self.buckets is not None:
+            bucket = value >> self.shift
+            # A range starting in an earlier bucket is found as index lo - 1
+            index = bisect_right(self.starts, value, self.buckets[bucket], self.buckets[bucket + 1]) - 1
+        else:
+            index = bisect_right(self.starts, value) - 1
+
+        if index >= 0 and value <= self.ends[index]:
+            return self.labels[index]
+        return None
+
+
+class ReputationTables:
+    """Immutable snapshot of the loaded blocklists"""
+
+    def __init__(self, ranges_v4, ranges_v6, names, entries):
+        self.ipv4 = IntervalTable(ranges_v4, UINT32_TYPECODE, address_bits=32, bucket_bits=16)
+        self.ipv6 = IntervalTable(ranges_v6, address_bits=128, bucket_bits=16)
+        self.names = names
+        self.entries = entries
+
+
+class IPReputation:
+    """
+    IPv4 and IPv6 blocklists loaded from a directory, one address or CIDR
+    range per line (FireHOL .netset/.ipset and plain .txt files). Each file
+    is a named list. The lists are reloaded in the background when a file
+    changes, and the new tables replace the old ones with a single
+    assignment, so lookups never wait for a reload.
+    """
+
+    def __init__(self, path, reload_interval=60.0):
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self.logger = logging.getLogger('IPReputation')
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.signature = None
+        self.tables = ReputationTables([], [], [], 0)
+        self.reload()
+
+    def _files(self):
+        files = set()
+        for pattern in BLOCKLIST_PATTERNS:
+            files.update(self.path.glob(pattern))
+        return sorted(files)
+
+    def _signature(self, files):
+        signature = []
+        for path in files:
+            try:
+                stat = path.stat()
+                signature.append((str(path), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def reload(self):
+        files = self._files()
+        signature = self._signature(files)
+        if signature == self.signature:
+            return False
+
+        ranges_v4, ranges_v6, names = [], [], []
+        entries = 0
+
+        for path in files:
+            label = len(names)
+            names.append(path.stem)
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        line = line.split('#', 1)[0].strip()
+                        if not line:
+                            continue
+                        try:
+                            family, first, last = parse_network(line.split()[0])
+                        except (OSError, ValueError):
+                            continue
+                        (ranges_v6 if family == socket.AF_INET6 else ranges_v4).append((first, last, label))
+                        entries += 1
+            except Exception as e:
+                self.logger.error(f"Error loading blocklist {path}: {str(e)}")
+
+        tables = ReputationTables(ranges_v4, ranges_v6, names, entries)
+
+        # Lookups read self.tables once, so replacing it is atomic for them
+        self.tables = tables
+        self.signature = signature
+        self.logger.info(f"Loaded {entries} blocklist entries from {len(names)} lists "
+                         f"({len(tables.ipv4)} IPv4 and {len(tables.ipv6)} IPv6 ranges)")
+        return True
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._reload_loop, name='ip-reputation', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _reload_loop(self):
+        while not self.stop_event.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                self.logger.error(f"Error reloading blocklists: {str(e)}")
+
+    def lookup(self, ip):
+        """Returns the name of the first blocklist containing ip, or None"""
+        tables = self.tables
+
+        # IntervalTable.find is inlined here, this runs for every network event
+        try:
+            if ':' in ip:
+                value = int.from_bytes(inet_pton(AF_INET6, ip), 'big')
+                # IPv4-mapped addresses (::ffff:a.b.c.d) are checked against the IPv4 lists
+                if value >> 32 == 0xFFFF:
+                    value &= 0xFFFFFFFF
+                    table = tables.ipv4
+                else:
+                    table = tables.ipv6
+            else:
+                value = int.from_bytes(inet_pton(AF_INET, ip), 'big')
+                table = tables.ipv4
+        except (OSError, ValueError):
+            return None
+
+        bucket = value >> table.shift
+        buckets = table.buckets
+        index = bisect_right(table.starts, value, buckets[bucket], buckets[bucket + 1]) - 1
+
+        if index >= 0 and value <= table.ends[index]:
+            return tables.names[table.labels[index]]
+        return None
+
+    def get_stats(self):
+        tables = self.tables
+        return {
+            'lists': len(tables.names),
+            'entries': tables.entries,
+            'ipv4_ranges': len(tables.ipv4),
+            'ipv6_ranges': len(tables.ipv6)
+        }
@@ -0,0 +1,285 @@
+import os
+import json
+import logging
+import datetime
+import threading
+from array import array
+from pathlib import Path
+from collections import OrderedDict
+
+from logon_failures import normalize_ip
+
+HOURS_OF_WEEK = 168
+
+# Logon types routed to handle_user_login: interactive, unlock, RDP
+LOGON_TYPES = ('2', '7', '10')
+
+# A logon type or host with less than this share of a user's logins is unusual
+RARE_SHARE = 0.05
+
+# Decay is applied once it would shrink the counters by more than this
+MIN_DECAY = 0.01
+
+
+def hour_of_week(timestamp):
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    return moment.weekday() * 24 + moment.hour
+
+
+def source_host(source_ip, workstation):
+    """Where a login came from: the remote address, else the workstation name, '' for local logins"""
+    address = normalize_ip(source_ip)
+    if address:
+        return address
+    workstation = (workstation or '').strip().lower()
+    return '' if workstation == '-' else workstation
+
+
+class UserBaseline:
+    """
+    Decayed login counts of one user: an hour-of-week histogram, logon
+    types and source hosts. The histogram and the types are float32
+    arrays. All counters and their total are decayed together, so the shares
+    used for scoring are shares of the recent, exponentially weighted
+    logins.
+    """
+
+    __slots__ = ('hours', 'types', 'hosts', 'total', 'logins', 'updated')
+
+    def __init__(self):
+        self.hours = array('f', bytes(4 * HOURS_OF_WEEK))
+        self.types = array('f', bytes(4 * len(LOGON_TYPES)))
+        self.hosts = {}
+        self.total = 0.0
+        self.logins = 0
+        self.updated = None
+
+    def decay(self, timestamp, half_life):
+        if self.updated is None:
+            self.updated = timestamp
+            return
+        elapsed = timestamp - self.updated
+        # Out-of-order events do not decay backwards
+        if elapsed <= 0:
+            return
+        factor = 0.5 ** (elapsed / half_life)
+        # Small factors are postponed, so bursts of logins do not rescale every counter each time
+        if factor > 1 - MIN_DECAY:
+            return
+
+        self.hours = array('f', [count * factor for count in self.hours])
+        self.types = array('f', [count * factor for count in self.types])
+        self.hosts = {host: count * factor for host, count in self.hosts.items()}
+        self.total *= factor
+        self.updated = timestamp
+
+    def hour_shares(self, hour):
+        """
+        Shares of logins at this hour of the week and at this hour of any
+        day, half the weight taken from the neighbouring hours
+        """
+        if not self.total:
+            return 0.0, 0.0
+        hours = self.hours
+        week = hours[hour] + (hours[hour - 1] + hours[(hour + 1) % HOURS_OF_WEEK]) / 2
+        hour %= 24
+        day = sum(hours[hour::24]) + (sum(hours[(hour - 1) % 24::24]) + sum(hours[(hour + 1) % 24::24])) / 2
+        return week / (2 * self.total), day / (2 * self.total)
+
+    def type_share(self, login_type):
+        if not self.total or login_type not in LOGON_TYPES:
+            return 0.0
+        return self.types[LOGON_TYPES.index(login_type)] / self.total
+
+    def host_share(self, host):
+        return self.hosts.get(host, 0.0) / self.total if self.total else 0.0
+
+    def add(self, hour, login_type, host, max_hosts):
+        self.hours[hour] += 1
+        if login_type in LOGON_TYPES:
+            self.types[LOGON_TYPES.index(login_type)] += 1
+        if host not in self.hosts and len(self.hosts) >= max_hosts:
+            # The least used host makes room; its weight is forgotten
+            del self.hosts[min(self.hosts, key=self.hosts.get)]
+        self.hosts[host] = self.hosts.get(host, 0.0) + 1
+        self.total += 1
+        self.logins += 1
+
+    def to_dict(self):
+        return {
+            'hours': [round(count, 3) for count in self.hours],
+            'types': [round(count, 3) for count in self.types],
+            'hosts': {host: round(count, 3) for host, count in self.hosts.items()},
+            'total': self.total,
+            'logins': self.logins,
+            'updated': self.updated
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        baseline = cls()
+        hours = data.get('hours', [])
+        types = data.get('types', [])
+        if len(hours) == HOURS_OF_WEEK:
+            baseline.hours = array('f', hours)
+        if len(types) == len(LOGON_TYPES):
+            baseline.types = array('f', types)
+        baseline.hosts = dict(data.get('hosts', {}))
+        baseline.total = data.get('total', 0.0)
+        baseline.logins = data.get('logins', 0)
+        baseline.updated = data.get('updated')
+        return baseline
+
+
+class LoginBaselines:
+    """
+    Per-user login baselines and anomaly scores.
+
+    A login is scored against the user's baseline before being added to
+    it. Each of the time, the logon type and the source host contributes
+    up to 1 to the score: 1 when the user has never logged in that way, 0
+    when it is usual (a type or host with at least RARE_SHARE of the
+    logins). The time part is split evenly between the hour of the week
+    and the hour of the day, each usual with at least a uniform share, so
+    a usual hour on an unusual day counts half. Users with fewer than
+    min_logins logins are still being learned and score 0. Counts decay
+    with the given half-life, so a changed routine becomes the new normal.
+    At most max_users baselines are kept, the least recently active user
+    being dropped first.
+    """
+
+    def __init__(self, path='./data/login_baseline.json', half_life_days=30, min_logins=20, threshold=1.0,
+                 max_users=10000, max_hosts=16, save_interval=300):
+        self.path = Path(path)
+        self.half_life = half_life_days * 86400
+        self.min_logins = min_logins
+        self.threshold = threshold
+        self.max_users = max_users
+        self.max_hosts = max_hosts
+        self.save_interval = save_interval
+        self.logger = logging.getLogger('LoginBaselines')
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.users = OrderedDict()
+        self.scored = 0
+        self.anomalous = 0
+        self.evicted = 0
+
+        self.load()
+
+    def score(self, username, login_type, host, timestamp):
+        """
+        Scores a login and adds it to the user's baseline. Returns a dict
+        with the score, whether it reaches the threshold, whether the user
+        is still being learned or was never seen before and the reasons:
+        dicts with the kind
+        ('time', 'type' or 'host'), the unusual value and its part of the
+        score.
+        """
+        key = (username or '').strip().lower()
+        hour = hour_of_week(timestamp)
+
+        with self.lock:
+            baseline = self.users.get(key)
+            if baseline is None:
+                while len(self.users) >= self.max_users:
+                    self.users.popitem(last=False)
+                    self.evicted += 1
+                baseline = self.users[key] = UserBaseline()
+            else:
+                self.users.move_to_end(key)
+
+            baseline.decay(timestamp, self.half_life)
+            new_user = baseline.logins == 0
+            learning = baseline.logins < self.min_logins
+
+            reasons = []
+            if not learning:
+                week_share, day_share = baseline.hour_shares(hour)
+                time_part = (max(0.0, 1 - week_share * HOURS_OF_WEEK) + max(0.0, 1 - day_share * 24)) / 2
+                parts = (
+                    ('time', hour, time_part),
+                    ('type', login_type, 1 - baseline.type_share(login_type) / RARE_SHARE),
+                    ('host', host, 1 - baseline.host_share(host) / RARE_SHARE)
+                )
+                reasons = [
+                    {'kind': kind, 'value': value, 'score': round(part, 2)}
+                    for kind, value, part in parts if part > 0
+                ]
+
+            baseline.add(hour, login_type, host, self.max_hosts)
+
+            score = round(sum(reason['score'] for reason in reasons), 2)
+            anomalous = score >= self.threshold
+            self.scored += 1
+            if anomalous:
+                self.anomalous += 1
+
+        return {
+            'score': score,
+            'anomalous': anomalous,
+            'learning': learning,
+            'new_user': new_user,
+            'logins': baseline.logins,
+            'reasons': sorted(reasons, key=lambda reason: reason['score'], reverse=True)
+        }
+
+    def save(self):
+        with self.lock:
+            data = {'users': {username: baseline.to_dict() for username, baseline in self.users.items()}}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Error saving login baselines: {str(e)}")
+
+    def load(self):
+        if not self.path.exists():
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            users = OrderedDict(
+                (username, UserBaseline.from_dict(baseline)) for username, baseline in data.get('users', {}).items()
+            )
+        except Exception as e:
+            self.logger.error(f"Error loading login baselines: {str(e)}")
+            return
+
+        # Saved in order of activity, so the most recently active users are kept
+        while len(users) > self.max_users:
+            users.popitem(last=False)
+        self.users = users
+        self.logger.info(f"Loaded login baselines of {len(users)} users")
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._save_loop, name='login-baselines', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.save()
+
+    def _save_loop(self):
+        while not self.stop_event.wait(self.save_interval):
+            self.save()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'users': len(self.users),
+                'scored': self.scored,
+                'anomalous': self.anomalous,
+                'evicted': self.evicted
+            }
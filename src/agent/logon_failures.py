@@ -0,0 +1,220 @@
+import heapq
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+# Distinct counterparts (users of an IP, IPs of a user) remembered per key
+MAX_DISTINCT = 64
+
+KINDS = ('user', 'ip')
+
+
+def normalize_ip(address):
+    """Source address of a failure event, '' for local or unknown ones"""
+    address = (address or '').strip()
+    if address.lower().startswith('::ffff:'):
+        address = address[7:]
+    return '' if address in ('-', '::1', '127.0.0.1') else address
+
+
+class WindowCounter:
+    """
+    Event count over a sliding window, kept as a ring of per-bucket counts.
+    Adding an event clears the buckets that slid out of the window, so an
+    update costs at most one pass over the ring and usually touches one
+    bucket; the window total is maintained alongside.
+    """
+
+    __slots__ = ('buckets', 'head', 'total')
+
+    def __init__(self, size):
+        self.buckets = [0] * size
+        self.head = None
+        self.total = 0
+
+    def add(self, index, count=1):
+        """Adds count events to bucket number index and returns the window total"""
+        buckets = self.buckets
+        size = len(buckets)
+
+        if self.head is None:
+            self.head = index
+        elif index > self.head:
+            if index - self.head >= size:
+                buckets[:] = [0] * size
+                self.total = 0
+            else:
+                for slot in range(self.head + 1, index + 1):
+                    slot %= size
+                    self.total -= buckets[slot]
+                    buckets[slot] = 0
+            self.head = index
+        elif index <= self.head - size:
+            # Older than the window
+            return self.total
+
+        buckets[index % size] += count
+        self.total += count
+        return self.total
+
+
+class KeyState:
+    __slots__ = ('counter', 'last_seen', 'day_failures', 'bursting', 'others')
+
+    def __init__(self, size):
+        self.counter = WindowCounter(size)
+        self.last_seen = 0
+        self.day_failures = 0
+        self.bursting = False
+        self.others = set()
+
+
+class FailedLogonTracker:
+    """
+    Failed logons counted per user and per source IP over a sliding window.
+
+    A key whose count reaches its threshold starts a burst and is reported
+    once; it is reported again only after its count has fallen below half
+    the threshold. Keys are kept in order of their last failure: keys idle
+    for idle_timeout seconds are dropped, and at most max_keys are kept per
+    kind, the idlest being dropped first. The daily failure counts of
+    dropped keys survive in a short list of the top ones for the report.
+    """
+
+    def __init__(self, window=300, bucket=10, user_threshold=10, ip_threshold=20, max_keys=10000,
+                 idle_timeout=3600, top_size=10):
+        self.window = window
+        self.bucket = max(1, bucket)
+        self.size = max(1, int(window // self.bucket))
+        self.thresholds = {'user': user_threshold, 'ip': ip_threshold}
+        self.max_keys = max_keys
+        self.idle_timeout = idle_timeout
+        self.top_size = top_size
+        self.logger = logging.getLogger('FailedLogonTracker')
+        self.lock = threading.Lock()
+
+        self.keys = {kind: OrderedDict() for kind in KINDS}
+        # Daily failures of dropped keys, the top_size largest per kind
+        self.retired = {kind: {} for kind in KINDS}
+        self.day = None
+        self.day_end = None
+
+        self.failures = 0
+        self.day_total = 0
+        self.bursts = 0
+        self.evicted = 0
+
+    def record(self, username, source_ip, timestamp):
+        """
+        Counts one failure and returns the bursts it started, as dicts with
+        the kind ('user' or 'ip'), key, failures in the window, daily
+        failures and the distinct counterparts seen (IPs of a user, users of
+        an IP).
+        """
+        index = int(timestamp // self.bucket)
+        username = (username or '').strip()
+        source_ip = normalize_ip(source_ip)
+        bursts = []
+
+        with self.lock:
+            if self.day_end is None or timestamp >= self.day_end:
+                self._new_day(timestamp)
+
+            self.failures += 1
+            self.day_total += 1
+
+            for kind, key, other in (('user', username.lower(), source_ip), ('ip', source_ip, username)):
+                if not key or key == '-':
+                    continue
+
+                keys = self.keys[kind]
+                state = keys.get(key)
+                if state is None:
+                    # Keys only grow on insert, so that is when old ones are dropped
+                    self._evict(kind, timestamp)
+                    state = keys[key] = KeyState(self.size)
+                else:
+                    keys.move_to_end(key)
+
+                count = state.counter.add(index)
+                state.last_seen = max(state.last_seen, timestamp)
+                state.day_failures += 1
+                if other and len(state.others) < MAX_DISTINCT:
+                    state.others.add(other)
+
+                threshold = self.thresholds[kind]
+                if not state.bursting and count >= threshold:
+                    state.bursting = True
+                    self.bursts += 1
+                    bursts.append({
+                        'kind': kind,
+                        'key': username if kind == 'user' else key,
+                        'failures': count,
+                        'day_failures': state.day_failures,
+                        'others': sorted(state.others)
+                    })
+                elif state.bursting and count < threshold / 2:
+                    state.bursting = False
+
+        return bursts
+
+    def _new_day(self, timestamp):
+        day = datetime.date.fromtimestamp(timestamp)
+        self.day = day.isoformat()
+        self.day_end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+        self.day_total = 0
+        for kind in KINDS:
+            self.retired[kind] = {}
+            for state in self.keys[kind].values():
+                state.day_failures = 0
+
+    def _evict(self, kind, now):
+        keys = self.keys[kind]
+        while len(keys) >= self.max_keys:
+            key, state = keys.popitem(last=False)
+            self._retire(kind, key, state.day_failures)
+
+        horizon = now - self.idle_timeout
+        while keys:
+            key = next(iter(keys))
+            state = keys[key]
+            if state.last_seen >= horizon:
+                break
+            del keys[key]
+            self._retire(kind, key, state.day_failures)
+
+    def _retire(self, kind, key, day_failures):
+        self.evicted += 1
+        if not day_failures:
+            return
+        retired = self.retired[kind]
+        # Most dropped keys had a failure or two and cannot enter a full top list
+        if len(retired) >= self.top_size and day_failures <= min(retired.values()) and key not in retired:
+            return
+        retired[key] = retired.get(key, 0) + day_failures
+        if len(retired) > self.top_size:
+            del retired[min(retired, key=retired.get)]
+
+    def get_top(self, limit=None):
+        """Users and source IPs with the most failures today, with the day's failure total"""
+        limit = limit or self.top_size
+        with self.lock:
+            top = {'day': self.day, 'failures': self.day_total}
+            for kind in KINDS:
+                counts = dict(self.retired[kind])
+                for key, state in self.keys[kind].items():
+                    if state.day_failures:
+                        counts[key] = counts.get(key, 0) + state.day_failures
+                top[kind] = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+            return top
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'users': len(self.keys['user']),
+                'ips': len(self.keys['ip']),
+                'failures': self.failures,
+                'bursts': self.bursts,
+                'evicted': self.evicted
+            }
@@ -12,7 +12,7 @@ from dotenv import load_dotenv
 from . import find_and_load_env, find_config_file, load_config, check_required_env_vars
 from event_monitor import EventMonitor
 from event_handler import EventHandler
-from telegram_notifier import TelegramNotifier
+from telegram_notifier import TelegramNotifier, TOP_SECTIONS, format_top_count
 import schedule
 
 # Настройка логгирования
@@ -77,11 +77,38 @@ def send_daily_report(event_handler, telegram_notifier):
         pdf.set_font('Arial', '', 12)
         pdf.cell(0, 8, f"Запусков системы: {report['startup_count']}", 0, 1)
         pdf.cell(0, 8, f"Входов в систему: {report['login_count']}", 0, 1)
+        pdf.cell(0, 8, f"Атак подбора пароля: {report.get('failed_login_count', 0)}", 0, 1)
         pdf.cell(0, 8, f"Повышений привилегий: {report['privilege_count']}", 0, 1)
         pdf.cell(0, 8, f"Изменений задач: {report['task_count']}", 0, 1)
         pdf.cell(0, 8, f"Изменений служб: {report['service_count']}", 0, 1)
         pdf.cell(0, 8, f"Подозрительных процессов: {report['suspicious_process_count']}", 0, 1)
         
+        # Пользователи и адреса с наибольшим числом неудачных входов
+        top = report.get('failed_login_top') or {}
+        if top.get('user') or top.get('ip'):
+            pdf.ln(5)
+            pdf.set_font('Arial', 'B', 14)
+            pdf.cell(0, 10, "Неудачные входы:", 0, 1)
+            pdf.set_font('Arial', '', 12)
+            if top.get('failures') is not None:
+                pdf.cell(0, 8, f"Всего: {top['failures']}", 0, 1)
+            for username, count in top.get('user', []):
+                pdf.cell(0, 8, f"{username} - {count}", 0, 1)
+            for address, count in top.get('ip', []):
+                pdf.cell(0, 8, f"с адреса {address} - {count}", 0, 1)
+        
+        # Самые частые процессы, адреса назначения и запуски за день
+        for name, title in TOP_SECTIONS.items():
+            summary = (report.get('top') or {}).get(name)
+            if not summary or not summary['top']:
+                continue
+            pdf.ln(5)
+            pdf.set_font('Arial', 'B', 14)
+            pdf.cell(0, 10, f"{title} (всего {summary['total']}):", 0, 1)
+            pdf.set_font('Arial', '', 12)
+            for key, count, error in summary['top']:
+                pdf.cell(0, 8, f"{key} - {format_top_count(count, error)}", 0, 1)
+        
         # Сохраняем PDF
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
         pdf_path = temp_file.name
@@ -100,15 +127,17 @@ def send_daily_report(event_handler, telegram_notifier):
 
 # Основной класс агента
 class WindowsMonitorAgent:
-    def __init__(self, config):
+    def __init__(self, config, config_path=None):
         if isinstance(config, (str, Path)):
             # Если передан путь к файлу конфигурации
             self.config_path = Path(config)
             self.config = load_config(self.config_path)
         else:
             # Если передана уже загруженная конфигурация
-            self.config_path = None
+            self.config_path = Path(config_path) if config_path else None
             self.config = config
+        
+        self.config_mtime = self._get_config_mtime()
             
         self.logger = logging.getLogger('Agent')
         self.stop_event = threading.Event()
@@ -120,6 +149,7 @@ class WindowsMonitorAgent:
         
         # Устанавливаем ссылку на обработчик событий в Telegram-клиенте
         self.telegram.event_handler = self.event_handler
+        self.telegram.event_monitor = self.event_monitor
         
         # Настраиваем планировщик для ежедневного отчета
         if self.config['features'].get('daily_report', True):
@@ -148,6 +178,7 @@ class WindowsMonitorAgent:
         
         # Останавливаем компоненты
         self.event_monitor.stop()
+        self.event_handler.close()
         self.telegram.stop()
         
         self.logger.info("Agent stopped")
@@ -155,21 +186,57 @@ class WindowsMonitorAgent:
     def _run_loop(self):
         self.logger.info("Agent main loop started")
         
-        try:
-            while not self.stop_event.is_set():
+        while not self.stop_event.is_set():
+            # Ошибка одной итерации не должна останавливать цикл
+            try:
                 # Запускаем задачи планировщика
                 schedule.run_pending()
                 
                 # Периодическая проверка конфигурации
-                # TODO: Добавить перезагрузку конфигурации при изменении файла
-                
-                # Спим чтобы не грузить процессор
-                time.sleep(1)
-        except Exception as e:
-            self.logger.error(f"Error in main loop: {str(e)}")
+                self._reload_config_if_changed()
+            except Exception as e:
+                self.logger.error(f"Error in main loop: {str(e)}")
+            
+            # Спим чтобы не грузить процессор
+            time.sleep(1)
         
         self.logger.info("Agent main loop stopped")
 
+    def _get_config_mtime(self):
+        if self.config_path is None or not self.config_path.exists():
+            return None
+        return self.config_path.stat().st_mtime
+    
+    def _reload_config_if_changed(self):
+        mtime = self._get_config_mtime()
+        if mtime is None or mtime == self.config_mtime:
+            return
+        
+        self.config_mtime = mtime
+        
+        try:
+            config = load_config(self.config_path)
+        except Exception as e:
+            self.logger.error(f"Error reloading config: {str(e)}")
+            return
+        
+        self.logger.info(f"Configuration file changed, reloading: {self.config_path}")
+        previous = self.config
+        try:
+            self.event_handler.update_config(config)
+            self.event_monitor.update_config(config)
+        except Exception as e:
+            # A bad config must not stop the agent: the previous one stays in effect
+            self.logger.error(f"Error applying reloaded config, keeping the previous one: {str(e)}")
+            try:
+                self.event_handler.update_config(previous)
+                self.event_monitor.update_config(previous)
+            except Exception as e:
+                self.logger.error(f"Error restoring the previous config: {str(e)}")
+            return
+        
+        self.config = config
+
 # Обработчик сигналов для корректного завершения
 def signal_handler(sig, frame, agent):
     logging.info(f"Received signal {sig}, shutting down...")
@@ -214,7 +281,7 @@ def main():
             sys.exit(1)
         
         # Создаем и запускаем агента
-        agent = WindowsMonitorAgent(config)
+        agent = WindowsMonitorAgent(config, config_path)
         
         # Регистрируем обработчики сигналов
         signal.signal(signal.SIGINT, lambda sig, frame: signal_handler(sig, frame, agent))
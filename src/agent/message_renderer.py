@@ -0,0 +1,161 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import win32api
+    import win32con
+except ImportError:
+    win32api = None
+    win32con = None
+
+# %1..%99 inserts (optionally with a printf spec like %1!s!) and escape codes
+_INSERT_RE = re.compile(r'%(\d{1,2})(?:![^!]*!)?|%([ntr%0.!\s])')
+
+_ESCAPES = {'n': '\r\n', 't': '\t', 'r': '\r', '%': '%', '0': '', '.': '.', '!': '!', ' ': ' '}
+
+# Template cached for sources without a message file
+_MISSING = object()
+
+
+def substitute_inserts(template, inserts):
+    inserts = inserts or []
+
+    def replace(match):
+        if match.group(1):
+            index = int(match.group(1)) - 1
+            return inserts[index] if 0 <= index < len(inserts) else ''
+        return _ESCAPES.get(match.group(2), '')
+
+    return _INSERT_RE.sub(replace, template)
+
+
+def fallback_message(event):
+    return (f"<The description for Event ID ( {event.EventID & 0xFFFF} ) in Source ( {event.SourceName!r} ) "
+            f"could not be found. It contains the following insertion string(s):{event.StringInserts!r}.>")
+
+
+class EventData(dict):
+    """
+    Event data dict whose 'description' is rendered on first access.
+    Handlers that never read the description never pay for formatting it.
+    """
+
+    def __init__(self, render, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._render = render
+
+    def __missing__(self, key):
+        if key != 'description' or self._render is None:
+            raise KeyError(key)
+
+        value = self._render()
+        self._render = None
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        if key == 'description' and self._render is not None:
+            return True
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+
+class MessageRenderer:
+    """
+    Renders event descriptions from cached message templates.
+
+    Templates are loaded from the message DLLs of the event source once per
+    (channel, source, event_id) and kept in a bounded LRU cache, so rendering
+    an event is only a substitution of its inserts into the template.
+    """
+
+    def __init__(self, max_templates=1024):
+        self.max_templates = max_templates
+        self.templates = OrderedDict()
+        self.lock = threading.Lock()
+        self.renders = 0
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.logger = logging.getLogger('MessageRenderer')
+
+    def render(self, event, log_type):
+        key = (log_type, event.SourceName, event.EventID)
+
+        with self.lock:
+            self.renders += 1
+            template = self.templates.get(key)
+            if template is not None:
+                self.hits += 1
+                self.templates.move_to_end(key)
+
+        if template is None:
+            template = self._load_template(log_type, event.SourceName, event.EventID)
+
+            with self.lock:
+                self.misses += 1
+                self.templates[key] = template
+                if len(self.templates) > self.max_templates:
+                    self.templates.popitem(last=False)
+
+        if template is _MISSING:
+            with self.lock:
+                self.fallbacks += 1
+            if win32api is None:
+                return ' '.join(event.StringInserts or [])
+            return fallback_message(event)
+
+        return substitute_inserts(template, event.StringInserts)
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'renders': self.renders,
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'fallbacks': self.fallbacks,
+                'cached_templates': len(self.templates)
+            }
+
+    def _load_template(self, log_type, source_name, event_id):
+        if win32api is None:
+            return _MISSING
+
+        key_name = f"SYSTEM\\CurrentControlSet\\Services\\EventLog\\{log_type}\\{source_name}"
+
+        try:
+            key = win32api.RegOpenKey(win32con.HKEY_LOCAL_MACHINE, key_name)
+            try:
+                dll_names = win32api.RegQueryValueEx(key, "EventMessageFile")[0].split(';')
+            finally:
+                win32api.RegCloseKey(key)
+        except Exception:
+            return _MISSING
+
+        flags = win32con.FORMAT_MESSAGE_FROM_HMODULE | win32con.FORMAT_MESSAGE_IGNORE_INSERTS
+
+        for dll_name in dll_names:
+            try:
+                dll_handle = win32api.LoadLibraryEx(
+                    win32api.ExpandEnvironmentStrings(dll_name), 0, win32con.LOAD_LIBRARY_AS_DATAFILE
+                )
+            except Exception:
+                continue
+
+            try:
+                return win32api.FormatMessageW(flags, dll_handle, event_id, 0, None)
+            except Exception:
+                continue
+            finally:
+                win32api.FreeLibrary(dll_handle)
+
+        self.logger.debug(f"No message template for {source_name} event {event_id & 0xFFFF}")
+        return _MISSING
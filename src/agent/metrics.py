@@ -0,0 +1,120 @@
+import time
+import threading
+from collections import deque
+
+
+def _percentile(samples, pct):
+    return samples[min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))]
+
+
+class LatencyStats:
+    """
+    Keeps the most recent latency samples and reports percentiles over them.
+    Memory is bounded by the number of samples kept.
+    """
+
+    def __init__(self, max_samples=10000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+
+        if not samples:
+            return {'count': count, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+
+        return {
+            'count': count,
+            'p50_ms': round(_percentile(samples, 50) * 1000, 2),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 2),
+            'max_ms': round(samples[-1] * 1000, 2)
+        }
+
+
+class RateMeter:
+    """
+    Counts events in a ring of one-second buckets and reports the rate over
+    the last `window` seconds.
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.buckets = [0] * window
+        self.bucket_times = [0] * window
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def mark(self, count=1, now=None):
+        second = int(now if now is not None else time.time())
+        index = second % self.window
+
+        with self.lock:
+            if self.bucket_times[index] != second:
+                self.bucket_times[index] = second
+                self.buckets[index] = 0
+            self.buckets[index] += count
+            self.total += count
+
+    def sum(self, now=None):
+        second = int(now if now is not None else time.time())
+
+        with self.lock:
+            return sum(
+                count for count, bucket_time in zip(self.buckets, self.bucket_times)
+                if second - bucket_time < self.window
+            )
+
+    def rate(self, now=None):
+        return self.sum(now) / float(self.window)
+
+
+class ChannelStats:
+    """Read metrics of a single event channel"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.throughput = RateMeter()
+        self.backlog = 0
+        self.lag_seconds = 0.0
+        self.errors = 0
+        self.reopens = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+
+    def record_event(self, event_time):
+        self.throughput.mark()
+        with self.lock:
+            self.lag_seconds = max(0.0, time.time() - event_time)
+
+    def record_backlog(self, backlog):
+        with self.lock:
+            self.backlog = backlog
+
+    def record_error(self, error):
+        with self.lock:
+            self.errors += 1
+            self.last_error = str(error)
+
+    def record_reopen(self):
+        with self.lock:
+            self.reopens += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'events_total': self.throughput.total,
+                'events_per_sec': round(self.throughput.rate(), 2),
+                'backlog': self.backlog,
+                'lag_seconds': round(self.lag_seconds, 3),
+                'errors': self.errors,
+                'reopens': self.reopens,
+                'last_error': self.last_error
+            }
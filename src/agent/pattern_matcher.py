@@ -0,0 +1,107 @@
+from collections import deque
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick automaton over a set of substrings.
+
+    All patterns are found in a single left-to-right pass over the text, so
+    the matching cost depends on the text length and the number of hits,
+    not on the number of patterns. Matching is case-insensitive.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = []
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+
+        seen = set()
+        for pattern in patterns:
+            pattern = pattern.lower()
+            if pattern and pattern not in seen:
+                seen.add(pattern)
+                self._add(pattern)
+
+        self._build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+
+        self.outputs[state] = self.outputs[state] + (len(self.patterns),)
+        self.patterns.append(pattern)
+
+    def _build(self):
+        # Breadth-first pass computing failure links and merged outputs
+        queue = deque(self.transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+
+                target = self.transitions[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def find_all(self, text):
+        """Returns every pattern found in text, in order of first occurrence"""
+        return [self.patterns[pattern_id] for pattern_id in self.find_ids(text)]
+
+    def find_ids(self, text):
+        """Returns the indexes of the patterns found in text, in order of first occurrence"""
+        if not text or not self.patterns:
+            return []
+
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+        found = {}
+        state = 0
+
+        for char in text.lower():
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+
+            for pattern_id in outputs[state]:
+                if pattern_id not in found:
+                    found[pattern_id] = True
+
+        return list(found)
+
+    def search(self, text):
+        """Returns True if text contains any of the patterns"""
+        if not text or not self.patterns:
+            return False
+
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+
+        for char in text.lower():
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+
+            if outputs[state]:
+                return True
+
+        return False
@@ -0,0 +1,205 @@
+import sys
+import ntpath
+import logging
+import threading
+from collections import OrderedDict
+
+# Guards ancestry walks against malformed parent links
+MAX_DEPTH = 64
+
+
+def parse_guid(text):
+    """Converts a Sysmon ProcessGuid ('{xxxxxxxx-xxxx-...}') to an int, None if invalid"""
+    if not text:
+        return None
+    try:
+        return int(text.strip('{}').replace('-', ''), 16)
+    except ValueError:
+        return None
+
+
+def parse_pid(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProcessNode:
+    """One process. Slotted and holding an int GUID and interned strings to keep the tree compact"""
+
+    __slots__ = ('guid', 'pid', 'image', 'command_line', 'user', 'parent', 'started', 'exited', 'stub')
+
+    def __init__(self, guid, pid, image, command_line, user, parent, started, stub=False):
+        self.guid = guid
+        self.pid = pid
+        self.image = image
+        self.command_line = command_line
+        self.user = user
+        self.parent = parent
+        self.started = started
+        self.exited = None
+        # Created from a child's Parent* fields, filled in by its own creation event
+        self.stub = stub
+
+    @property
+    def name(self):
+        return ntpath.basename(self.image) or self.image
+
+
+class ProcessTree:
+    """
+    Live process graph built from Sysmon process creation (1) and
+    termination (5) events, keyed by ProcessGuid.
+
+    Every node points to its parent node, so ancestry is a walk of O(depth)
+    pointers. A parent that started before monitoring (or was filtered out
+    by the Sysmon config) is created from the Parent* fields of its child's
+    event; when the parent's own creation event arrives later (events are
+    handled by several workers), the same node is filled in. The index holds at most max_processes nodes: exited processes
+    are evicted first, oldest exit first, then the least recently active
+    ones. An evicted ancestor stays reachable from its live descendants, so
+    their ancestry remains complete until they are evicted too.
+    """
+
+    def __init__(self, max_processes=100000, max_command_line=1024):
+        self.max_processes = max_processes
+        self.max_command_line = max_command_line
+        self.logger = logging.getLogger('ProcessTree')
+        self.lock = threading.Lock()
+
+        # guid -> node, least recently active first
+        self.nodes = OrderedDict()
+        # guid -> None, in order of exit
+        self.exited = OrderedDict()
+
+        self.added = 0
+        self.stubs = 0
+        self.exits = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _intern(self, text):
+        return sys.intern(text) if text else ''
+
+    def _command_line(self, text):
+        return text[:self.max_command_line] if text else ''
+
+    def add(self, guid, pid, image, command_line='', user='', parent_guid=None, parent_pid=None,
+            parent_image='', parent_command_line='', started=None):
+        """Adds a created process and returns its node (None without a valid GUID)"""
+        guid = parse_guid(guid) if isinstance(guid, str) else guid
+        if guid is None:
+            return None
+        parent_guid = parse_guid(parent_guid) if isinstance(parent_guid, str) else parent_guid
+
+        with self.lock:
+            node = self.nodes.get(guid)
+            if node is not None and not node.stub:
+                # Repeated event (e.g. re-read after a restart)
+                self.nodes.move_to_end(guid)
+                return node
+
+            parent = None
+            if parent_guid is not None and parent_guid != guid:
+                parent = self.nodes.get(parent_guid)
+                if parent is not None:
+                    # A process starting children is active
+                    self.nodes.move_to_end(parent_guid)
+                else:
+                    parent = ProcessNode(parent_guid, parse_pid(parent_pid), self._intern(parent_image),
+                                         self._command_line(parent_command_line), '', None, None, stub=True)
+                    self.nodes[parent_guid] = parent
+                    self.stubs += 1
+
+            if node is not None:
+                # The child's event came first: its children already point to this node
+                node.pid = parse_pid(pid)
+                node.image = self._intern(image) or node.image
+                node.command_line = self._command_line(command_line) or node.command_line
+                node.user = self._intern(user)
+                node.parent = parent
+                node.started = started
+                node.stub = False
+                self.nodes.move_to_end(guid)
+            else:
+                node = ProcessNode(guid, parse_pid(pid), self._intern(image), self._command_line(command_line),
+                                   self._intern(user), parent, started)
+                self.nodes[guid] = node
+            self.added += 1
+
+            self._evict()
+            return node
+
+    def exit(self, guid, when=None):
+        """Marks a process as exited; it is kept until the index needs the room"""
+        guid = parse_guid(guid) if isinstance(guid, str) else guid
+
+        with self.lock:
+            node = self.nodes.get(guid)
+            if node is None:
+                return None
+            node.exited = when
+            self.exited[guid] = None
+            self.exits += 1
+            return node
+
+    def _evict(self):
+        nodes = self.nodes
+        exited = self.exited
+        while len(nodes) > self.max_processes:
+            if exited:
+                guid = exited.popitem(last=False)[0]
+                if nodes.pop(guid, None) is None:
+                    continue
+            else:
+                nodes.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, guid):
+        guid = parse_guid(guid) if isinstance(guid, str) else guid
+        with self.lock:
+            return self.nodes.get(guid)
+
+    def ancestors(self, node):
+        """Returns the ancestors of node, nearest first"""
+        chain = []
+        parent = node.parent
+        while parent is not None and len(chain) < MAX_DEPTH:
+            chain.append(parent)
+            parent = parent.parent
+        return chain
+
+    def find(self, query, limit=5):
+        """Processes with the given PID or whose image name contains query, running and newest first"""
+        pid = parse_pid(query)
+        query = query.lower()
+
+        with self.lock:
+            nodes = list(self.nodes.values())
+
+        if pid is not None:
+            found = [node for node in nodes if node.pid == pid]
+        else:
+            found = [node for node in nodes if query in node.name.lower()]
+
+        found.sort(key=lambda node: (node.exited is None, node.started or 0), reverse=True)
+        return found[:limit]
+
+    def children(self, node, limit=20):
+        with self.lock:
+            nodes = list(self.nodes.values())
+        return [child for child in nodes if child.parent is node][:limit]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'tracked': len(self.nodes),
+                'exited': len(self.exited),
+                'added': self.added,
+                'stubs': self.stubs,
+                'exits': self.exits,
+                'evicted': self.evicted
+            }
@@ -0,0 +1,734 @@
+import re
+import time
+import logging
+import threading
+from pathlib import Path
+
+import yaml
+
+from pattern_matcher import MultiPatternMatcher
+from sigma import SigmaError, convert_sigma, is_sigma_rule
+
+RULE_PATTERNS = ('*.yml', '*.yaml')
+
+# The libyaml parser is several times faster on large rule sets
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+STRING_OPERATORS = ('equals', 'contains', 'startswith', 'endswith', 'regex')
+NUMERIC_OPERATORS = {
+    'gt': lambda value, bound: value > bound,
+    'gte': lambda value, bound: value >= bound,
+    'lt': lambda value, bound: value < bound,
+    'lte': lambda value, bound: value <= bound
+}
+
+# Relative cost of the leaf tests, cheaper ones are evaluated first
+COST_SHARED = 1
+COST_EXISTS = 1
+COST_NUMERIC = 2
+COST_STRING = 3
+COST_REGEX = 10
+
+
+class RuleError(ValueError):
+    pass
+
+
+class FieldMatchers:
+    """
+    String tests of all rules, shared per field.
+
+    Every case-insensitive equals/contains/startswith/endswith value becomes
+    an atom. The substring atoms of a field are compiled into one
+    Aho-Corasick automaton and the equals atoms into one dict, so a field is
+    scanned once per event however many rules test it; rules then only
+    check which of their atoms matched.
+    """
+
+    def __init__(self):
+        self.atom_ids = {}
+        # field -> {needle: [(atom_id, kind)]}
+        self.needles = {}
+        # field -> {value: [atom_id]}
+        self.equals = {}
+        self.matchers = {}
+
+    def __len__(self):
+        return len(self.atom_ids)
+
+    def atom(self, field, kind, needle):
+        key = (field, kind, needle)
+        atom_id = self.atom_ids.get(key)
+        if atom_id is None:
+            atom_id = self.atom_ids[key] = len(self.atom_ids)
+            if kind == 'equals':
+                self.equals.setdefault(field, {}).setdefault(needle, []).append(atom_id)
+            else:
+                self.needles.setdefault(field, {}).setdefault(needle, []).append((atom_id, kind))
+        return atom_id
+
+    def finish(self):
+        self.matchers = {field: MultiPatternMatcher(list(needles)) for field, needles in self.needles.items()}
+
+    def match(self, field, value):
+        """Returns the ids of the atoms of field matching the lowercased value"""
+        matched = set()
+
+        matcher = self.matchers.get(field)
+        if matcher is not None:
+            needles = self.needles[field]
+            patterns = matcher.patterns
+            for pattern_id in matcher.find_ids(value):
+                needle = patterns[pattern_id]
+                for atom_id, kind in needles[needle]:
+                    if (kind == 'contains'
+                            or (kind == 'startswith' and value.startswith(needle))
+                            or (kind == 'endswith' and value.endswith(needle))):
+                        matched.add(atom_id)
+
+        equals = self.equals.get(field)
+        if equals is not None:
+            matched.update(equals.get(value, ()))
+
+        return matched
+
+
+class EventFields:
+    """
+    Field access for one event. Dotted paths ('process.image', 'inserts.5')
+    are resolved once and lowercased once, and every field is run through
+    the shared matchers once, whatever the number of rules reading it.
+    """
+
+    __slots__ = ('event_data', 'values', 'lowered', 'matchers', 'matched')
+
+    def __init__(self, event_data, matchers=None):
+        self.event_data = event_data
+        self.values = {}
+        self.lowered = {}
+        self.matchers = matchers
+        self.matched = {}
+
+    def get(self, path):
+        try:
+            return self.values[path]
+        except KeyError:
+            pass
+
+        value = self.event_data
+        for part in path.split('.'):
+            try:
+                if isinstance(value, dict):
+                    value = value.get(part)
+                elif isinstance(value, (list, tuple)):
+                    value = value[int(part)]
+                else:
+                    value = None
+            except (ValueError, IndexError):
+                value = None
+            if value is None:
+                break
+
+        self.values[path] = value
+        return value
+
+    def lower(self, path):
+        try:
+            return self.lowered[path]
+        except KeyError:
+            pass
+
+        value = self.get(path)
+        value = str(value).lower() if value is not None else None
+        self.lowered[path] = value
+        return value
+
+    def atoms(self, path):
+        try:
+            return self.matched[path]
+        except KeyError:
+            pass
+
+        value = self.lower(path)
+        matched = self.matchers.match(path, value) if value is not None else set()
+        self.matched[path] = matched
+        return matched
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _compile_string(field, operator, operand, case_sensitive, matchers=None):
+    needles = [str(needle) for needle in _as_list(operand)]
+    if not needles:
+        raise RuleError(f"Empty '{operator}' list for field {field}")
+
+    # Plain string tests are answered by the shared per-field matchers
+    if matchers is not None and operator != 'regex' and not case_sensitive and all(needles):
+        atoms = frozenset(matchers.atom(field, operator, needle.lower()) for needle in needles)
+
+        def predicate(fields):
+            matched = fields.matched
+            return not atoms.isdisjoint(matched[field] if field in matched else fields.atoms(field))
+        return predicate, COST_SHARED
+
+    if operator == 'regex':
+        flags = 0 if case_sensitive else re.IGNORECASE
+        try:
+            pattern = re.compile('|'.join(f'(?:{needle})' for needle in needles), flags)
+        except re.error as e:
+            raise RuleError(f"Invalid regex for field {field}: {str(e)}")
+        search = pattern.search
+
+        def predicate(fields):
+            value = fields.get(field)
+            return value is not None and search(str(value)) is not None
+        return predicate, COST_REGEX
+
+    if not case_sensitive:
+        needles = [needle.lower() for needle in needles]
+
+    # The field is read from the per-event cache directly, predicates run
+    # hundreds of times per event and every extra call shows
+    if case_sensitive:
+        def read(fields):
+            values = fields.values
+            value = values[field] if field in values else fields.get(field)
+            return value if value is None or isinstance(value, str) else str(value)
+    else:
+        def read(fields):
+            lowered = fields.lowered
+            return lowered[field] if field in lowered else fields.lower(field)
+
+    if operator == 'equals':
+        needle_set = frozenset(needles)
+
+        def predicate(fields):
+            value = read(fields)
+            return value is not None and value in needle_set
+        return predicate, COST_STRING
+
+    if operator == 'contains':
+        if len(needles) == 1:
+            needle = needles[0]
+
+            def predicate(fields):
+                value = read(fields)
+                return value is not None and needle in value
+            return predicate, COST_STRING
+
+        def predicate(fields):
+            value = read(fields)
+            if value is None:
+                return False
+            for needle in needles:
+                if needle in value:
+                    return True
+            return False
+        return predicate, COST_STRING + len(needles) // 8
+
+    # str.startswith/endswith take a tuple of alternatives
+    needle_tuple = tuple(needles)
+    method = str.startswith if operator == 'startswith' else str.endswith
+
+    def predicate(fields):
+        value = read(fields)
+        return value is not None and method(value, needle_tuple)
+    return predicate, COST_STRING
+
+
+def _compile_numeric(field, bounds):
+    def predicate(fields):
+        value = fields.get(field)
+        if value is None:
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        for test, bound in bounds:
+            if not test(value, bound):
+                return False
+        return True
+    return predicate, COST_NUMERIC
+
+
+def _compile_leaf(node, matchers=None):
+    field = node['field']
+    if not isinstance(field, str) or not field:
+        raise RuleError(f"Invalid field: {field!r}")
+
+    case_sensitive = bool(node.get('case_sensitive', False))
+    tests = []
+
+    for operator in STRING_OPERATORS:
+        if operator in node:
+            tests.append(_compile_string(field, operator, node[operator], case_sensitive, matchers))
+
+    bounds = []
+    for operator, test in NUMERIC_OPERATORS.items():
+        if operator in node:
+            bounds.append((test, _to_number(field, node[operator])))
+    if 'range' in node:
+        limits = _as_list(node['range'])
+        if len(limits) != 2:
+            raise RuleError(f"'range' for field {field} must be [min, max]")
+        bounds.append((NUMERIC_OPERATORS['gte'], _to_number(field, limits[0])))
+        bounds.append((NUMERIC_OPERATORS['lte'], _to_number(field, limits[1])))
+    if bounds:
+        tests.append(_compile_numeric(field, bounds))
+
+    if 'exists' in node:
+        expected = bool(node['exists'])
+        tests.append((lambda fields: (fields.get(field) is not None) == expected, COST_EXISTS))
+
+    if not tests:
+        raise RuleError(f"No operator for field {field}")
+
+    if len(tests) == 1:
+        return tests[0]
+    return _combine_all(tests)
+
+
+def _to_number(field, value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RuleError(f"Invalid number for field {field}: {value!r}")
+
+
+def _combine_all(children):
+    children.sort(key=lambda child: child[1])
+    predicates = [predicate for predicate, cost in children]
+    cost = sum(cost for predicate, cost in children)
+
+    def predicate(fields):
+        for child in predicates:
+            if not child(fields):
+                return False
+        return True
+    return predicate, cost
+
+
+def _combine_any(children):
+    children.sort(key=lambda child: child[1])
+    predicates = [predicate for predicate, cost in children]
+    cost = sum(cost for predicate, cost in children)
+
+    def predicate(fields):
+        for child in predicates:
+            if child(fields):
+                return True
+        return False
+    return predicate, cost
+
+
+def compile_condition(node, matchers=None):
+    """
+    Compiles a condition tree into (predicate, cost). Nodes are either
+    {'all': [...]}, {'any': [...]}, {'not': node} or a field test such as
+    {'field': 'process.image', 'endswith': '\\\\cmd.exe'}. Children of
+    all/any are reordered so that cheap tests run first. With matchers,
+    plain string tests are registered there instead of compiled one by one.
+    """
+    if not isinstance(node, dict):
+        raise RuleError(f"Condition must be a mapping, got {node!r}")
+
+    if 'all' in node or 'any' in node:
+        combinator = 'all' if 'all' in node else 'any'
+        children = [compile_condition(child, matchers) for child in _as_list(node[combinator])]
+        if not children:
+            raise RuleError(f"Empty '{combinator}' condition")
+        if len(children) == 1:
+            return children[0]
+        return _combine_all(children) if combinator == 'all' else _combine_any(children)
+
+    if 'not' in node:
+        child, cost = compile_condition(node['not'], matchers)
+        return (lambda fields: not child(fields)), cost
+
+    if 'field' in node:
+        return _compile_leaf(node, matchers)
+
+    raise RuleError(f"Unknown condition: {node!r}")
+
+
+def trigger_atoms(node, matchers):
+    """
+    Returns a set of (field, atom) pairs of which at least one must match
+    for the condition to be true, or None if there is no such set (e.g.
+    under 'not' or for regex and numeric tests). Rules with triggers are
+    only evaluated for events where one of their triggers matched.
+    """
+    if 'all' in node or 'any' in node:
+        combinator = 'all' if 'all' in node else 'any'
+        children = [trigger_atoms(child, matchers) for child in _as_list(node[combinator])]
+        if combinator == 'any':
+            if any(child is None for child in children):
+                return None
+            return frozenset().union(*children)
+        # Any one child must hold, the narrowest one is enough
+        children = [child for child in children if child is not None]
+        return min(children, key=len) if children else None
+
+    if 'field' not in node or node.get('case_sensitive'):
+        return None
+
+    field = node['field']
+    candidates = []
+    for operator in ('equals', 'contains', 'startswith', 'endswith'):
+        if operator not in node:
+            continue
+        needles = [str(needle).lower() for needle in _as_list(node[operator])]
+        if needles and all(needles):
+            candidates.append(frozenset((field, matchers.atom(field, operator, needle)) for needle in needles))
+    return min(candidates, key=len) if candidates else None
+
+
+class Rule:
+    """A compiled detection rule"""
+
+    def __init__(self, rule_id, title, severity, channel, event_ids, predicate, source, triggers=None):
+        self.id = rule_id
+        self.title = title
+        self.severity = severity
+        self.channel = channel
+        self.event_ids = event_ids
+        self.predicate = predicate
+        self.source = source
+        self.triggers = triggers
+
+    @classmethod
+    def from_dict(cls, data, source='', matchers=None):
+        if not isinstance(data, dict):
+            raise RuleError(f"Rule must be a mapping, got {data!r}")
+
+        rule_id = data.get('id')
+        channel = data.get('channel')
+        if not rule_id or not channel:
+            raise RuleError("Rule needs 'id' and 'channel'")
+
+        try:
+            event_ids = tuple(int(event_id) for event_id in _as_list(data.get('event_id')))
+        except (TypeError, ValueError):
+            raise RuleError(f"Rule {rule_id}: invalid event_id {data.get('event_id')!r}")
+        if not event_ids:
+            raise RuleError(f"Rule {rule_id}: no event_id")
+
+        if 'condition' not in data:
+            raise RuleError(f"Rule {rule_id}: no condition")
+
+        try:
+            predicate, cost = compile_condition(data['condition'], matchers)
+        except RuleError as e:
+            raise RuleError(f"Rule {rule_id}: {str(e)}")
+
+        triggers = trigger_atoms(data['condition'], matchers) if matchers is not None else None
+
+        return cls(str(rule_id), data.get('title', str(rule_id)), data.get('severity', 'medium'),
+                   channel, event_ids, predicate, source, triggers)
+
+
+class Route:
+    """The rules of one (channel, event_id), with their triggers inverted into per-field atom maps"""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.always = []
+        # field -> {atom: [rule positions]}
+        self.triggers = {}
+
+        for position, rule in enumerate(self.rules):
+            if not rule.triggers:
+                self.always.append(position)
+                continue
+            for field, atom in rule.triggers:
+                self.triggers.setdefault(field, {}).setdefault(atom, []).append(position)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, fields):
+        """Rules that can match the event: those without triggers and those with a matched trigger"""
+        if not self.triggers:
+            return self.rules
+
+        selected = set(self.always)
+        for field, atoms in self.triggers.items():
+            for atom in fields.atoms(field):
+                positions = atoms.get(atom)
+                if positions:
+                    selected.update(positions)
+
+        rules = self.rules
+        return [rules[position] for position in sorted(selected)]
+
+
+class RuleSet:
+    """Immutable snapshot of the loaded rules, indexed by (channel, event_id)"""
+
+    def __init__(self, rules, files=0, matchers=None):
+        self.rules = rules
+        self.files = files
+        self.matchers = matchers or FieldMatchers()
+        self.matchers.finish()
+
+        index = {}
+        for rule in rules:
+            for event_id in rule.event_ids:
+                index.setdefault((rule.channel, event_id), []).append(rule)
+        self.index = {key: Route(bucket) for key, bucket in index.items()}
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class RuleEngine:
+    """
+    Detection rules loaded from the YAML files of a directory.
+
+    Each file holds a list of rules. A rule applies to one channel and one
+    or more event IDs and is only evaluated for those events. Files are
+    reloaded in the background when they change, and the compiled rule set
+    is replaced with a single assignment. Every rule keeps its evaluation
+    count, hit count and evaluation time across reloads; the time is
+    measured on one event out of timing_sample, as reading the clock around
+    every rule would cost as much as the cheap rules themselves.
+    """
+
+    def __init__(self, path, reload_interval=30.0, timing_sample=16):
+        self.path = Path(path)
+        self.reload_interval = reload_interval
+        self.timing_sample = max(1, timing_sample)
+        self.logger = logging.getLogger('RuleEngine')
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.listeners = []
+
+        # (channel, event_id) -> events evaluated; a rule's evaluation count is
+        # the sum over its routes plus an offset fixed when it was loaded
+        self.route_events = {}
+        # rule id -> [evaluation offset, hits, timed evaluations, time_ns]
+        self.rule_stats = {}
+        self.events = 0
+        self.errors = 0
+
+        self.signature = None
+        self.ruleset = RuleSet([])
+        self.reload()
+
+    def _files(self):
+        files = set()
+        for pattern in RULE_PATTERNS:
+            files.update(self.path.rglob(pattern))
+        return sorted(files)
+
+    def _signature(self, files):
+        signature = []
+        for path in files:
+            try:
+                stat = path.stat()
+                signature.append((str(path), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(signature)
+
+    def reload(self):
+        files = self._files()
+        signature = self._signature(files)
+        if signature == self.signature:
+            return False
+
+        rules = []
+        seen = set()
+        matchers = FieldMatchers()
+        sigma_rules = 0
+
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    documents = [data for document in yaml.load_all(f, Loader=YAML_LOADER)
+                                 for data in _as_list(document or [])]
+            except Exception as e:
+                self.logger.error(f"Error loading rules from {path}: {str(e)}")
+                continue
+
+            for data in documents:
+                try:
+                    # Sigma rules are converted to the native format first
+                    sigma = is_sigma_rule(data)
+                    if sigma:
+                        data = convert_sigma(data, default_id=path.stem)
+                    rule = Rule.from_dict(data, path.name, matchers)
+                except (RuleError, SigmaError) as e:
+                    self.logger.warning(f"{path.name}: {str(e)}")
+                    continue
+                sigma_rules += sigma
+
+                if rule.id in seen:
+                    self.logger.warning(f"{path.name}: duplicate rule id {rule.id}, skipped")
+                    continue
+                seen.add(rule.id)
+                rules.append(rule)
+
+        ruleset = RuleSet(rules, len(files), matchers)
+
+        with self.lock:
+            old_rules = {rule.id: rule for rule in self.ruleset.rules}
+            rule_stats = {}
+            for rule in rules:
+                # Counts carry over when a rule is edited, even if its event IDs change
+                stats = self.rule_stats.get(rule.id, [0, 0, 0, 0])
+                evaluations = self._evaluations(old_rules[rule.id], stats) if rule.id in old_rules else 0
+                stats[0] = evaluations - self._route_total(rule)
+                rule_stats[rule.id] = stats
+            self.rule_stats = rule_stats
+
+            # Evaluation reads self.ruleset once, so replacing it is atomic for it
+            self.ruleset = ruleset
+
+        self.signature = signature
+        self.logger.info(f"Loaded {len(rules)} rules ({sigma_rules} Sigma) from {len(files)} files, "
+                         f"{len(ruleset.index)} channel/event ID pairs, {len(matchers)} shared string tests")
+
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                self.logger.error(f"Error in rule reload listener: {str(e)}")
+        return True
+
+    def _route_total(self, rule):
+        return sum(self.route_events.get((rule.channel, event_id), 0) for event_id in rule.event_ids)
+
+    def _evaluations(self, rule, stats):
+        return stats[0] + self._route_total(rule)
+
+    def add_listener(self, callback):
+        """Registers callback() to run after every reload that changed the rules"""
+        self.listeners.append(callback)
+
+    def keys(self):
+        return set(self.ruleset.index)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._reload_loop, name='rule-engine', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _reload_loop(self):
+        while not self.stop_event.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                self.logger.error(f"Error reloading rules: {str(e)}")
+
+    def evaluate(self, channel, event_id, event_data):
+        """Returns the rules matching the event"""
+        key = (channel, event_id)
+
+        # Counters are updated once per event, not once per rule
+        with self.lock:
+            ruleset = self.ruleset
+            route = ruleset.index.get(key)
+            if route is None:
+                return []
+            self.events += 1
+            self.route_events[key] = self.route_events.get(key, 0) + 1
+            timed = self.events % self.timing_sample == 0
+
+        # Atom ids are only meaningful within the rule set that defined them
+        fields = EventFields(event_data, ruleset.matchers)
+        matches = []
+        timings = []
+        errors = 0
+        clock = time.perf_counter_ns
+
+        # Each field was scanned once by the shared matchers, only rules with
+        # a matched trigger (or without triggers) are evaluated
+        candidates = route.candidates(fields)
+        for rule in candidates:
+            if timed:
+                start = clock()
+            try:
+                matched = rule.predicate(fields)
+            except Exception as e:
+                matched = False
+                errors += 1
+                self.logger.error(f"Error evaluating rule {rule.id}: {str(e)}")
+            if timed:
+                timings.append((rule.id, clock() - start))
+            if matched:
+                matches.append(rule)
+
+        # Skipped rules cost nothing for this event, which keeps the average
+        # a cost per routed event
+        if timed and len(candidates) < len(route):
+            evaluated = {rule.id for rule in candidates}
+            timings.extend((rule.id, 0) for rule in route.rules if rule.id not in evaluated)
+
+        if matches or timings or errors:
+            with self.lock:
+                self.errors += errors
+                rule_stats = self.rule_stats
+                for rule in matches:
+                    stats = rule_stats.get(rule.id)
+                    if stats is not None:
+                        stats[1] += 1
+                for rule_id, elapsed in timings:
+                    stats = rule_stats.get(rule_id)
+                    if stats is not None:
+                        stats[2] += 1
+                        stats[3] += elapsed
+
+        return matches
+
+    def get_rule_stats(self, limit=None, sort_by='time'):
+        """Per-rule counters, the most expensive (or most frequent) rules first"""
+        with self.lock:
+            items = []
+            for rule in self.ruleset.rules:
+                offset, hits, timed, time_ns = self.rule_stats[rule.id]
+                evaluations = offset + self._route_total(rule)
+                average_ns = time_ns / timed if timed else 0.0
+                items.append((rule, evaluations, hits, average_ns, average_ns * evaluations))
+
+        column = {'time': 4, 'hits': 2, 'evaluations': 1}[sort_by]
+        items.sort(key=lambda item: item[column], reverse=True)
+
+        return [
+            {
+                'id': rule.id,
+                'title': rule.title,
+                'evaluations': evaluations,
+                'hits': hits,
+                'total_ms': round(total_ns / 1e6, 3),
+                'avg_us': round(average_ns / 1e3, 2) if average_ns else None
+            }
+            for rule, evaluations, hits, average_ns, total_ns in items[:limit]
+        ]
+
+    def get_stats(self):
+        ruleset = self.ruleset
+        with self.lock:
+            hits = sum(stats[1] for stats in self.rule_stats.values())
+            events = self.events
+            errors = self.errors
+        return {
+            'rules': len(ruleset),
+            'files': ruleset.files,
+            'routes': len(ruleset.index),
+            'shared_tests': len(ruleset.matchers),
+            'events': events,
+            'hits': hits,
+            'errors': errors,
+            'slowest': self.get_rule_stats(limit=3)
+        }
@@ -0,0 +1,98 @@
+import ntpath
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ScanPipeline:
+    """
+    Runs file checks on a dedicated worker pool and returns futures.
+
+    Requests for a path that is already being scanned are coalesced: they
+    share the in-flight future, and on_result(file_path, verdict, contexts)
+    is called once per scan with the contexts of every request it served.
+
+    scan_func(file_path, context) returns the verdict, or a Future of it when
+    part of the check is queued elsewhere; the worker is released meanwhile.
+    """
+
+    def __init__(self, scan_func, on_result=None, workers=2):
+        self.scan_func = scan_func
+        self.on_result = on_result
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+        self.in_flight = {}
+        self.lock = threading.RLock()
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.logger = logging.getLogger('ScanPipeline')
+
+    def submit(self, file_path, context=None):
+        key = ntpath.normcase(file_path)
+
+        with self.lock:
+            entry = self.in_flight.get(key)
+            if entry is not None:
+                self.coalesced += 1
+                entry['contexts'].append(context)
+                return entry['future']
+
+            entry = {'contexts': [context], 'future': Future()}
+            self.in_flight[key] = entry
+            self.submitted += 1
+            self.executor.submit(self._run, key, file_path, context)
+            return entry['future']
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.in_flight),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+    def _run(self, key, file_path, context):
+        try:
+            verdict = self.scan_func(file_path, context)
+        except Exception as e:
+            self.logger.error(f"Error scanning {file_path}: {str(e)}")
+            self._finish(key, file_path, None, failed=True)
+            return
+
+        if isinstance(verdict, Future):
+            verdict.add_done_callback(lambda future: self._finish_future(key, file_path, future))
+        else:
+            self._finish(key, file_path, verdict)
+
+    def _finish_future(self, key, file_path, future):
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f"Error scanning {file_path}: {str(error)}")
+            self._finish(key, file_path, None, failed=True)
+        else:
+            self._finish(key, file_path, future.result())
+
+    def _finish(self, key, file_path, verdict, failed=False):
+        # Requests arriving after this point start a new scan
+        with self.lock:
+            entry = self.in_flight.pop(key, None)
+            self.completed += 1
+            if failed:
+                self.failed += 1
+
+        if entry is None:
+            return
+
+        entry['future'].set_result(verdict)
+
+        if self.on_result is not None:
+            try:
+                self.on_result(file_path, verdict, entry['contexts'])
+            except Exception as e:
+                self.logger.error(f"Error handling scan result for {file_path}: {str(e)}")
@@ -0,0 +1,385 @@
+import re
+import copy
+
+from event_monitor import SYSMON_CHANNEL
+
+# Sigma logsource categories and services -> (channel, event IDs)
+SIGMA_CATEGORIES = {
+    'process_creation': (SYSMON_CHANNEL, (1,)),
+    'network_connection': (SYSMON_CHANNEL, (3,))
+}
+
+SIGMA_SERVICES = {
+    'sysmon': SYSMON_CHANNEL,
+    'security': 'Security',
+    'system': 'System'
+}
+
+# Sigma field names -> event data paths filled by EventMonitor
+COMMON_FIELDS = {
+    'EventID': 'event_id',
+    'Computer': 'computer',
+    'ComputerName': 'computer',
+    'Provider_Name': 'source'
+}
+
+PROCESS_FIELDS = {
+    'Image': 'process.image',
+    'CommandLine': 'process.command_line',
+    'ParentImage': 'process.parent_image',
+    'ParentCommandLine': 'process.parent_command_line',
+    'OriginalFileName': 'process.original_file_name',
+    'CurrentDirectory': 'process.current_directory',
+    'IntegrityLevel': 'process.integrity_level',
+    'Hashes': 'process.hashes',
+    'User': 'process.user',
+    'ProcessId': 'process.process_id',
+    'ProcessGuid': 'process.process_guid',
+    'ParentProcessId': 'process.parent_process_id',
+    'ParentProcessGuid': 'process.parent_process_guid'
+}
+
+NETWORK_FIELDS = {
+    'Image': 'network.image',
+    'User': 'network.user',
+    'Protocol': 'network.protocol',
+    'Initiated': 'network.initiated',
+    'SourceIp': 'network.src_ip',
+    'SourceHostname': 'network.src_hostname',
+    'SourcePort': 'network.src_port',
+    'DestinationIp': 'network.dst_ip',
+    'DestinationHostname': 'network.dst_hostname',
+    'DestinationPort': 'network.dst_port',
+    'ProcessId': 'network.process_id',
+    'ProcessGuid': 'network.process_guid'
+}
+
+LOGON_FIELDS = {
+    'TargetUserName': 'username',
+    'LogonType': 'login_type',
+    'IpAddress': 'source_ip',
+    'WorkstationName': 'workstation',
+    'Status': 'status',
+    'SubStatus': 'sub_status'
+}
+
+SUPPORTED_MODIFIERS = {'contains', 'startswith', 'endswith', 're', 'all'}
+
+SIGMA_LEVELS = {
+    'informational': 'low',
+    'low': 'low',
+    'medium': 'medium',
+    'high': 'high',
+    'critical': 'critical'
+}
+
+_CONDITION_TOKEN = re.compile(r'\s*(\(|\)|1 of\b|all of\b|[^\s()]+)')
+
+
+class SigmaError(ValueError):
+    pass
+
+
+def is_sigma_rule(data):
+    return isinstance(data, dict) and 'detection' in data and 'logsource' in data
+
+
+def _field_map(channel, event_ids):
+    fields = dict(COMMON_FIELDS)
+    if channel == SYSMON_CHANNEL and event_ids == (1,):
+        fields.update(PROCESS_FIELDS)
+    elif channel == SYSMON_CHANNEL and event_ids == (3,):
+        fields.update(NETWORK_FIELDS)
+    elif channel == 'Security':
+        fields.update(LOGON_FIELDS)
+    return fields
+
+
+class _Wildcard(str):
+    """A '*' or '?' wildcard, told apart from an escaped literal '*' or '?'"""
+
+
+def _split_wildcards(value):
+    """
+    Splits a Sigma value into literal parts and '*'/'?' wildcards; \\* and
+    \\? are literal, \\\\ is one backslash and any other backslash is kept
+    as is
+    """
+    parts = []
+    literal = ''
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char == '\\' and index + 1 < len(value) and value[index + 1] in '*?\\':
+            literal += value[index + 1]
+            index += 2
+            continue
+        if char in '*?':
+            parts.append(literal)
+            parts.append(_Wildcard(char))
+            literal = ''
+        else:
+            literal += char
+        index += 1
+    parts.append(literal)
+    return [part for part in parts if part != '']
+
+
+def _wildcard_regex(parts, anchored_start, anchored_end):
+    body = ''.join(
+        ('.*' if part == '*' else '.') if isinstance(part, _Wildcard) else re.escape(part) for part in parts
+    )
+    return ('^' if anchored_start else '') + body + ('$' if anchored_end else '')
+
+
+def _value_test(value, modifier):
+    """
+    Returns (operator, operand, case_sensitive) for one Sigma value. Only
+    |re regexes are case-sensitive, wildcard values compared through a
+    regex are not
+    """
+    if modifier == 're':
+        return 'regex', value, True
+
+    parts = _split_wildcards(value)
+    anchored_start = modifier not in ('contains', 'endswith')
+    anchored_end = modifier not in ('contains', 'startswith')
+
+    # Leading and trailing '*' only widen the match to contains/startswith/endswith
+    if parts and isinstance(parts[0], _Wildcard) and parts[0] == '*':
+        parts = parts[1:]
+        anchored_start = False
+    if parts and isinstance(parts[-1], _Wildcard) and parts[-1] == '*':
+        parts = parts[:-1]
+        anchored_end = False
+
+    if any(isinstance(part, _Wildcard) for part in parts):
+        return 'regex', _wildcard_regex(parts, anchored_start, anchored_end), False
+
+    literal = ''.join(parts)
+    if anchored_start and anchored_end:
+        return 'equals', literal, False
+    if anchored_start:
+        return 'startswith', literal, False
+    if anchored_end:
+        return 'endswith', literal, False
+    return 'contains', literal, False
+
+
+def _convert_field(key, values, fields):
+    name, *modifiers = key.split('|')
+    unsupported = set(modifiers) - SUPPORTED_MODIFIERS
+    if unsupported:
+        raise SigmaError(f"unsupported modifier {'|'.join(sorted(unsupported))} on {name}")
+
+    path = fields.get(name)
+    if path is None:
+        raise SigmaError(f"unsupported field {name}")
+
+    values = values if isinstance(values, list) else [values]
+    if any(value is None for value in values):
+        if len(values) > 1:
+            raise SigmaError(f"null mixed with values for {name}")
+        return {'field': path, 'exists': False}
+
+    match_all = 'all' in modifiers
+    modifier = next((m for m in modifiers if m != 'all'), None)
+
+    # Values with the same operator and case sensitivity share one leaf (any of them matches)
+    tests = {}
+    leaves = []
+    for value in values:
+        operator, operand, case_sensitive = _value_test(str(value), modifier)
+        if match_all:
+            leaves.append(_leaf(path, operator, [operand], case_sensitive))
+        else:
+            tests.setdefault((operator, case_sensitive), []).append(operand)
+
+    if match_all:
+        return leaves[0] if len(leaves) == 1 else {'all': leaves}
+
+    leaves = [_leaf(path, operator, operands, case_sensitive)
+              for (operator, case_sensitive), operands in tests.items()]
+    return leaves[0] if len(leaves) == 1 else {'any': leaves}
+
+
+def _leaf(path, operator, operands, case_sensitive=False):
+    leaf = {'field': path, operator: operands if len(operands) > 1 else operands[0]}
+    # Sigma |re regexes are case-sensitive, every other comparison is not
+    if case_sensitive:
+        leaf['case_sensitive'] = True
+    return leaf
+
+
+def _convert_selection(name, selection, fields):
+    if isinstance(selection, dict):
+        if not selection:
+            raise SigmaError(f"empty selection {name}")
+        tests = [_convert_field(key, values, fields) for key, values in selection.items()]
+        return tests[0] if len(tests) == 1 else {'all': tests}
+
+    if isinstance(selection, list) and selection and all(isinstance(item, dict) for item in selection):
+        alternatives = [_convert_selection(name, item, fields) for item in selection]
+        return alternatives[0] if len(alternatives) == 1 else {'any': alternatives}
+
+    raise SigmaError(f"keyword selection {name} is not supported")
+
+
+class _ConditionParser:
+    """Recursive descent over 'not' > 'and' > 'or', with 'N of' quantifiers"""
+
+    def __init__(self, text, selections):
+        self.tokens = _CONDITION_TOKEN.findall(text)
+        self.position = 0
+        self.selections = selections
+
+    def parse(self):
+        node = self._or()
+        if self.position != len(self.tokens):
+            raise SigmaError(f"unexpected '{self.tokens[self.position]}' in condition")
+        return node
+
+    def _peek(self):
+        return self.tokens[self.position].lower() if self.position < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        if token is None:
+            raise SigmaError("unexpected end of condition")
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._peek() == 'or':
+            self._next()
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else {'any': nodes}
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._peek() == 'and':
+            self._next()
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else {'all': nodes}
+
+    def _not(self):
+        if self._peek() == 'not':
+            self._next()
+            return {'not': self._not()}
+        return self._atom()
+
+    def _atom(self):
+        token = self._next()
+        lowered = token.lower()
+
+        if token == '(':
+            node = self._or()
+            if self._next() != ')':
+                raise SigmaError("unbalanced parentheses in condition")
+            return node
+
+        if lowered in ('1 of', 'all of'):
+            names = self._expand(self._next())
+            nodes = [self._selection(name) for name in names]
+            if len(nodes) == 1:
+                return nodes[0]
+            return {'any' if lowered == '1 of' else 'all': nodes}
+
+        if token == '|':
+            raise SigmaError("aggregations are not supported")
+
+        if token not in self.selections:
+            raise SigmaError(f"unknown selection {token}")
+        return self._selection(token)
+
+    def _selection(self, name):
+        # A selection may be referenced more than once, each use gets its own tree
+        return copy.deepcopy(self.selections[name])
+
+    def _expand(self, pattern):
+        if pattern == 'them':
+            names = [name for name in self.selections if not name.startswith('_')]
+        else:
+            regex = re.compile(_wildcard_regex(_split_wildcards(pattern), True, True))
+            names = [name for name in self.selections if regex.match(name)]
+        if not names:
+            raise SigmaError(f"no selection matches {pattern}")
+        return names
+
+
+def _event_ids(detection):
+    """EventID values used anywhere in the selections"""
+    event_ids = set()
+    stack = [detection]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            for key, value in item.items():
+                if key.split('|')[0] == 'EventID':
+                    for event_id in (value if isinstance(value, list) else [value]):
+                        try:
+                            event_ids.add(int(event_id))
+                        except (TypeError, ValueError):
+                            raise SigmaError(f"invalid EventID {event_id!r}")
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+    return tuple(sorted(event_ids))
+
+
+def convert_sigma(document, default_id=None):
+    """
+    Converts a Sigma rule into a native rule dict. Supported: Windows
+    logsources mapped onto the monitored channels, map and list-of-map
+    selections, the contains/startswith/endswith/re/all modifiers, '*' and
+    '?' wildcards and conditions with and/or/not, parentheses and
+    '1 of'/'all of'. Raises SigmaError for anything else.
+    """
+    rule_id = str(document.get('id') or document.get('title') or default_id)
+    try:
+        return _convert(document, rule_id)
+    except SigmaError as e:
+        raise SigmaError(f"Sigma rule {rule_id}: {str(e)}")
+
+
+def _convert(document, rule_id):
+    logsource = document.get('logsource') or {}
+    product = logsource.get('product', 'windows')
+    if product != 'windows':
+        raise SigmaError(f"unsupported product {product}")
+
+    detection = dict(document['detection'] or {})
+    condition = detection.pop('condition', None)
+    detection.pop('timeframe', None)
+    if isinstance(condition, list):
+        condition = ' or '.join(f"({item})" for item in condition)
+    if not condition:
+        raise SigmaError("no condition")
+
+    category = logsource.get('category')
+    service = logsource.get('service')
+    if category:
+        if category not in SIGMA_CATEGORIES:
+            raise SigmaError(f"unsupported category {category}")
+        channel, event_ids = SIGMA_CATEGORIES[category]
+    elif service in SIGMA_SERVICES:
+        channel = SIGMA_SERVICES[service]
+        event_ids = _event_ids(detection)
+        if not event_ids:
+            raise SigmaError(f"no EventID for service {service}")
+    else:
+        raise SigmaError(f"unsupported logsource {logsource}")
+
+    fields = _field_map(channel, event_ids)
+    selections = {name: _convert_selection(name, selection, fields) for name, selection in detection.items()}
+
+    return {
+        'id': rule_id,
+        'title': document.get('title', rule_id),
+        'severity': SIGMA_LEVELS.get(document.get('level'), 'medium'),
+        'channel': channel,
+        'event_id': list(event_ids),
+        'condition': _ConditionParser(condition, selections).parse()
+    }
@@ -0,0 +1,336 @@
+import os
+import re
+import sys
+import mmap
+import logging
+import binascii
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+HEX_PATTERN = re.compile(r'^(?:[0-9a-fA-F]{2}|\?\?)+$')
+SHA256_PATTERN = re.compile(r'^[0-9a-fA-F]{64}$')
+
+# Signatures are found through aligned 4-byte words of their longest literal
+# run; a run of 7 bytes always contains one such word whatever its offset
+GRAM_SIZE = 4
+MIN_ANCHOR = 2 * GRAM_SIZE - 1
+
+# Words checked against the index with one set operation
+BLOCK_WORDS = 16 * 1024
+
+# Database of the worker processes, set by the pool initializer
+_worker_database = None
+
+
+def parse_signature(body):
+    """
+    Parses a signature body into a list of tokens: bytes for literal runs and
+    None for single-byte wildcards. Hex bodies may use ?? as a wildcard,
+    bodies in double quotes are literal text.
+    """
+    if len(body) >= 2 and body.startswith('"') and body.endswith('"'):
+        return [body[1:-1].encode('utf-8')]
+
+    if not HEX_PATTERN.match(body):
+        raise ValueError(f"Invalid signature body: {body}")
+
+    tokens = []
+    for index in range(0, len(body), 2):
+        pair = body[index:index + 2]
+        if pair == '??':
+            tokens.append(None)
+        elif tokens and tokens[-1] is not None:
+            tokens[-1] += binascii.unhexlify(pair)
+        else:
+            tokens.append(binascii.unhexlify(pair))
+    return tokens
+
+
+def _gram_score(gram):
+    # Prefer words that are rare in executables: varied bytes, no padding
+    return len(set(gram)) - sum(gram.count(byte) for byte in (0x00, 0xFF, 0xCC))
+
+
+class SignatureDatabase:
+    """
+    Compiled form of the byte signatures.
+
+    Every signature with a literal run of at least MIN_ANCHOR bytes is
+    indexed by one 4-byte word of that run per alignment; the scan walks the
+    file as a sequence of aligned words, tests whole blocks of them against
+    the index with a single set operation and verifies only the candidates
+    with the signature's own regex. Shorter signatures go into one combined
+    regex. Picklable, so it can be handed to worker processes.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.sources = []
+        self.anchors = {}
+        self.fallback = []
+        self.fallback_length = 0
+        self._compile()
+
+    def add(self, name, tokens):
+        index = len(self.names)
+        self.names.append(name)
+        self.sources.append(b''.join(b'.' if token is None else re.escape(token) for token in tokens))
+
+        offset = 0
+        anchor, anchor_offset = b'', 0
+        for token in tokens:
+            if token is None:
+                offset += 1
+                continue
+            if len(token) > len(anchor):
+                anchor, anchor_offset = token, offset
+            offset += len(token)
+
+        if len(anchor) < MIN_ANCHOR:
+            self.fallback.append(index)
+            self.fallback_length = max(self.fallback_length, offset)
+            return
+
+        # One word per alignment class is enough: any occurrence of the anchor
+        # contains aligned words at every offset of one class
+        for alignment in range(GRAM_SIZE):
+            offsets = range(alignment, len(anchor) - GRAM_SIZE + 1, GRAM_SIZE)
+            best = max(offsets, key=lambda j: _gram_score(anchor[j:j + GRAM_SIZE]))
+            word = int.from_bytes(anchor[best:best + GRAM_SIZE], sys.byteorder)
+            self.anchors.setdefault(word, []).append((index, anchor_offset + best))
+
+    def _compile(self):
+        self.regexes = [re.compile(source, re.DOTALL) for source in self.sources]
+        self.keys = frozenset(self.anchors)
+        self.fallback_regex = None
+        if self.fallback:
+            self.fallback_regex = re.compile(
+                b'|'.join(b'(?P<s%d>%s)' % (index, self.sources[index]) for index in self.fallback),
+                re.DOTALL
+            )
+
+    def finish(self):
+        self._compile()
+
+    def __getstate__(self):
+        return {
+            'names': self.names,
+            'sources': self.sources,
+            'anchors': self.anchors,
+            'fallback': self.fallback,
+            'fallback_length': self.fallback_length
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def __len__(self):
+        return len(self.names)
+
+    def scan(self, mapped, start, end):
+        """Returns the index of a signature found in mapped[start:end], or None"""
+        size = len(mapped)
+
+        if self.fallback_regex is not None:
+            match = self.fallback_regex.search(mapped, start, min(end + self.fallback_length - 1, size))
+            if match:
+                return int(match.lastgroup[1:])
+
+        if not self.keys:
+            return None
+
+        keys = self.keys
+        anchors = self.anchors
+        regexes = self.regexes
+        first_word = (start + GRAM_SIZE - 1) // GRAM_SIZE
+        last_word = min((end + GRAM_SIZE - 1) // GRAM_SIZE, size // GRAM_SIZE)
+
+        # The mapping is viewed as machine words in place, nothing is copied
+        with memoryview(mapped) as view, view[:size // GRAM_SIZE * GRAM_SIZE].cast('I') as words:
+            for block_start in range(first_word, last_word, BLOCK_WORDS):
+                with words[block_start:min(block_start + BLOCK_WORDS, last_word)] as block:
+                    if keys.isdisjoint(block):
+                        continue
+
+                    for index, word in enumerate(block):
+                        if word not in keys:
+                            continue
+                        position = (block_start + index) * GRAM_SIZE
+                        for signature, offset in anchors[word]:
+                            if position >= offset and regexes[signature].match(mapped, position - offset):
+                                return signature
+
+        return None
+
+
+def _init_worker(database):
+    global _worker_database
+    _worker_database = database
+
+
+def _scan_chunk(path, start, end):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _worker_database.scan(mapped, start, end)
+
+
+class SignatureScanner:
+    """
+    Local signature database loaded from a directory.
+
+    *.sig files hold 'Name:body' lines with hex bodies (?? matches any byte)
+    or "quoted" byte strings. *.hsb files hold SHA-256 blocklists, either as
+    'hash' / 'hash:name' lines or in the ClamAV 'hash:size:name' format.
+    Files are scanned through mmap; files above parallel_threshold are split
+    into chunks scanned in a process pool.
+    """
+
+    def __init__(self, path, workers=2, parallel_threshold=32 * 1024 * 1024, chunk_size=8 * 1024 * 1024):
+        self.path = Path(path)
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        # Chunks are cut on word boundaries
+        self.chunk_size = chunk_size // GRAM_SIZE * GRAM_SIZE
+        self.logger = logging.getLogger('SignatureScanner')
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_database = None
+
+        self.database = SignatureDatabase()
+        self.hashes = {}
+
+        self.files_scanned = 0
+        self.bytes_scanned = 0
+        self.detections = 0
+
+        self.load()
+
+    def load(self):
+        database = SignatureDatabase()
+        hashes = {}
+
+        for sig_file in sorted(self.path.glob('*.sig')):
+            for line_number, line in enumerate(self._read_lines(sig_file), 1):
+                name, _, body = line.partition(':')
+                try:
+                    database.add(name.strip(), parse_signature(body.strip()))
+                except ValueError as e:
+                    self.logger.warning(f"{sig_file.name}:{line_number}: {str(e)}")
+
+        for hash_file in sorted(self.path.glob('*.hsb')):
+            for line in self._read_lines(hash_file):
+                parts = line.split(':')
+                if not SHA256_PATTERN.match(parts[0]):
+                    continue
+                hashes[parts[0].lower()] = parts[-1] if len(parts) > 1 else hash_file.stem
+
+        database.finish()
+
+        # Swap everything at once so concurrent scans see a consistent database;
+        # worker processes received the old one and are replaced
+        with self.lock:
+            self.database = database
+            self.hashes = hashes
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+        self.logger.info(f"Loaded {len(database)} signatures and {len(hashes)} blocklisted hashes from {self.path}")
+
+    def _read_lines(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        yield line
+        except Exception as e:
+            self.logger.error(f"Error reading {path}: {str(e)}")
+
+    def __len__(self):
+        return len(self.database) + len(self.hashes)
+
+    def check_hash(self, file_hash):
+        if not file_hash:
+            return None
+        return self.hashes.get(file_hash.lower())
+
+    def scan_file(self, file_path):
+        """Returns the name of a signature found in the file, or None"""
+        with self.lock:
+            database = self.database
+
+        if not len(database):
+            return None
+
+        size = os.path.getsize(file_path)
+        if size == 0:
+            return None
+
+        if size < self.parallel_threshold or self.workers < 2:
+            with open(file_path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    signature = database.scan(mapped, 0, size)
+        else:
+            database, signature = self._scan_parallel(file_path, size)
+
+        with self.lock:
+            self.files_scanned += 1
+            self.bytes_scanned += size
+
+        return database.names[signature] if signature is not None else None
+
+    def _scan_parallel(self, file_path, size):
+        # The pool is bound to the database it was started with
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                    initargs=(self.database,))
+                self.executor_database = self.database
+            executor, database = self.executor, self.executor_database
+
+        futures = [
+            executor.submit(_scan_chunk, file_path, start, min(start + self.chunk_size, size))
+            for start in range(0, size, self.chunk_size)
+        ]
+
+        for future in futures:
+            signature = future.result()
+            if signature is not None:
+                for pending in futures:
+                    pending.cancel()
+                return database, signature
+
+        return database, None
+
+    def scan(self, file_path, file_hash=None):
+        """Returns the name of the matching hash or signature, '' if nothing matched"""
+        name = self.check_hash(file_hash)
+        if name is None:
+            name = self.scan_file(file_path)
+
+        if name is None:
+            return ''
+
+        with self.lock:
+            self.detections += 1
+        return name
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'signatures': len(self.database),
+                'hashes': len(self.hashes),
+                'files_scanned': self.files_scanned,
+                'bytes_scanned': self.bytes_scanned,
+                'detections': self.detections
+            }
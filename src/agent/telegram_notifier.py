@@ -9,12 +9,45 @@ import datetime
 import json
 import tempfile
 
+# Report sections of the daily top summaries
+TOP_SECTIONS = {
+    'images': 'Топ процессов',
+    'destinations': 'Топ адресов назначения',
+    'parent_child': 'Топ запусков (родитель → потомок)'
+}
+
+# Short names of the top summaries in /stats
+TOP_LABELS = {
+    'images': 'процессы',
+    'destinations': 'адреса',
+    'parent_child': 'запуски'
+}
+
+
+def format_top_count(count, error):
+    """Sketch counts with a possible overestimation are shown as approximate"""
+    return f"≈{count}" if error else str(count)
+
+
+def escape_markdown(text):
+    """Escapes the characters that open Markdown entities in text outside of code spans"""
+    text = str(text)
+    for char in ('_', '*', '`', '['):
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+def markdown_code(text):
+    """Text for a `code` span, which cannot contain a backtick even escaped"""
+    return str(text).replace('`', "'")
+
 class TelegramNotifier:
     def __init__(self, config, event_handler=None):
         self.config = config
         self.token = config.get('telegram_token', '')
         self.chat_id = config.get('chat_id', '')
         self.event_handler = event_handler
+        self.event_monitor = None
         self.bot = None
         self.app = None
         self.message_queue = []
@@ -127,6 +160,8 @@ class TelegramNotifier:
         # Register command handlers
         self.app.add_handler(CommandHandler("status", self._status_command))
         self.app.add_handler(CommandHandler("report", self._report_command))
+        self.app.add_handler(CommandHandler("stats", self._stats_command))
+        self.app.add_handler(CommandHandler("proctree", self._proctree_command))
         self.app.add_handler(CommandHandler("help", self._help_command))
         
         # Start the Bot
@@ -149,7 +184,7 @@ class TelegramNotifier:
         status = self.event_handler.get_system_status()
         
         message = f"📊 *Статус системы*\n\n"
-        message += f"🖥️ Хост: `{status['hostname']}`\n"
+        message += f"🖥️ Хост: `{markdown_code(status['hostname'])}`\n"
         message += f"⏱️ Аптайм: `{status['uptime']}` (с {status['uptime_since']})\n"
         message += f"🕒 Текущее время: `{status['current_time']}`\n\n"
         
@@ -159,6 +194,7 @@ class TelegramNotifier:
                 event_type = {
                     'startup': '🖥️ Запуск',
                     'login': '👤 Вход',
+                    'failed_login': '🚫 Подбор пароля',
                     'privilege': '🔑 Привилегии',
                     'task': '⏰ Задача',
                     'service': '🔧 Служба',
@@ -169,9 +205,11 @@ class TelegramNotifier:
                 detail_str = ""
                 
                 if event['type'] == 'login' and 'username' in details:
-                    detail_str = f" ({details['username']})"
+                    detail_str = f" ({escape_markdown(details['username'])}{', необычный' if details.get('anomalous') else ''})"
+                elif event['type'] == 'failed_login' and 'key' in details:
+                    detail_str = f" ({escape_markdown(details['key'])})"
                 elif event['type'] == 'suspicious_process' and 'image' in details:
-                    detail_str = f" ({details['image']})"
+                    detail_str = f" ({escape_markdown(details['image'])})"
                 
                 message += f"• {event['time']} - {event_type}{detail_str}\n"
         else:
@@ -211,6 +249,152 @@ class TelegramNotifier:
             report_text = self._generate_markdown_report(report)
             await update.message.reply_text(report_text, parse_mode='Markdown')
     
+    async def _stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the /stats command."""
+        if not self.event_monitor:
+            await update.message.reply_text("Статистика недоступна - мониторинг событий не инициализирован")
+            return
+        
+        stats = self.event_monitor.get_stats()
+        latency = stats['latency']
+        
+        message = f"📈 *Статистика агента*\n\n"
+        message += f"Режим чтения: `{stats['mode']}`\n"
+        message += f"Задержка доставки: p50 `{latency['p50_ms']}` мс, p99 `{latency['p99_ms']}` мс\n"
+        
+        messages = stats['messages']
+        message += f"Сформировано описаний: {messages['renders']}, "
+        message += f"попаданий в кэш шаблонов: {messages['cache_hit_rate']}\n"
+        
+        queue_stats = stats['queue']
+        dropped = sum(queue_stats['dropped'].values())
+        message += f"Очередь обработки: {queue_stats['depth']}/{queue_stats['max_size']}, "
+        message += f"ожидание p99 `{queue_stats['wait_time']['p99_ms']}` мс, отброшено {dropped}\n"
+        
+        if self.event_handler:
+            handler_stats = self.event_handler.get_stats()
+            alerts = handler_stats['alerts']
+            message += f"Уведомления: отправлено {alerts['sent']}, подавлено повторов {alerts['suppressed']}\n"
+            
+            failed_logons = handler_stats['failed_logons']
+            message += f"Неудачные входы: {failed_logons['failures']}, атак {failed_logons['bursts']}, "
+            message += f"отслеживается пользователей {failed_logons['users']}, адресов {failed_logons['ips']}\n"
+            
+            login_baselines = handler_stats['login_baselines']
+            message += f"Профили входов: пользователей {login_baselines['users']}, "
+            message += f"оценено входов {login_baselines['scored']}, необычных {login_baselines['anomalous']}\n"
+            
+            heavy_hitters = handler_stats['heavy_hitters']
+            message += f"Топ за {heavy_hitters['day'] or '-'}: "
+            message += ", ".join(
+                f"{label} {heavy_hitters[name]['events']} событий / {heavy_hitters[name]['tracked']} ключей"
+                for name, label in TOP_LABELS.items()
+            ) + "\n"
+            
+            scanner = handler_stats['scanner']
+            message += f"Проверка файлов: в работе {scanner['in_flight']}, "
+            message += f"выполнено {scanner['completed']}, объединено {scanner['coalesced']}\n"
+            
+            hash_cache = handler_stats['hash_cache']
+            message += f"Кэш хэшей: {hash_cache['entries']} файлов, попаданий {hash_cache['hit_rate']}, "
+            message += f"хэшировано {hash_cache['bytes_hashed_per_min'] // (1024 * 1024)} МБ/мин\n"
+            
+            signatures = handler_stats['signatures']
+            if signatures:
+                message += f"Локальная база: {signatures['signatures']} сигнатур, {signatures['hashes']} хэшей, "
+                message += f"проверено {signatures['files_scanned']} файлов, обнаружено {signatures['detections']}\n"
+            
+            reputation = handler_stats['reputation']
+            if reputation:
+                message += f"Списки IP: {reputation['lists']}, записей {reputation['entries']}\n"
+            
+            process_tree = handler_stats['process_tree']
+            message += f"Дерево процессов: {process_tree['tracked']} процессов, вытеснено {process_tree['evicted']}\n"
+            
+            rules = handler_stats['rules']
+            if rules:
+                message += f"Правила: {rules['rules']}, проверено событий {rules['events']}, срабатываний {rules['hits']}\n"
+                for rule in rules['slowest']:
+                    if rule['avg_us'] is not None:
+                        message += f"  `{markdown_code(rule['id'])}`: {rule['avg_us']} мкс/событие, срабатываний {rule['hits']}\n"
+
+            correlation = handler_stats['correlation']
+            if correlation:
+                message += f"Корреляция: {correlation['sequences']} цепочек, незавершенных {correlation['runs']}, "
+                message += f"инцидентов {correlation['incidents']}, опоздавших событий {correlation['late']}\n"
+
+            clamav = handler_stats['clamav']
+            if clamav:
+                state = "доступен" if clamav['available'] else "недоступен"
+                message += f"ClamAV: {state}, база `{markdown_code(clamav['db_version'])}`, проверено {clamav['scans']} "
+                message += f"в {clamav['batches']} пакетах, из кэша {clamav['cache_hits']}\n"
+            
+            virustotal = handler_stats['virustotal']
+            if virustotal:
+                message += f"VirusTotal: в очереди {virustotal['pending']}, запросов {virustotal['requests']}, "
+                message += f"из кэша {virustotal['cache_hits']}, превышений лимита {virustotal['rate_limited']}, "
+                message += f"пропущено при переполнении очереди {virustotal['dropped']}\n"
+        
+        message += "\n"
+        
+        if stats['channels']:
+            message += "*Журналы:*\n"
+            for channel, channel_stats in stats['channels'].items():
+                message += f"• `{markdown_code(channel)}`: {channel_stats['events_per_sec']} соб/с, "
+                message += f"всего {channel_stats['events_total']}, "
+                message += f"отставание {channel_stats['lag_seconds']} с, "
+                message += f"ошибок {channel_stats['errors']}\n"
+        
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    async def _proctree_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the /proctree command."""
+        if not self.event_handler:
+            await update.message.reply_text("Дерево процессов недоступно - обработчик событий не инициализирован")
+            return
+        
+        if not context.args:
+            await update.message.reply_text("Использование: /proctree <PID или имя процесса>")
+            return
+        
+        query = ' '.join(context.args)
+        results = self.event_handler.get_process_tree(query)
+        if not results:
+            await update.message.reply_text(f"Процесс {query} не найден в дереве процессов")
+            return
+        
+        def describe(process):
+            name = process['image'].rsplit('\\', 1)[-1] or '?'
+            state = f", завершен {process['exited']}" if process['exited'] else ""
+            return f"{name} (PID {process['pid']}{state})"
+        
+        # Paths contain underscores and backslashes, so the reply is plain text
+        message = "🌳 Дерево процессов\n"
+        for result in results:
+            process = result['process']
+            message += "\n"
+            for depth, ancestor in enumerate(result['ancestors']):
+                message += f"{'  ' * depth}└ {describe(ancestor)}\n"
+            depth = len(result['ancestors'])
+            message += f"{'  ' * depth}└ ▶ {describe(process)}\n"
+            for child in result['children']:
+                message += f"{'  ' * (depth + 1)}└ {describe(child)}\n"
+            message += f"Путь: {process['image']}\n"
+            if process['command_line']:
+                message += f"Командная строка: {process['command_line'][:300]}\n"
+            if process['user']:
+                message += f"Пользователь: {process['user']}\n"
+            if process['started']:
+                message += f"Запущен: {process['started']}\n"
+        
+        await update.message.reply_text(message[:4000])
+    
+    @staticmethod
+    def _pdf_remaining(pdf, total, listed):
+        # Reports of past days list only the first records of each category
+        if total > len(listed):
+            pdf.cell(0, 8, f"...и еще {total - len(listed)}", 0, 1)
+    
     def _generate_markdown_report(self, report):
         """Generate a markdown report from the event data."""
         date_str = report['date']
@@ -221,6 +405,7 @@ class TelegramNotifier:
         message += "*Сводка:*\n"
         message += f"🖥️ Запусков системы: {report['startup_count']}\n"
         message += f"👤 Входов в систему: {report['login_count']}\n"
+        message += f"🚫 Атак подбора пароля: {report.get('failed_login_count', 0)}\n"
         message += f"🔑 Повышений привилегий: {report['privilege_count']}\n"
         message += f"⏰ Изменений задач: {report['task_count']}\n"
         message += f"🔧 Изменений служб: {report['service_count']}\n"
@@ -239,11 +424,24 @@ class TelegramNotifier:
                 
                 message += f"• {time} - `{image}` (Пользователь: {user})\n"
             
-            if len(events['suspicious_process']) > 5:
-                message += f"  _...и еще {len(events['suspicious_process']) - 5} процессов_\n"
+            total = max(report.get('suspicious_process_count', 0), len(events['suspicious_process']))
+            if total > 5:
+                message += f"  _...и еще {total - 5} процессов_\n"
             
             message += "\n"
         
+        # Then failed logon offenders
+        top = report.get('failed_login_top') or {}
+        if top.get('user') or top.get('ip'):
+            message += "*🚫 Неудачные входы:*\n"
+            if top.get('failures') is not None:
+                message += f"Всего: {top['failures']}\n"
+            for username, count in top.get('user', [])[:5]:
+                message += f"• `{username}` - {count}\n"
+            for address, count in top.get('ip', [])[:5]:
+                message += f"• с адреса `{address}` - {count}\n"
+            message += "\n"
+        
         # Then services and tasks
         if events.get('service'):
             message += "*🔧 Изменения служб:*\n"
@@ -253,8 +451,9 @@ class TelegramNotifier:
                 
                 message += f"• {time} - `{name}`\n"
             
-            if len(events['service']) > 5:
-                message += f"  _...и еще {len(events['service']) - 5} служб_\n"
+            total = max(report.get('service_count', 0), len(events['service']))
+            if total > 5:
+                message += f"  _...и еще {total - 5} служб_\n"
             
             message += "\n"
         
@@ -266,23 +465,42 @@ class TelegramNotifier:
                 
                 message += f"• {time} - `{name}`\n"
             
-            if len(events['task']) > 5:
-                message += f"  _...и еще {len(events['task']) - 5} задач_\n"
+            total = max(report.get('task_count', 0), len(events['task']))
+            if total > 5:
+                message += f"  _...и еще {total - 5} задач_\n"
             
             message += "\n"
         
         # Then logins
         if events.get('login'):
             message += "*👤 Входы в систему:*\n"
-            for login in events['login'][:5]:  # Limit to 5
+            # Unusual logins first
+            logins = sorted(events['login'], key=lambda login: not login.get('anomalous'))
+            for login in logins[:5]:  # Limit to 5
                 username = login.get('username', 'Неизвестно')
                 login_type = login.get('login_type', 'Неизвестно')
                 time = login.get('time', 'Неизвестно')
                 
-                message += f"• {time} - `{username}` ({login_type})\n"
+                message += f"• {time} - `{username}` ({login_type})"
+                if login.get('anomalous'):
+                    message += f" ⚠️ оценка {login['score']:.1f}"
+                message += "\n"
             
-            if len(events['login']) > 5:
-                message += f"  _...и еще {len(events['login']) - 5} входов_\n"
+            total = max(report.get('login_count', 0), len(events['login']))
+            if total > 5:
+                message += f"  _...и еще {total - 5} входов_\n"
+            
+            message += "\n"
+        
+        # Finally the daily top summaries
+        for name, title in TOP_SECTIONS.items():
+            summary = (report.get('top') or {}).get(name)
+            if not summary or not summary['top']:
+                continue
+            message += f"*{title}* (всего {summary['total']}):\n"
+            for key, count, error in summary['top']:
+                message += f"• `{markdown_code(key)}` - {format_top_count(count, error)}\n"
+            message += "\n"
         
         return message
     
@@ -306,6 +524,7 @@ class TelegramNotifier:
         pdf.set_font('Arial', '', 12)
         pdf.cell(0, 8, f"Запусков системы: {report['startup_count']}", 0, 1)
         pdf.cell(0, 8, f"Входов в систему: {report['login_count']}", 0, 1)
+        pdf.cell(0, 8, f"Атак подбора пароля: {report.get('failed_login_count', 0)}", 0, 1)
         pdf.cell(0, 8, f"Повышений привилегий: {report['privilege_count']}", 0, 1)
         pdf.cell(0, 8, f"Изменений задач: {report['task_count']}", 0, 1)
         pdf.cell(0, 8, f"Изменений служб: {report['service_count']}", 0, 1)
@@ -315,6 +534,34 @@ class TelegramNotifier:
         # Add details
         events = report['events']
         
+        # Failed logon offenders section
+        top = report.get('failed_login_top') or {}
+        if top.get('user') or top.get('ip'):
+            pdf.set_font('Arial', 'B', 14)
+            pdf.cell(0, 10, "Неудачные входы:", 0, 1)
+            pdf.set_font('Arial', '', 12)
+            
+            if top.get('failures') is not None:
+                pdf.cell(0, 8, f"Всего: {top['failures']}", 0, 1)
+            for username, count in top.get('user', []):
+                pdf.cell(0, 8, f"• {username} - {count}", 0, 1)
+            for address, count in top.get('ip', []):
+                pdf.cell(0, 8, f"• с адреса {address} - {count}", 0, 1)
+            
+            pdf.ln(5)
+        
+        # Daily top summaries
+        for name, title in TOP_SECTIONS.items():
+            summary = (report.get('top') or {}).get(name)
+            if not summary or not summary['top']:
+                continue
+            pdf.set_font('Arial', 'B', 14)
+            pdf.cell(0, 10, f"{title} (всего {summary['total']}):", 0, 1)
+            pdf.set_font('Arial', '', 12)
+            for key, count, error in summary['top']:
+                pdf.cell(0, 8, f"• {key} - {format_top_count(count, error)}", 0, 1)
+            pdf.ln(5)
+        
         # Suspicious processes section
         if events.get('suspicious_process'):
             pdf.set_font('Arial', 'B', 14)
@@ -332,6 +579,7 @@ class TelegramNotifier:
                 pdf.cell(0, 8, f"  Причина: {reason}", 0, 1)
                 pdf.ln(5)
             
+            self._pdf_remaining(pdf, report.get('suspicious_process_count', 0), events['suspicious_process'])
             pdf.ln(5)
         
         # Services section
@@ -349,6 +597,7 @@ class TelegramNotifier:
                 pdf.cell(0, 8, f"  Путь: {path}", 0, 1)
                 pdf.ln(5)
             
+            self._pdf_remaining(pdf, report.get('service_count', 0), events['service'])
             pdf.ln(5)
         
         # Tasks section
@@ -364,6 +613,7 @@ class TelegramNotifier:
                 pdf.cell(0, 8, f"• {time} - {name}", 0, 1)
                 pdf.ln(5)
             
+            self._pdf_remaining(pdf, report.get('task_count', 0), events['task'])
             pdf.ln(5)
         
         # Logins section
@@ -377,8 +627,12 @@ class TelegramNotifier:
                 login_type = login.get('login_type', 'Неизвестно')
                 time = login.get('time', 'Неизвестно')
                 
-                pdf.cell(0, 8, f"• {time} - {username} ({login_type})", 0, 1)
+                line = f"• {time} - {username} ({login_type})"
+                if login.get('anomalous'):
+                    line += f" - необычный вход, оценка {login['score']:.1f}"
+                pdf.cell(0, 8, line, 0, 1)
             
+            self._pdf_remaining(pdf, report.get('login_count', 0), events['login'])
             pdf.ln(5)
         
         # Generate the PDF file
@@ -393,6 +647,8 @@ class TelegramNotifier:
 
 /status - Показать текущий статус системы (аптайм, последние события)
 /report [YYYY-MM-DD] - Получить отчет за день (по умолчанию - сегодня)
+/stats - Показать метрики чтения журналов событий
+/proctree <PID|имя> - Показать цепочку родительских и дочерних процессов
 /help - Показать эту справку
 
 Бот также отправляет уведомления о важных событиях в системе автоматически."""
@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import queue
+import logging
+import itertools
+import datetime
+import threading
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Lookups with a lower value are sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+# Requests per minute and burst size of the VirusTotal API tiers
+API_TIERS = {
+    'public': (4, 4),
+    'premium': (1000, 50)
+}
+
+DEFAULT_TTL = {
+    'clean': 7 * 86400,
+    'malicious': 30 * 86400,
+    'unknown': 86400
+}
+
+# Pause after a 429 without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 60
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP-date"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (moment - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most burst tokens"""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Takes a token and returns 0, or returns the seconds until one is available"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Empties the bucket and holds it for seconds, used when the server reports the quota as exceeded"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0.0
+            self.updated = now + seconds
+            self.paused_until = now + seconds
+
+
+class VerdictCache:
+    """
+    File verdicts keyed by SHA-256 with a separate TTL per status.
+    Bounded by LRU eviction and persisted as a JSON file replaced atomically.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=50000, save_interval=60.0):
+        self.path = Path(path)
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.logger = logging.getLogger('VerdictCache')
+        self.dirty = False
+        self.last_save = time.time()
+        self.entries = self._load()
+
+    def _load(self):
+        entries = OrderedDict()
+        if not self.path.exists():
+            return entries
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error loading verdict cache from {self.path}: {str(e)}")
+            return entries
+
+        now = time.time()
+        for file_hash, (verdict, expires_at) in sorted(data.items(), key=lambda item: item[1][1]):
+            if expires_at > now:
+                entries[file_hash] = (verdict, expires_at)
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        return entries
+
+    def get(self, file_hash):
+        with self.lock:
+            cached = self.entries.get(file_hash)
+            if cached is None:
+                return None
+
+            if cached[1] <= time.time():
+                del self.entries[file_hash]
+                self.dirty = True
+                return None
+
+            self.entries.move_to_end(file_hash)
+            return cached[0]
+
+    def set(self, file_hash, verdict):
+        with self.lock:
+            self.entries[file_hash] = (verdict, time.time() + self.ttl[verdict['status']])
+            self.entries.move_to_end(file_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            save_due = time.time() - self.last_save >= self.save_interval
+
+        if save_due:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {file_hash: list(entry) for file_hash, entry in self.entries.items()}
+            self.dirty = False
+            self.last_save = time.time()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+
+        with self.save_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self.logger.error(f"Error saving verdict cache to {self.path}: {str(e)}")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+class VirusTotalClient:
+    """
+    VirusTotal file lookups through a keep-alive session.
+
+    Lookups are queued by priority and sent by worker threads as the token
+    bucket allows. Concurrent lookups of the same hash share one request and
+    answers are kept in a VerdictCache. At most max_pending hashes wait for
+    an answer; beyond that new normal-priority lookups are answered as
+    unknown without caching. Verdicts are dicts with 'status'
+    ('clean', 'malicious' or 'unknown') and the analysis counters.
+    """
+
+    def __init__(self, api_key, base_url='https://www.virustotal.com/api/v3', tier='public',
+                 requests_per_minute=None, burst=None, timeout=(5, 15), pool_size=4, workers=1,
+                 cache_file='./data/vt_cache.json', ttl=None, max_pending=10000):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = tuple(timeout)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.logger = logging.getLogger('VirusTotalClient')
+
+        tier_rate, tier_burst = API_TIERS.get(tier, API_TIERS['public'])
+        self.bucket = TokenBucket(requests_per_minute or tier_rate, burst or tier_burst)
+        self.cache = VerdictCache(cache_file, ttl=ttl)
+
+        self.session = requests.Session()
+        self.session.headers.update({'x-apikey': api_key, 'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount(self.base_url, adapter)
+
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.pending = {}
+        # hash -> priority of its live queue entry, lower-priority copies left in the queue are skipped
+        self.priorities = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.requests_sent = 0
+        self.cache_hits = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def start(self):
+        self.stop_event.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'virustotal-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        for _ in self.threads:
+            self.queue.put((-1, next(self.sequence), None))
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+        # Lookups still waiting for a token are answered as unknown without caching
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.priorities = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_result({'status': 'unknown'})
+
+        self.cache.save()
+        self.session.close()
+
+    def lookup(self, file_hash, priority=PRIORITY_NORMAL):
+        """Returns a Future resolved with the verdict for file_hash"""
+        file_hash = file_hash.lower()
+
+        verdict = self.cache.get(file_hash)
+        if verdict is not None:
+            with self.lock:
+                self.cache_hits += 1
+            future = Future()
+            future.set_result(verdict)
+            return future
+
+        with self.lock:
+            future = self.pending.get(file_hash)
+            if future is None:
+                if len(self.pending) >= self.max_pending and priority >= PRIORITY_NORMAL:
+                    # Too many lookups wait for a token, new ones are not queued
+                    self.dropped += 1
+                    future = Future()
+                    future.set_result({'status': 'unknown'})
+                    return future
+                future = Future()
+                self.pending[file_hash] = future
+            elif priority >= self.priorities[file_hash]:
+                return future
+            # A repeated lookup with a higher priority is queued again, the
+            # worker skips the lower-priority copy
+            self.priorities[file_hash] = priority
+            self.queue.put((priority, next(self.sequence), file_hash))
+
+        return future
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'queued': self.queue.qsize(),
+                'pending': len(self.pending),
+                'requests': self.requests_sent,
+                'cache_hits': self.cache_hits,
+                'cache_size': len(self.cache),
+                'rate_limited': self.rate_limited,
+                'errors': self.errors,
+                'dropped': self.dropped
+            }
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            priority, _, file_hash = self.queue.get()
+            if file_hash is None:
+                break
+
+            with self.lock:
+                future = self.pending.get(file_hash)
+                current = future is not None and self.priorities.get(file_hash) == priority
+            if not current or future.done():
+                continue
+
+            # Wait for a token; the lookup goes back to the queue so a more
+            # urgent one that arrived meanwhile is sent first
+            wait = self.bucket.try_acquire()
+            if wait:
+                self.queue.put((priority, next(self.sequence), file_hash))
+                self.stop_event.wait(min(wait, 1.0))
+                continue
+
+            self._send(file_hash, priority, future)
+
+    def _send(self, file_hash, priority, future):
+        try:
+            response = self.session.get(f"{self.base_url}/files/{file_hash}", timeout=self.timeout)
+            with self.lock:
+                self.requests_sent += 1
+
+            if response.status_code == 429:
+                # Quota exceeded, retry after the server's delay or a full minute
+                with self.lock:
+                    self.rate_limited += 1
+                self.bucket.pause(retry_after_seconds(response.headers.get('Retry-After')))
+                self.queue.put((priority, next(self.sequence), file_hash))
+                return
+
+            if response.status_code == 404:
+                verdict = {'status': 'unknown'}
+            else:
+                response.raise_for_status()
+                verdict = self._parse_verdict(response.json())
+
+            self.cache.set(file_hash, verdict)
+            self._resolve(file_hash, future, result=verdict)
+        except Exception as e:
+            self.logger.error(f"VirusTotal API error for {file_hash}: {str(e)}")
+            with self.lock:
+                self.errors += 1
+            self._resolve(file_hash, future, error=e)
+
+    def _resolve(self, file_hash, future, result=None, error=None):
+        with self.lock:
+            if self.pending.get(file_hash) is future:
+                del self.pending[file_hash]
+                self.priorities.pop(file_hash, None)
+
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _parse_verdict(result):
+        stats = result.get('data', {}).get('attributes', {}).get('last_analysis_stats', {})
+        malicious = stats.get('malicious', 0)
+        suspicious = stats.get('suspicious', 0)
+
+        return {
+            'status': 'malicious' if malicious > 0 or suspicious > 0 else 'clean',
+            'malicious': malicious,
+            'suspicious': suspicious,
+            'total': sum(stats.values())
+        }
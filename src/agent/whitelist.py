@@ -0,0 +1,100 @@
+import re
+import ntpath
+import logging
+import fnmatch
+
+GLOB_CHARS = set('*?[')
+
+# Backreferences and conditional groups refer to group numbers, which change when patterns are combined
+GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+class WhitelistIndex:
+    """
+    Case-insensitive whitelist compiled at load time.
+
+    Plain entries are indexed by full value and (for paths) by basename in
+    hash sets. Entries with glob characters (*, ?, [) are compiled into one
+    combined regex matched against the full value and the basename, like
+    plain entries, and regular expressions written as 're:<pattern>' into
+    another one searched in the full value, so a lookup costs two set probes
+    plus a few regex searches however large the list is. Regular expressions
+    with backreferences are compiled on their own, as combining renumbers
+    their groups. Glob entries are indexed as plain entries too, so a name
+    that merely contains such characters still matches itself. Invalid
+    regular expressions are logged and skipped.
+    """
+
+    def __init__(self, entries=None, match_basename=True):
+        self.match_basename = match_basename
+        self.exact = set()
+        self.basenames = set()
+        self.globs = None
+        self.patterns = []
+        self.size = 0
+        self.logger = logging.getLogger('WhitelistIndex')
+
+        globs = []
+        patterns = []
+        for entry in entries or []:
+            if not entry:
+                continue
+
+            if entry.startswith('re:'):
+                pattern = entry[3:]
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE)
+                except re.error as e:
+                    self.logger.error(f"Invalid whitelist pattern {entry!r} skipped: {str(e)}")
+                    continue
+                if GROUP_REFERENCE.search(pattern):
+                    self.patterns.append(compiled)
+                else:
+                    patterns.append(pattern)
+            else:
+                normalized = entry.lower()
+                self.exact.add(normalized)
+                glob = bool(GLOB_CHARS.intersection(entry))
+                # A wildcard directory must not be bypassed by its literal file name
+                if match_basename and not (glob and GLOB_CHARS.intersection(ntpath.dirname(entry))):
+                    self.basenames.add(ntpath.basename(normalized))
+                if glob:
+                    globs.append(fnmatch.translate(entry))
+
+            self.size += 1
+
+        if globs:
+            self.globs = re.compile(r'\A(?:' + '|'.join(globs) + ')', re.IGNORECASE)
+
+        if patterns:
+            try:
+                self.patterns.append(re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE))
+            except re.error:
+                # Valid alone but not together (group names, inline flags): searched one by one
+                self.patterns.extend(re.compile(pattern, re.IGNORECASE) for pattern in patterns)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, value):
+        return self.matches(value)
+
+    def matches(self, value):
+        if not value:
+            return False
+
+        normalized = value.lower()
+
+        if normalized in self.exact:
+            return True
+
+        if self.match_basename and ntpath.basename(normalized) in self.basenames:
+            return True
+
+        if self.globs is not None:
+            if self.globs.match(value) is not None:
+                return True
+            if self.match_basename and self.globs.match(ntpath.basename(value)) is not None:
+                return True
+
+        return any(pattern.search(value) is not None for pattern in self.patterns)